@@ -0,0 +1,67 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compares the original per-character fantacrypt decryptor with the
+bytes.fromhex one, with and without its cache, after checking that both
+give the same output.
+
+    python -m benchmarks.bench_fantacrypt [--rounds N]
+"""
+
+import argparse
+import random
+import time
+
+from server.fantacrypt import fanta_decrypt, fanta_decrypt_slow, fanta_encrypt
+
+# the commands AO1 clients send encrypted
+HEADERS = [fanta_encrypt(cmd) for cmd in ('HI', 'ID', 'askchar2', 'askchaa', 'RC', 'RM', 'RD', 'CC', 'MS', 'CT',
+                                           'MC', 'HP', 'RT', 'CH', 'AN', 'AE', 'AM', 'PE', 'DE', 'EE', 'ZZ')]
+
+
+def check():
+    samples = HEADERS + ['{:x}'.format(random.getrandbits(64)) for _ in range(1000)]
+    samples += ['a', 'abc', '+a0b', ' 4142', '']
+    for data in samples:
+        assert fanta_decrypt(data) == fanta_decrypt_slow(data), data
+
+
+def run(func, inputs):
+    start = time.perf_counter()
+    for data in inputs:
+        func(data)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=20000)
+    args = parser.parse_args()
+
+    check()
+    inputs = [random.choice(HEADERS) for _ in range(args.rounds)]
+    legacy = run(fanta_decrypt_slow, inputs)
+    uncached = run(fanta_decrypt.__wrapped__, inputs)
+    cached = run(fanta_decrypt, inputs)
+    print('{:>10} {:>10} {:>8}'.format('decryptor', 'time (ms)', 'speedup'))
+    for name, elapsed in (('legacy', legacy), ('fromhex', uncached), ('cached', cached)):
+        print('{:>10} {:>10.2f} {:>7.1f}x'.format(name, elapsed * 1000, legacy / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Feeds large pipelined bursts through AOProtocol.data_received and compares
+the bytearray framer with the old str split('#%') loop.
+
+    python -m benchmarks.bench_framing [--packets N] [--chunk BYTES]
+"""
+
+import argparse
+import time
+
+from server.aoprotocol import AOProtocol
+from server.fantacrypt import fanta_decrypt
+
+
+class StubBanManager:
+    def is_banned(self, ipid):
+        return False
+
+
+class StubServer:
+    ban_manager = StubBanManager()
+
+
+class StubClient:
+    is_checked = True
+    websocket = False
+
+    def disconnect(self):
+        pass
+
+
+class BenchProtocol(AOProtocol):
+    def net_cmd_bench(self, args):
+        self.received += 1
+
+    net_cmd_dispatcher = {'BENCH': (net_cmd_bench, None)}
+
+    def __init__(self, server):
+        super().__init__(server)
+        self.client = StubClient()
+        self.websocket = False
+        self.received = 0
+
+
+class LegacyProtocol(BenchProtocol):
+    """ The str based framing that data_received used before. """
+
+    def data_received(self, data):
+        buf = data
+        if not self.client.is_checked:
+            self.client.transport.close()
+        if self.websocket:
+            buf = self.websocket.handle(data)
+        if buf is None:
+            buf = b''
+        if not isinstance(buf, str):
+            self.buffer += buf.decode('utf-8', 'ignore')
+        else:
+            self.buffer = buf
+        if len(self.buffer) > 8192:
+            self.client.disconnect()
+        for msg in self.get_messages():
+            if len(msg) < 2:
+                continue
+            if msg[0] in ('#', '3', '4'):
+                if msg[0] == '#':
+                    msg = msg[1:]
+                spl = msg.split('#', 1)
+                msg = '#'.join([fanta_decrypt(spl[0])] + spl[1:])
+            try:
+                cmd, *args = msg.split('#')
+                self.net_cmd_dispatcher[cmd][0](self, args)
+            except KeyError:
+                pass
+
+    def get_messages(self):
+        while '#%' in self.buffer:
+            spl = self.buffer.split('#%', 1)
+            self.buffer = spl[1]
+            yield spl[0]
+
+    def __init__(self, server):
+        super().__init__(server)
+        self.buffer = ''
+
+
+def make_burst(packets):
+    return b''.join('BENCH#{}#some ooc text here#%'.format(i).encode('utf-8') for i in range(packets))
+
+
+def run(protocol_cls, burst, chunk):
+    proto = protocol_cls(StubServer())
+    start = time.perf_counter()
+    for i in range(0, len(burst), chunk):
+        proto.data_received(burst[i:i + chunk])
+    elapsed = time.perf_counter() - start
+    return elapsed, proto.received
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--packets', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--chunk', type=int, default=256 * 1024, help='bytes handed to data_received at once')
+    args = parser.parse_args()
+
+    print('{:>8} {:>12} {:>12} {:>8}'.format('packets', 'legacy (ms)', 'framer (ms)', 'speedup'))
+    for packets in args.packets:
+        burst = make_burst(packets)
+        legacy, legacy_cnt = run(LegacyProtocol, burst, args.chunk)
+        framer, framer_cnt = run(BenchProtocol, burst, args.chunk)
+        assert legacy_cnt == framer_cnt == packets
+        print('{:>8} {:>12.2f} {:>12.2f} {:>7.1f}x'.format(packets, legacy * 1000, framer * 1000, legacy / framer))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Simulates keepalives from many clients and compares re-arming ping
+timeouts with cancel() + call_later() against the TimingWheel. Reports
+the time spent and the peak size of the event loop's timer heap, which
+also holds cancelled handles until asyncio cleans them up.
+
+    python -m benchmarks.bench_timers [--clients N] [--rounds N]
+"""
+
+import argparse
+import asyncio
+import time
+
+from server.timing_wheel import TimingWheel
+
+TIMEOUT = 250
+
+
+def disconnect():
+    pass
+
+
+def run_legacy(loop, clients, rounds):
+    handles = [loop.call_later(TIMEOUT, disconnect) for _ in range(clients)]
+    peak = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for i in range(clients):
+            handles[i].cancel()
+            handles[i] = loop.call_later(TIMEOUT, disconnect)
+        peak = max(peak, len(loop._scheduled))
+        loop.run_until_complete(asyncio.sleep(0))
+    elapsed = time.perf_counter() - start
+    for handle in handles:
+        handle.cancel()
+    return elapsed, peak
+
+
+def run_wheel(loop, clients, rounds):
+    wheel = TimingWheel()
+    wheel.start(loop)
+    keys = [object() for _ in range(clients)]
+    for key in keys:
+        wheel.schedule(key, TIMEOUT, disconnect)
+    peak = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for key in keys:
+            wheel.schedule(key, TIMEOUT, disconnect)
+        peak = max(peak, len(loop._scheduled))
+        loop.run_until_complete(asyncio.sleep(0))
+    elapsed = time.perf_counter() - start
+    wheel.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    print('{:>8} {:>12} {:>10} {:>12} {:>10} {:>8}'.format('clients', 'legacy (ms)', 'heap', 'wheel (ms)', 'heap',
+                                                            'speedup'))
+    for clients in args.clients:
+        loop = asyncio.new_event_loop()
+        legacy, legacy_heap = run_legacy(loop, clients, args.rounds)
+        loop.close()
+        loop = asyncio.new_event_loop()
+        wheel, wheel_heap = run_wheel(loop, clients, args.rounds)
+        loop.close()
+        print('{:>8} {:>12.2f} {:>10} {:>12.2f} {:>10} {:>7.1f}x'.format(clients, legacy * 1000, legacy_heap,
+                                                                         wheel * 1000, wheel_heap, legacy / wheel))
+
+
+if __name__ == '__main__':
+    main()
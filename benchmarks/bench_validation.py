@@ -0,0 +1,102 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compares MS argument validation throughput of the old varargs
+validate_net_cmd plus the range checks in net_cmd_ms against the schema
+compiled into the net_cmd_dispatcher.
+
+    python -m benchmarks.bench_validation [--messages N]
+"""
+
+import argparse
+import time
+
+from server.aoprotocol import AOProtocol, ArgType
+
+MS_ARGS = ['chat', '-', 'Phoenix', 'normal', 'Hold it! That is a contradiction!', 'def', '1', '1', '0', '0', '1',
+           '0', '0', '1', '0']
+
+
+class StubClient:
+    char_id = 0
+
+
+def legacy_validate(client, args, *types, needs_auth=True):
+    if needs_auth and client.char_id == -1:
+        return False
+    if len(args) != len(types):
+        return False
+    for i, arg in enumerate(args):
+        if len(arg) == 0 and types[i] != ArgType.STR_OR_EMPTY:
+            return False
+        if types[i] == ArgType.INT:
+            try:
+                args[i] = int(arg)
+            except ValueError:
+                return False
+    return True
+
+
+def legacy_ms(client, args):
+    if not legacy_validate(client, args, ArgType.STR, ArgType.STR_OR_EMPTY, ArgType.STR, ArgType.STR,
+                           ArgType.STR, ArgType.STR, ArgType.STR, ArgType.INT, ArgType.INT, ArgType.INT,
+                           ArgType.INT, ArgType.INT, ArgType.INT, ArgType.INT, ArgType.INT):
+        return False
+    msg_type, pre, folder, anim, text, pos, sfx, anim_type, cid, sfx_delay, button, evidence, flip, ding, color = args
+    if msg_type not in ('chat', '0', '1'):
+        return False
+    if anim_type not in (0, 1, 2, 5, 6):
+        return False
+    if sfx_delay < 0:
+        return False
+    if button not in (0, 1, 2, 3, 4):
+        return False
+    if evidence < 0:
+        return False
+    if ding not in (0, 1):
+        return False
+    if color not in (0, 1, 2, 3, 4, 5, 6):
+        return False
+    return True
+
+
+def run(validate, messages):
+    client = StubClient()
+    packets = [list(MS_ARGS) for _ in range(messages)]
+    start = time.perf_counter()
+    for args in packets:
+        assert validate(client, args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=200000)
+    args = parser.parse_args()
+
+    _, compiled = AOProtocol.net_cmd_dispatcher['MS']
+    legacy = run(legacy_ms, args.messages)
+    schema = run(compiled, args.messages)
+    print('{:>10} {:>14} {:>10}'.format('validator', 'messages/s', 'us/msg'))
+    for name, elapsed in (('legacy', legacy), ('compiled', schema)):
+        print('{:>10} {:>14,.0f} {:>10.2f}'.format(name, args.messages / elapsed, elapsed / args.messages * 1e6))
+    print('speedup: {:.1f}x'.format(legacy / schema))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,480 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Connects many simulated Attorney Online clients to a running server and
+measures how long broadcasts take to reach everyone.
+
+Every client does the real join sequence (HI, ID, askchaa, RC, RM, RD, CC)
+over raw TCP or WebSocket and then sends a random mix of IC messages, OOC
+messages, music changes and area changes. IC and OOC messages carry a
+unique token, so each copy that arrives at any client gives one fan-out
+latency sample. Music changes are matched by song and character, area
+changes by the reply sent to the mover.
+
+    python -m benchmarks.loadgen --clients 80 --ws 0.5 --duration 30 \\
+        --mix MS=4,CT=4,MC=1,AREA=1 --spawn --output results.json
+
+Every simulated client comes from the same address, so with the default
+connection_limits all but the first few are turned away and the run
+measures the limiter instead of the server. Allow enough players and
+exempt the address the load comes from in config/config.yaml:
+
+    playerlimit: 500
+    connection_limits:
+      exempt: [127.0.0.1]
+
+With --spawn the server is started from the repository root with its own
+config folder and stopped afterwards; use --pid to sample CPU and memory
+of a server that is already running. CPU and RSS are read from /proc, so
+they are only reported on Linux.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import random
+import socket
+import struct
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+PACKET_TYPES = ('MS', 'CT', 'MC', 'AREA')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    samples = sorted(samples)
+
+    def pick(p):
+        return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 3)
+
+    return {'count': len(samples), 'p50': pick(0.50), 'p90': pick(0.90), 'p99': pick(0.99),
+            'max': round(samples[-1] * 1000, 3), 'mean': round(sum(samples) / len(samples) * 1000, 3)}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip().upper()
+        if name not in PACKET_TYPES:
+            raise argparse.ArgumentTypeError('unknown packet type {}'.format(name))
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class ProcessStats:
+    """ Samples CPU time and resident memory of a process from /proc. """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.ticks = os.sysconf('SC_CLK_TCK')
+        self.rss_peak = 0
+        self.start_cpu = None
+        self.start_time = None
+
+    def cpu_seconds(self):
+        with open('/proc/{}/stat'.format(self.pid)) as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        # utime and stime are fields 14 and 15, counted from the pid
+        return (int(fields[11]) + int(fields[12])) / self.ticks
+
+    def rss_kb(self):
+        with open('/proc/{}/status'.format(self.pid)) as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+        return 0
+
+    def start(self):
+        self.start_cpu = self.cpu_seconds()
+        self.start_time = time.monotonic()
+        self.sample()
+
+    def sample(self):
+        self.rss_peak = max(self.rss_peak, self.rss_kb())
+
+    def result(self):
+        self.sample()
+        cpu = self.cpu_seconds() - self.start_cpu
+        wall = time.monotonic() - self.start_time
+        return {'pid': self.pid, 'cpu_seconds': round(cpu, 3), 'cpu_percent': round(cpu / wall * 100, 1),
+                'rss_end_kb': self.rss_kb(), 'rss_peak_kb': self.rss_peak}
+
+
+class Tracker:
+    """ Remembers when each tagged packet was sent and collects the
+    latencies of every copy that comes back.
+    """
+
+    def __init__(self):
+        self.sent = defaultdict(int)
+        self.received = defaultdict(int)
+        self.latencies = defaultdict(list)
+        self.tokens = {}
+        self.music = {}
+        self.seq = 0
+
+    def new_token(self, kind):
+        self.seq += 1
+        token = 'lg{}{}'.format(kind.lower(), self.seq)
+        self.tokens[token] = (kind, time.perf_counter())
+        self.sent[kind] += 1
+        return token
+
+    def token_received(self, token):
+        entry = self.tokens.get(token)
+        if entry is not None:
+            self.record(entry[0], entry[1])
+
+    def record(self, kind, sent_at):
+        self.received[kind] += 1
+        self.latencies[kind].append(time.perf_counter() - sent_at)
+
+    def result(self):
+        return {kind: dict(sent=self.sent[kind], received=self.received[kind], latency_ms=percentiles(self.latencies[kind]))
+                for kind in PACKET_TYPES}
+
+
+class LoadClient:
+    def __init__(self, index, args, tracker, use_ws):
+        self.index = index
+        self.args = args
+        self.tracker = tracker
+        self.use_ws = use_ws
+        self.hdid = 'loadgen{}'.format(index)
+        self.name = 'lg{}'.format(index)
+        self.reader = None
+        self.writer = None
+        self.buffer = bytearray()
+        self.char_id = -1
+        self.char_names = []
+        self.songs = []
+        self.areas = []
+        self.area = None
+        self.free_chars = []
+        self.version = None
+        self.done = asyncio.Event()
+        self.picked = asyncio.Event()
+        self.area_sent = None
+        self.joined_at = None
+        self.closed = False
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.args.host, self.args.port)
+        if self.use_ws:
+            key = base64.b64encode(os.urandom(16)).decode()
+            self.writer.write('GET / HTTP/1.1\r\nHost: {}:{}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                              'Sec-WebSocket-Key: {}\r\nSec-WebSocket-Version: 13\r\n\r\n'
+                              .format(self.args.host, self.args.port, key).encode())
+            await self.reader.readuntil(b'\r\n\r\n')
+
+    def send(self, msg):
+        data = msg.encode('utf-8')
+        if self.use_ws:
+            mask = os.urandom(4)
+            if len(data) < 126:
+                header = struct.pack('!BB', 0x81, 0x80 | len(data))
+            elif len(data) < 65536:
+                header = struct.pack('!BBH', 0x81, 0x80 | 126, len(data))
+            else:
+                header = struct.pack('!BBQ', 0x81, 0x80 | 127, len(data))
+            key = (mask * (len(data) // 4 + 1))[:len(data)]
+            masked = (int.from_bytes(data, 'big') ^ int.from_bytes(key, 'big')).to_bytes(len(data), 'big')
+            data = header + mask + masked
+        self.writer.write(data)
+
+    async def join(self):
+        self.send('HI#{}#%'.format(self.hdid))
+        self.send('ID#AO2#2.4.10#%')
+        self.send('askchaa#%')
+        self.send('RC#%')
+        self.send('RM#%')
+        self.send('RD#%')
+        await self.done.wait()
+        self.joined_at = time.perf_counter()
+        if self.areas:
+            target = self.areas[self.index % min(len(self.areas), self.args.areas)]
+            if target != self.area:
+                self.send('MC#{}#-1#%'.format(target))
+                await asyncio.sleep(0.2)
+        if self.free_chars:
+            self.send('CC#0#{}#{}#%'.format(random.choice(self.free_chars), self.hdid))
+            try:
+                await asyncio.wait_for(self.picked.wait(), 2)
+            except asyncio.TimeoutError:
+                pass
+
+    async def read_loop(self):
+        try:
+            while True:
+                data = await self.reader.read(65536)
+                if not data:
+                    break
+                self.buffer.extend(data)
+                if self.use_ws:
+                    for payload in self.read_frames():
+                        self.feed(payload)
+                else:
+                    end = self.buffer.rfind(b'#%')
+                    if end != -1:
+                        chunk = bytes(self.buffer[:end])
+                        del self.buffer[:end + 2]
+                        self.feed(chunk)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        self.closed = True
+
+    def read_frames(self):
+        buf = self.buffer
+        payloads = []
+        while len(buf) >= 2:
+            length = buf[1] & 0x7f
+            offset = 2
+            if length == 126:
+                if len(buf) < 4:
+                    break
+                length = struct.unpack_from('!H', buf, 2)[0]
+                offset = 4
+            elif length == 127:
+                if len(buf) < 10:
+                    break
+                length = struct.unpack_from('!Q', buf, 2)[0]
+                offset = 10
+            if len(buf) < offset + length:
+                break
+            if buf[0] & 0x0f == 0x1:
+                payloads.append(bytes(buf[offset:offset + length]))
+            del buf[:offset + length]
+        return payloads
+
+    def feed(self, chunk):
+        for msg in chunk.decode('utf-8', 'ignore').split('#%'):
+            cmd, *args = msg.split('#')
+            if cmd == 'MS' and len(args) > 4:
+                self.tracker.token_received(args[4])
+            elif cmd == 'CT' and len(args) > 1:
+                self.handle_ct(args[1])
+            elif cmd == 'MC' and len(args) > 1:
+                sent_at = self.tracker.music.get((self.area, args[1], args[0]))
+                if sent_at is not None:
+                    self.tracker.record('MC', sent_at)
+            elif cmd == 'SC':
+                self.char_names = [name.split('&')[0] for name in args]
+            elif cmd == 'SM':
+                self.songs = [song for song in args if '.' in song]
+            elif cmd == 'CharsCheck':
+                self.free_chars = [i for i, taken in enumerate(args) if taken == '0']
+            elif cmd == 'PV' and len(args) > 2:
+                self.char_id = int(args[2])
+                self.picked.set()
+            elif cmd == 'ID' and len(args) > 2:
+                self.version = '{} {}'.format(args[1], args[2])
+            elif cmd == 'DONE':
+                self.done.set()
+
+    def handle_ct(self, text):
+        if text.startswith('lg'):
+            self.tracker.token_received(text)
+        elif text.startswith('=== Areas ==='):
+            self.areas = []
+            for line in text.split('\r\n')[1:]:
+                name = line.split(': ', 1)[1].rsplit(' (users:', 1)[0]
+                self.areas.append(name)
+                if line.endswith('[*]'):
+                    self.area = name
+        elif text.startswith('Changed area to '):
+            self.area = text[len('Changed area to '):].rsplit('.[', 1)[0]
+            if self.area_sent is not None:
+                self.tracker.record('AREA', self.area_sent)
+                self.area_sent = None
+
+    def send_kind(self, kind):
+        if kind == 'MS':
+            if self.char_id == -1:
+                return
+            token = self.tracker.new_token('MS')
+            self.send('MS#chat#-#{}#normal#{}#wit#0#0#{}#0#0#0#0#0#0#%'
+                      .format(self.char_names[self.char_id], token, self.char_id))
+        elif kind == 'CT':
+            self.send('CT#{}#{}#%'.format(self.name, self.tracker.new_token('CT')))
+        elif kind == 'MC':
+            if self.char_id == -1 or not self.songs:
+                return
+            song = random.choice(self.songs)
+            self.tracker.music[(self.area, str(self.char_id), song)] = time.perf_counter()
+            self.tracker.sent['MC'] += 1
+            self.send('MC#{}#{}#%'.format(song, self.char_id))
+        elif kind == 'AREA':
+            choices = [area for area in self.areas[:self.args.areas] if area != self.area]
+            if not choices:
+                return
+            self.area_sent = time.perf_counter()
+            self.tracker.sent['AREA'] += 1
+            self.send('MC#{}#{}#%'.format(random.choice(choices), self.char_id))
+
+    async def drive(self, deadline, mix):
+        kinds = list(mix)
+        weights = [mix[kind] for kind in kinds]
+        while time.monotonic() < deadline and not self.closed:
+            await asyncio.sleep(random.expovariate(self.args.rate))
+            self.send_kind(random.choices(kinds, weights)[0])
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def spawn_server(args):
+    proc = subprocess.Popen([sys.executable, 'start_server.py'], cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit('server exited with code {}'.format(proc.returncode))
+        try:
+            socket.create_connection((args.host, args.port), 0.5).close()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit('server did not start listening on port {}'.format(args.port))
+
+
+async def run(args, pid):
+    tracker = Tracker()
+    stats = ProcessStats(pid) if pid else None
+    if stats:
+        stats.start()
+    clients = [LoadClient(i, args, tracker, i < args.clients * args.ws) for i in range(args.clients)]
+    connect_times = []
+    failed = 0
+    readers = []
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def join(client):
+        nonlocal failed
+        async with slots:
+            start = time.perf_counter()
+            try:
+                await client.connect()
+                readers.append(asyncio.ensure_future(client.read_loop()))
+                await asyncio.wait_for(client.join(), 10)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                failed += 1
+                client.closed = True
+                return
+            connect_times.append(client.joined_at - start)
+
+    join_start = time.perf_counter()
+    await asyncio.gather(*[join(client) for client in clients])
+    join_time = time.perf_counter() - join_start
+
+    deadline = time.monotonic() + args.duration
+
+    async def sample_server():
+        while time.monotonic() < deadline:
+            stats.sample()
+            await asyncio.sleep(1)
+
+    tasks = [client.drive(deadline, args.mix) for client in clients if not client.closed]
+    if stats:
+        tasks.append(sample_server())
+    await asyncio.gather(*tasks)
+    await asyncio.sleep(args.drain)
+
+    for client in clients:
+        client.close()
+    for reader in readers:
+        reader.cancel()
+
+    versions = {client.version for client in clients if client.version}
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'server_version': ', '.join(sorted(versions)),
+        'python': platform.python_version(),
+        'settings': {'clients': args.clients, 'websocket_share': args.ws, 'duration': args.duration,
+                     'rate': args.rate, 'areas': args.areas, 'mix': args.mix},
+        'connect': {'ok': len(connect_times), 'failed': failed, 'seconds': round(join_time, 3),
+                    'latency_ms': percentiles(connect_times)},
+        'packets': tracker.result(),
+        'server': stats.result() if stats else None,
+    }
+
+
+def print_report(result):
+    print('server {}, {} clients joined in {}s ({} failed)'.format(
+        result['server_version'] or '?', result['connect']['ok'], result['connect']['seconds'],
+        result['connect']['failed']))
+    if result['connect']['failed']:
+        print('clients failed to join, check playerlimit and that connection_limits exempts this address')
+    print('{:>5} {:>7} {:>9} {:>9} {:>9} {:>9} {:>9}'.format('type', 'sent', 'received', 'p50 ms', 'p90 ms',
+                                                            'p99 ms', 'max ms'))
+    for kind, row in result['packets'].items():
+        lat = row['latency_ms']
+        print('{:>5} {:>7} {:>9} {:>9} {:>9} {:>9} {:>9}'.format(kind, row['sent'], row['received'], lat.get('p50', '-'),
+                                                                lat.get('p90', '-'), lat.get('p99', '-'),
+                                                                lat.get('max', '-')))
+    if result['server']:
+        print('server cpu {cpu_seconds}s ({cpu_percent}%), rss peak {rss_peak_kb} kB'.format(**result['server']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=50000)
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--ws', type=float, default=0.0, help='share of clients that connect over WebSocket')
+    parser.add_argument('--duration', type=float, default=20, help='seconds of traffic after everyone joined')
+    parser.add_argument('--rate', type=float, default=1.0, help='packets per second per client')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('MS=4,CT=4,MC=1,AREA=1'),
+                        help='relative weights, e.g. MS=4,CT=4,MC=1,AREA=1')
+    parser.add_argument('--areas', type=int, default=3, help='number of areas clients are spread over')
+    parser.add_argument('--concurrency', type=int, default=50, help='clients joining at the same time')
+    parser.add_argument('--drain', type=float, default=2, help='seconds to wait for late packets')
+    parser.add_argument('--spawn', action='store_true', help='start the server from this repository')
+    parser.add_argument('--pid', type=int, help='pid of a running server to sample')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    proc = spawn_server(args) if args.spawn else None
+    pid = proc.pid if proc else args.pid
+    if pid and not os.path.exists('/proc/{}'.format(pid)):
+        pid = None
+    try:
+        result = asyncio.get_event_loop().run_until_complete(run(args, pid))
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+
+    print_report(result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Searches the event log with the same filters as /logsearch, for example
+
+    python search_log.py type=ic ipid=X area=3 last=2h limit=100
+
+It can run while the server does.
+"""
+
+import shlex
+import sqlite3
+import sys
+
+from server.eventlog import EVENT_DATABASE, QUERY_USAGE, format_event, parse_query, search_events
+from server.exceptions import ArgumentError
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(QUERY_USAGE)
+        return 1
+    try:
+        query = parse_query(' '.join(shlex.quote(word) for word in sys.argv[1:]))
+    except ArgumentError as ex:
+        print(ex)
+        return 1
+    conn = sqlite3.connect('file:{}?mode=ro'.format(EVENT_DATABASE), uri=True)
+    for row in search_events(conn, query):
+        print(format_event(row))
+    conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -26,23 +26,90 @@ from .exceptions import ClientError, AreaError, ArgumentError, ServerError
 from .fantacrypt import fanta_decrypt
 from .websocket import WebSocket
 
+POSITIONS = ('def', 'pro', 'hld', 'hlp', 'jud', 'wit')
+
+
+class ArgType(Enum):
+    STR = 1,
+    STR_OR_EMPTY = 2,
+    INT = 3
+    UINT = 4
+
+
+def compile_schema(*types, needs_auth=True):
+    """ Compiles the expected arguments of a net command into a validator.
+
+    Each type is either an ArgType or an (ArgType, allowed values) pair.
+    The returned function converts integer arguments in place.
+
+    :param types: what kind of data types are expected
+    :param needs_auth: whether you need to have chosen a character
+    :return: validator(client, args) returning True if message was validated
+    """
+    count = len(types)
+    non_empty = []
+    ints = []
+    uints = []
+    allowed = []
+    for i, arg_type in enumerate(types):
+        values = None
+        if isinstance(arg_type, tuple):
+            arg_type, values = arg_type
+        if arg_type != ArgType.STR_OR_EMPTY:
+            non_empty.append(i)
+        if arg_type in (ArgType.INT, ArgType.UINT):
+            ints.append(i)
+        if arg_type == ArgType.UINT:
+            uints.append(i)
+        if values is not None:
+            allowed.append((i, frozenset(values)))
+    non_empty = tuple(non_empty)
+    ints = tuple(ints)
+    uints = tuple(uints)
+    allowed = tuple(allowed)
+
+    def validate(client, args):
+        if needs_auth and client.char_id == -1:
+            return False
+        if len(args) != count:
+            return False
+        for i in non_empty:
+            if not args[i]:
+                return False
+        try:
+            for i in ints:
+                args[i] = int(args[i])
+        except ValueError:
+            return False
+        for i in uints:
+            if args[i] < 0:
+                return False
+        for i, values in allowed:
+            if args[i] not in values:
+                return False
+        return True
+
+    return validate
+
 
 class AOProtocol(asyncio.Protocol):
     """
     The main class that deals with the AO protocol.
     """
 
-    class ArgType(Enum):
-        STR = 1,
-        STR_OR_EMPTY = 2,
-        INT = 3
+    ArgType = ArgType
+
+    # hard limit on bytes buffered without a message terminator
+    max_unparsed = 8192
+    askchar2 = b'#615810BC07D12A5A#'
 
     def __init__(self, server):
         super().__init__()
         self.server = server
         self.client = None
-        self.buffer = ''
-        self.ping_timeout = None
+        self.ip = None
+        self.buffer = bytearray()
+        self.scan_offset = 0
         self.websocket = None
 
     def data_received(self, data):
@@ -53,6 +120,8 @@ class AOProtocol(asyncio.Protocol):
 
         :param data: bytes of data
         """
+        if self.client is None:
+            return
 
         if self.websocket is None:
             self.websocket = WebSocket(self.client, self)
@@ -60,6 +129,7 @@ class AOProtocol(asyncio.Protocol):
                 self.websocket = False
             else:
                 self.client.websocket = self.websocket
+                data = b''
 
         buf = data
 
@@ -71,17 +141,7 @@ class AOProtocol(asyncio.Protocol):
         if self.websocket:
             buf = self.websocket.handle(data)
 
-        if buf is None:
-            buf = b''
-
-        if not isinstance(buf, str):
-            # try to decode as utf-8, ignore any erroneous characters
-            self.buffer += buf.decode('utf-8', 'ignore')
-        else:
-            self.buffer = buf
-
-        if len(self.buffer) > 8192:
-            self.client.disconnect()
+        self.buffer.extend(buf)
         for msg in self.get_messages():
             if len(msg) < 2:
                 continue
@@ -94,17 +154,28 @@ class AOProtocol(asyncio.Protocol):
                 logger.log_debug('[INC][RAW]{}'.format(msg), self.client)
             try:
                 cmd, *args = msg.split('#')
-                self.net_cmd_dispatcher[cmd](self, args)
+                handler, validate = self.net_cmd_dispatcher[cmd]
+                if validate is None or validate(self.client, args):
+                    handler(self, args)
             except KeyError:
                 logger.log_debug('[INC][UNK]{}'.format(msg), self.client)
+        if len(self.buffer) > self.max_unparsed:
+            self.buffer.clear()
+            self.scan_offset = 0
+            self.client.disconnect()
 
     def connection_made(self, transport):
         """ Called upon a new client connecting
 
         :param transport: the transport object
         """
+        ip = transport.get_extra_info('peername')[0]
+        if not self.server.connection_limiter.admit(ip):
+            transport.abort()
+            return
+        self.ip = ip
         self.client = self.server.new_client(transport)
-        self.ping_timeout = asyncio.get_event_loop().call_later(self.server.config['timeout'], self.client.disconnect)
+        self.server.timers.schedule(self, self.server.config['timeout'], self.client.disconnect)
         asyncio.get_event_loop().call_later(0.25, self.client.send_command, 'decryptor', 34)  # just fantacrypt things)
 
     def connection_lost(self, exc):
@@ -112,45 +183,44 @@ class AOProtocol(asyncio.Protocol):
 
         :param exc: reason
         """
+        if self.client is None:
+            return
+        self.server.connection_limiter.release(self.ip)
         self.server.remove_client(self.client)
-        self.ping_timeout.cancel()
+        self.server.timers.cancel(self)
+
+    def pause_writing(self):
+        """ Called when the transport buffer goes over the high-water mark """
+        self.client.pause_writing()
+
+    def resume_writing(self):
+        """ Called when the transport buffer drains below the low-water mark """
+        self.client.resume_writing()
 
     def get_messages(self):
         """ Parses out full messages from the buffer.
 
+        Everything up to the last terminator is decoded once straight out
+        of the buffer and dropped from it in one go, so a burst of
+        pipelined messages costs linear time.
+
         :return: yields messages
         """
-        while '#%' in self.buffer:
-            spl = self.buffer.split('#%', 1)
-            self.buffer = spl[1]
-            yield spl[0]
+        buf = self.buffer
+        end = buf.rfind(b'#%', self.scan_offset)
+        if end != -1:
+            with memoryview(buf) as view, view[:end] as frames:
+                # ignore any erroneous characters
+                msgs = str(frames, 'utf-8', 'ignore').split('#%')
+            del buf[:end + 2]
+            yield from msgs
+        # the terminator might have been cut in half
+        self.scan_offset = max(len(buf) - 1, 0)
         # exception because bad netcode
-        askchar2 = '#615810BC07D12A5A#'
-        if self.buffer == askchar2:
-            self.buffer = ''
-            yield askchar2
-
-    def validate_net_cmd(self, args, *types, needs_auth=True):
-        """ Makes sure the net command's arguments match expectations.
-
-        :param args: actual arguments to the net command
-        :param types: what kind of data types are expected
-        :param needs_auth: whether you need to have chosen a character
-        :return: returns True if message was validated
-        """
-        if needs_auth and self.client.char_id == -1:
-            return False
-        if len(args) != len(types):
-            return False
-        for i, arg in enumerate(args):
-            if len(arg) == 0 and types[i] != self.ArgType.STR_OR_EMPTY:
-                return False
-            if types[i] == self.ArgType.INT:
-                try:
-                    args[i] = int(arg)
-                except ValueError:
-                    return False
-        return True
+        if buf == self.askchar2:
+            buf.clear()
+            self.scan_offset = 0
+            yield self.askchar2.decode()
 
     def net_cmd_hi(self, args):
         """ Handshake.
@@ -159,25 +229,13 @@ class AOProtocol(asyncio.Protocol):
 
         :param args: a list containing all the arguments
         """
-        if not self.validate_net_cmd(args, self.ArgType.STR, needs_auth=False):
+        self.client.set_hdid(args[0])
+        self.server.identity_manager.link(self.client.hdid, self.client.ipid)
+        if self.server.identity_manager.is_banned(self.client.hdid) and \
+                self.client.hdid not in self.server.ban_manager.hdid_exempt:
+            self.client.disconnect()
+            logger.log_connect('Connection rejected, Banned. HDID: {}'.format(self.client.hdid), self.client)
             return
-        self.client.hdid = args[0]
-        ipid = self.client.ipid
-        try:
-            self.client.server.hdid_list[self.client.hdid]
-        except KeyError:
-            self.client.server.hdid_list[self.client.hdid] = []
-            self.client.server.save_id()
-        if not ipid in self.client.server.hdid_list[self.client.hdid]:
-            self.client.server.hdid_list[self.client.hdid].append(ipid)
-            self.client.server.save_id()
-        for ip_id in self.client.server.hdid_list[self.client.hdid]:
-            if self.server.ban_manager.is_banned(ip_id):
-                if self.client.hdid in self.server.ban_manager.hdid_exempt:
-                    break
-                self.client.disconnect()
-                logger.log_connect('Connection rejected, Banned. HDID: {}'.format(self.client.hdid), self.client)
-                return
         logger.log_connect('Connected. HDID: {}.'.format(self.client.hdid), self.client)
         self.server.stats_manager.connect_data(self.client.ipid, self.client.hdid)
         self.client.send_command('ID', self.client.id, self.server.software, self.server.get_version_string())
@@ -230,8 +288,7 @@ class AOProtocol(asyncio.Protocol):
 
         """
         self.client.send_command('CHECK')
-        self.ping_timeout.cancel()
-        self.ping_timeout = asyncio.get_event_loop().call_later(self.server.config['timeout'], self.client.disconnect)
+        self.server.timers.schedule(self, self.server.config['timeout'], self.client.disconnect)
 
     def net_cmd_askchaa(self, _):
         """ Ask for the counts of characters/evidence/music
@@ -239,10 +296,7 @@ class AOProtocol(asyncio.Protocol):
         askchaa#%
 
         """
-        char_cnt = len(self.server.char_list)
-        evi_cnt = 0
-        music_cnt = sum([len(x) for x in self.server.music_pages_ao1])
-        self.client.send_command('SI', char_cnt, evi_cnt, music_cnt)
+        self.client.send_packet(self.server.server_info_packet)
 
     def net_cmd_askchar2(self, _):
         """ Asks for the character list.
@@ -250,7 +304,7 @@ class AOProtocol(asyncio.Protocol):
         askchar2#%
 
         """
-        self.client.send_command('CI', *self.server.char_pages_ao1[0])
+        self.client.send_packet(self.server.char_page_packets[0])
 
     def net_cmd_an(self, args):
         """ Asks for specific pages of the character list.
@@ -258,12 +312,10 @@ class AOProtocol(asyncio.Protocol):
         AN#<page:int>#%
 
         """
-        if not self.validate_net_cmd(args, self.ArgType.INT, needs_auth=False):
-            return
-        if len(self.server.char_pages_ao1) > args[0] >= 0:
-            self.client.send_command('CI', *self.server.char_pages_ao1[args[0]])
+        if len(self.server.char_page_packets) > args[0] >= 0:
+            self.client.send_packet(self.server.char_page_packets[args[0]])
         else:
-            self.client.send_command('EM', *self.server.music_pages_ao1[0])
+            self.client.send_packet(self.server.music_page_packets[0])
 
     def net_cmd_ae(self, _):
         """ Asks for specific pages of the evidence list.
@@ -279,10 +331,8 @@ class AOProtocol(asyncio.Protocol):
         AM#<page:int>#%
 
         """
-        if not self.validate_net_cmd(args, self.ArgType.INT, needs_auth=False):
-            return
-        if len(self.server.music_pages_ao1) > args[0] >= 0:
-            self.client.send_command('EM', *self.server.music_pages_ao1[args[0]])
+        if len(self.server.music_page_packets) > args[0] >= 0:
+            self.client.send_packet(self.server.music_page_packets[args[0]])
         else:
             self.client.send_done()
             self.client.send_area_list()
@@ -295,7 +345,7 @@ class AOProtocol(asyncio.Protocol):
 
         """
 
-        self.client.send_command('SC', *self.server.char_list)
+        self.client.send_packet(self.server.char_list_packet)
 
     def net_cmd_rm(self, _):
         """ Asks for the whole music list(AO2)
@@ -304,7 +354,7 @@ class AOProtocol(asyncio.Protocol):
 
         """
 
-        self.client.send_command('SM', *self.server.music_list_ao2)
+        self.client.send_packet(self.server.music_list_packet)
 
     def net_cmd_rd(self, _):
         """ Asks for server metadata(charscheck, motd etc.) and a DONE#% signal(also best packet)
@@ -323,8 +373,6 @@ class AOProtocol(asyncio.Protocol):
         CC#<client_id:int>#<char_id:int>#<hdid:string>#%
 
         """
-        if not self.validate_net_cmd(args, self.ArgType.INT, self.ArgType.INT, self.ArgType.STR, needs_auth=False):
-            return
         cid = args[1]
         try:
             self.client.change_character(cid)
@@ -343,32 +391,12 @@ class AOProtocol(asyncio.Protocol):
             return
         if not self.client.area.can_send_message(self.client):
             return
-        if not self.validate_net_cmd(args, self.ArgType.STR, self.ArgType.STR_OR_EMPTY, self.ArgType.STR,
-                                     self.ArgType.STR,
-                                     self.ArgType.STR, self.ArgType.STR, self.ArgType.STR, self.ArgType.INT,
-                                     self.ArgType.INT, self.ArgType.INT, self.ArgType.INT, self.ArgType.INT,
-                                     self.ArgType.INT, self.ArgType.INT, self.ArgType.INT):
-            return
         msg_type, pre, folder, anim, text, pos, sfx, anim_type, cid, sfx_delay, button, evidence, flip, ding, color = args
         if self.client.area.is_iniswap(self.client, pre, anim, folder) and folder != self.client.get_char_name():
             self.client.send_host_message("Iniswap is blocked in this area")
             return
-        if msg_type not in ('chat', '0', '1'):
-            return
-        if anim_type not in (0, 1, 2, 5, 6):
-            return
         if cid != self.client.char_id:
             return
-        if sfx_delay < 0:
-            return
-        if button not in (0, 1, 2, 3, 4):
-            return
-        if evidence < 0:
-            return
-        if ding not in (0, 1):
-            return
-        if color not in (0, 1, 2, 3, 4, 5, 6):
-            return
         if color == 2 and not self.client.is_mod:
             color = 0
         if color == 6:
@@ -378,10 +406,11 @@ class AOProtocol(asyncio.Protocol):
             else:
                 if text.strip(' ') in ('<num>', '<percent>', '<dollar>', '<and>'):
                     color = 0
+        # the sent pos only has to be valid when the client has no /pos set
         if self.client.pos:
             pos = self.client.pos
         else:
-            if pos not in ('def', 'pro', 'hld', 'hlp', 'jud', 'wit'):
+            if pos not in POSITIONS:
                 return
         msg = text[:256]
         if self.client.gimp:  # If you're gimped, gimp message.
@@ -398,12 +427,14 @@ class AOProtocol(asyncio.Protocol):
                                       sfx_delay, button, self.client.evi_list[evidence], flip, ding, color)
         self.client.area.set_next_msg_delay(len(msg))
         logger.log_server('[IC][{}][{}]{}'.format(self.client.area.id, self.client.get_char_name(), msg), self.client)
+        self.server.event_log.add('IC', self.client, msg)
         if not self.client.area.basement:
             if self.client.area.last_talked is None:
                 self.client.area.last_talked = self.client.ipid
-                self.server.stats_manager.char_talked(self.client.char_id, self.client.ipid, self.client.area.status)
+                self.server.stats_manager.char_talked(self.client.char_id, self.client.ipid, self.client.area.status_bucket)
             if not self.client.area.last_talked == self.client.ipid:
-                self.server.stats_manager.char_talked(self.client.char_id, self.client.ipid, self.client.area.status)
+                self.server.stats_manager.char_talked(self.client.char_id, self.client.ipid, self.client.area.status_bucket)
+            self.server.stats_manager.count_activity(self.client.area.id, 'char', self.client.get_char_name())
         if color == 2:
             logger.log_mod('[IC][Redtext][{}][{}][{}]{}'.format(self.client.area.id, self.client.area.status,
                                                                 self.client.get_char_name(), msg), self.client)
@@ -415,12 +446,12 @@ class AOProtocol(asyncio.Protocol):
         CT#<name:string>#<message:string>#%
 
         """
-        if self.client.name == '' or self.client.name != args[0]:
-            self.client.name = args[0]
+        if args and (self.client.name == '' or self.client.name != args[0]):
+            self.client.set_name(args[0])
         if self.client.is_ooc_muted:  # Checks to see if the client has been muted by a mod
             self.client.send_host_message("You have been muted by a moderator")
             return
-        if not self.validate_net_cmd(args, self.ArgType.STR, self.ArgType.STR):
+        if not self.ct_schema(self.client, args):
             return
         if self.client.name == '':
             self.client.send_host_message('You must insert a name with at least one letter.')
@@ -495,6 +526,9 @@ class AOProtocol(asyncio.Protocol):
             arg = ''
             if len(spl) == 2:
                 arg = spl[1][:256]
+            # logged before running, so failed and refused attempts are kept too
+            if self.client.is_mod and cmd != 'login':
+                self.server.event_log.add('MOD', self.client, args[1])
             try:
                 called_function = 'ooc_cmd_{}'.format(cmd)
                 getattr(commands, called_function)(self.client, arg)
@@ -510,6 +544,7 @@ class AOProtocol(asyncio.Protocol):
             logger.log_server(
                 '[OOC][{}][{}][{}]{}'.format(self.client.area.id, self.client.get_char_name(), self.client.name,
                                              args[1]), self.client)
+            self.server.event_log.add('OOC', self.client, args[1])
 
     def net_cmd_mc(self, args):
         """ Play music.
@@ -527,7 +562,7 @@ class AOProtocol(asyncio.Protocol):
             if not self.client.is_dj:
                 self.client.send_host_message('You were blockdj\'d by a moderator.')
                 return
-            if not self.validate_net_cmd(args, self.ArgType.STR, self.ArgType.INT):
+            if not self.mc_schema(self.client, args):
                 return
             if args[1] != self.client.char_id:
                 return
@@ -542,7 +577,9 @@ class AOProtocol(asyncio.Protocol):
                 self.client.area.add_music_playing(self.client, name)
                 logger.log_server('[{}][{}]Changed music to {}.'
                                   .format(self.client.area.id, self.client.get_char_name(), name), self.client)
-                self.server.stats_manager.music_played(name, self.client.area.status)
+                self.server.stats_manager.music_played(name, self.client.area.status_bucket)
+                self.server.stats_manager.count_activity(self.client.area.id, 'music', name)
+                self.server.event_log.add('MUSIC', self.client, name)
             except ServerError:
                 return
         except ClientError as ex:
@@ -560,14 +597,10 @@ class AOProtocol(asyncio.Protocol):
         if not self.client.can_wtce:
             self.client.send_host_message('You were blocked from using judge signs by a moderator.')
             return
-        if not self.validate_net_cmd(args, self.ArgType.STR):
-            return
         if args[0] == 'testimony1':
             sign = 'WT'
-        elif args[0] == 'testimony2':
-            sign = 'CE'
         else:
-            return
+            sign = 'CE'
         if self.client.wtce_mute():
             self.client.send_host_message(
                 'You used witness testimony/cross examination signs too many times. Please try again after {} seconds.'.format(
@@ -576,6 +609,7 @@ class AOProtocol(asyncio.Protocol):
         self.client.area.send_command('RT', args[0])
         self.client.area.add_to_judgelog(self.client, 'used {}'.format(sign))
         logger.log_server("[{}]{} Used WT/CE".format(self.client.area.id, self.client.get_char_name()), self.client)
+        self.server.event_log.add('WTCE', self.client, sign)
 
     def net_cmd_hp(self, args):
         """ Sets the penalty bar.
@@ -586,13 +620,12 @@ class AOProtocol(asyncio.Protocol):
         if self.client.is_muted:  # Checks to see if the client has been muted by a mod
             self.client.send_host_message("You have been muted by a moderator")
             return
-        if not self.validate_net_cmd(args, self.ArgType.INT, self.ArgType.INT):
-            return
         try:
             self.client.area.change_hp(args[0], args[1])
             self.client.area.add_to_judgelog(self.client, 'changed the penalties')
             logger.log_server('[{}]{} changed HP ({}) to {}'
                               .format(self.client.area.id, self.client.get_char_name(), args[0], args[1]), self.client)
+            self.server.event_log.add('HP', self.client, 'HP ({}) to {}'.format(args[0], args[1]))
         except AreaError:
             return
 
@@ -653,7 +686,7 @@ class AOProtocol(asyncio.Protocol):
 
         if 'modcall_reason' in self.server.features:
             reason = "N/A"
-            if self.validate_net_cmd(args, self.ArgType.STR):
+            if self.zz_schema(self.client, args):
                 reason = args[0]
                 if len(reason) > 256:
                     logger.log_server('[{}] has tried to enter a very long modcall reason.'
@@ -684,28 +717,49 @@ class AOProtocol(asyncio.Protocol):
     def net_cmd_opBAN(self, args):
         self.net_cmd_ct(['opban', '/ban {}'.format(args[0])])
 
+    # validated inside the handlers, since they are not checked up front
+    mc_schema = staticmethod(compile_schema(ArgType.STR, ArgType.INT))
+    ct_schema = staticmethod(compile_schema(ArgType.STR, ArgType.STR))
+    zz_schema = staticmethod(compile_schema(ArgType.STR))
+
+    # command: (handler, argument validator or None if the handler checks its own arguments)
     net_cmd_dispatcher = {
-        'HI': net_cmd_hi,  # handshake
-        'ID': net_cmd_id,  # client version
-        'CH': net_cmd_ch,  # keepalive
-        'askchaa': net_cmd_askchaa,  # ask for list lengths
-        'askchar2': net_cmd_askchar2,  # ask for list of characters
-        'AN': net_cmd_an,  # character list
-        'AE': net_cmd_ae,  # evidence list
-        'AM': net_cmd_am,  # music list
-        'RC': net_cmd_rc,  # AO2 character list
-        'RM': net_cmd_rm,  # AO2 music list
-        'RD': net_cmd_rd,  # AO2 done request, charscheck etc.
-        'CC': net_cmd_cc,  # select character
-        'MS': net_cmd_ms,  # IC message
-        'CT': net_cmd_ct,  # OOC message
-        'MC': net_cmd_mc,  # play song
-        'RT': net_cmd_rt,  # WT/CE buttons
-        'HP': net_cmd_hp,  # penalties
-        'PE': net_cmd_pe,  # add evidence
-        'DE': net_cmd_de,  # delete evidence
-        'EE': net_cmd_ee,  # edit evidence
-        'ZZ': net_cmd_zz,  # call mod button
-        'opKICK': net_cmd_opKICK,  # /kick with guard on
-        'opBAN': net_cmd_opBAN,  # /ban with guard on
+        'HI': (net_cmd_hi, compile_schema(ArgType.STR, needs_auth=False)),  # handshake
+        'ID': (net_cmd_id, None),  # client version
+        'CH': (net_cmd_ch, None),  # keepalive
+        'askchaa': (net_cmd_askchaa, None),  # ask for list lengths
+        'askchar2': (net_cmd_askchar2, None),  # ask for list of characters
+        'AN': (net_cmd_an, compile_schema(ArgType.INT, needs_auth=False)),  # character list
+        'AE': (net_cmd_ae, None),  # evidence list
+        'AM': (net_cmd_am, compile_schema(ArgType.INT, needs_auth=False)),  # music list
+        'RC': (net_cmd_rc, None),  # AO2 character list
+        'RM': (net_cmd_rm, None),  # AO2 music list
+        'RD': (net_cmd_rd, None),  # AO2 done request, charscheck etc.
+        'CC': (net_cmd_cc, compile_schema(ArgType.INT, ArgType.INT, ArgType.STR, needs_auth=False)),  # select character
+        # IC message
+        'MS': (net_cmd_ms, compile_schema((ArgType.STR, ('chat', '0', '1')),  # msg_type
+                                          ArgType.STR_OR_EMPTY,  # pre
+                                          ArgType.STR,  # folder
+                                          ArgType.STR,  # anim
+                                          ArgType.STR,  # text
+                                          ArgType.STR,  # pos
+                                          ArgType.STR,  # sfx
+                                          (ArgType.INT, (0, 1, 2, 5, 6)),  # anim_type
+                                          ArgType.INT,  # cid
+                                          ArgType.UINT,  # sfx_delay
+                                          (ArgType.INT, (0, 1, 2, 3, 4)),  # button
+                                          ArgType.UINT,  # evidence
+                                          ArgType.INT,  # flip
+                                          (ArgType.INT, (0, 1)),  # ding
+                                          (ArgType.INT, (0, 1, 2, 3, 4, 5, 6)))),  # color
+        'CT': (net_cmd_ct, None),  # OOC message
+        'MC': (net_cmd_mc, None),  # play song
+        'RT': (net_cmd_rt, compile_schema((ArgType.STR, ('testimony1', 'testimony2')))),  # WT/CE buttons
+        'HP': (net_cmd_hp, compile_schema(ArgType.INT, ArgType.INT)),  # penalties
+        'PE': (net_cmd_pe, None),  # add evidence
+        'DE': (net_cmd_de, None),  # delete evidence
+        'EE': (net_cmd_ee, None),  # edit evidence
+        'ZZ': (net_cmd_zz, None),  # call mod button
+        'opKICK': (net_cmd_opKICK, None),  # /kick with guard on
+        'opBAN': (net_cmd_opBAN, None),  # /ban with guard on
     }
@@ -14,14 +14,15 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
-import asyncio
 import random
 import time
 
 import yaml
 
+from server.database import STATUS_BUCKETS
 from server.evidence import EvidenceList
 from server.exceptions import AreaError
+from server.packet import Packet
 
 
 class AreaManager:
@@ -37,12 +38,14 @@ class AreaManager:
             self.bg_lock = bg_lock
             self.server = server
             self.basement = basement
-            self.music_looper = None
+            # key of this area's music loop timer
+            self.music_looper = ('music', area_id)
             self.next_message_time = 0
             self.hp_def = 10
             self.hp_pro = 10
             self.doc = 'No document.'
             self.status = 'IDLE'
+            self.status_bucket = STATUS_BUCKETS[self.status]
             self.judgelog = []
             self.current_music = ''
             self.current_music_player = ''
@@ -55,6 +58,11 @@ class AreaManager:
             self.cards = dict()
             self.shadow_status = {}
             self.last_talked = None
+            # clients that picked a character, by char_id, and the
+            # CharsCheck vector (-1 taken, 0 free) kept in step with it
+            self.char_clients = {}
+            self.chars_check = []
+            self.chars_check_packet = None
 
             """
             #debug
@@ -67,9 +75,13 @@ class AreaManager:
 
         def new_client(self, client):
             self.clients.add(client)
+            self.char_changed(client, -1)
 
         def remove_client(self, client):
             self.clients.remove(client)
+            if self.char_clients.get(client.char_id) is client:
+                del self.char_clients[client.char_id]
+                self.set_char_taken(client.char_id, False)
             if client.is_cm:
                 client.is_cm = False
                 self.owned = False
@@ -81,18 +93,76 @@ class AreaManager:
             self.invite_list = {}
             self.send_host_message('This area is open now.')
 
+        def char_changed(self, client, old_char_id):
+            """ Moves a client in the character index after it joined or
+            changed its char_id.
+
+            :param client: client in this area
+            :param old_char_id: char_id the client had before
+            """
+            if old_char_id != -1 and self.char_clients.get(old_char_id) is client:
+                del self.char_clients[old_char_id]
+                self.set_char_taken(old_char_id, False)
+            if client.char_id != -1:
+                self.char_clients[client.char_id] = client
+                self.set_char_taken(client.char_id, True)
+
+        def set_char_taken(self, char_id, taken):
+            if len(self.chars_check) != len(self.server.char_list):
+                self.build_chars_check()
+            else:
+                self.chars_check[char_id] = -1 if taken else 0
+            self.chars_check_packet = None
+
+        def build_chars_check(self):
+            self.chars_check = [0] * len(self.server.char_list)
+            for char_id in self.char_clients:
+                self.chars_check[char_id] = -1
+
+        def get_chars_check_packet(self):
+            if len(self.chars_check) != len(self.server.char_list):
+                self.build_chars_check()
+                self.chars_check_packet = None
+            if self.chars_check_packet is None:
+                self.chars_check_packet = Packet('CharsCheck', *self.chars_check)
+            return self.chars_check_packet
+
+        def get_char_client(self, char_id):
+            return self.char_clients.get(char_id)
+
         def is_char_available(self, char_id):
-            return char_id not in [x.char_id for x in self.clients]
+            return char_id not in self.char_clients
 
         def get_rand_avail_char_id(self):
-            avail_set = set(range(len(self.server.char_list))) - set([x.char_id for x in self.clients])
-            if len(avail_set) == 0:
+            char_cnt = len(self.server.char_list)
+            if len(self.char_clients) >= char_cnt:
                 raise AreaError('No available characters.')
-            return random.choice(tuple(avail_set))
+            # most areas have far more free characters than taken ones
+            for _ in range(8):
+                char_id = random.randrange(char_cnt)
+                if char_id not in self.char_clients:
+                    return char_id
+            return random.choice([x for x in range(char_cnt) if x not in self.char_clients])
 
         def send_command(self, cmd, *args):
+            if cmd == 'MS':
+                self.send_ms(args)
+                return
+            packet = Packet(cmd, *args)
             for c in self.clients:
-                c.send_command(cmd, *args)
+                c.send_packet(packet)
+
+        def send_ms(self, args):
+            # the evidence id is translated per client, so share one packet
+            # between every client that sees the same local id
+            packets = {}
+            for c in self.clients:
+                evi_num = c.get_local_evidence_id(args[11])
+                packet = packets.get(evi_num)
+                if packet is None:
+                    packet = Packet('MS', *args[:11], evi_num, *args[12:])
+                    packets[evi_num] = packet
+                c.send_packet(packet)
 
         def send_host_message(self, msg):
             self.send_command('CT', self.server.config['hostname'], msg)
@@ -113,11 +183,10 @@ class AreaManager:
 
         def play_music(self, name, cid, length=-1):
             self.send_command('MC', name, cid)
-            if self.music_looper:
-                self.music_looper.cancel()
             if length > 0:
-                self.music_looper = asyncio.get_event_loop().call_later(length,
-                                                                        lambda: self.play_music(name, -1, length))
+                self.server.timers.schedule(self.music_looper, length, self.play_music, name, -1, length)
+            else:
+                self.server.timers.cancel(self.music_looper)
 
         def can_send_message(self, client):
             if self.is_locked and not client.is_mod and not client.ipid in self.invite_list:
@@ -137,7 +206,7 @@ class AreaManager:
             self.send_command('HP', side, val)
 
         def change_background(self, bg):
-            if bg.lower() not in (name.lower() for name in self.server.backgrounds):
+            if self.server.get_background(bg) is None:
                 raise AreaError('Invalid background name.')
             self.background = bg
             self.send_command('BN', self.background)
@@ -147,6 +216,7 @@ class AreaManager:
             if value.lower() not in allowed_values:
                 raise AreaError('Invalid status. Possible values: {}'.format(', '.join(allowed_values)))
             self.status = value.upper()
+            self.status_bucket = STATUS_BUCKETS.get(self.status)
 
         def change_doc(self, doc='No document.'):
             self.doc = doc
@@ -183,11 +253,14 @@ class AreaManager:
         self.server = server
         self.cur_id = 0
         self.areas = []
+        self.area_index = {}
+        self.area_ids = {}
         self.load_areas()
 
     def load_areas(self):
         with open('config/areas.yaml', 'r') as chars:
             areas = yaml.load(chars)
+        loaded = []
         for item in areas:
             if 'evidence_mod' not in item:
                 item['evidence_mod'] = 'FFA'
@@ -195,25 +268,29 @@ class AreaManager:
                 item['locking_allowed'] = False
             if 'iniswap_allowed' not in item:
                 item['iniswap_allowed'] = True
-            self.areas.append(
+            loaded.append(
                 self.Area(self.cur_id, self.server, item['area'], item['background'], item['bglock'],
                           item['basement'], item['evidence_mod'], item['locking_allowed'], item['iniswap_allowed']))
             self.cur_id += 1
+        area_index = {}
+        for area in loaded:
+            area_index.setdefault(str(area.name).casefold(), area)
+        self.areas, self.area_index, self.area_ids = loaded, area_index, {area.id: area for area in loaded}
 
     def default_area(self):
         return self.areas[0]
 
     def get_area_by_name(self, name):
-        for area in self.areas:
-            if area.name == name:
-                return area
-        raise AreaError('Area not found.')
+        try:
+            return self.area_index[name.casefold()]
+        except KeyError:
+            raise AreaError('Area not found.')
 
     def get_area_by_id(self, num):
-        for area in self.areas:
-            if area.id == num:
-                return area
-        raise AreaError('Area not found.')
+        try:
+            return self.area_ids[num]
+        except KeyError:
+            raise AreaError('Area not found.')
 
     def mods_online(self):
         num = 0
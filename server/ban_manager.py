@@ -25,6 +25,8 @@ from server.exceptions import ServerError
 class BanManager:
     def __init__(self):
         self.bans = {}
+        # called with (ipid, banned) whenever a ban is added or removed
+        self.ban_listeners = []
         self.load_banlist()
         self.hdid_exempt = {}
         self.load_hdidexceptions()
@@ -47,8 +49,12 @@ class BanManager:
         except AttributeError:
             raise ServerError('Argument must be an 12-digit number.')
         if x == 12:
+            was_banned = self.is_banned(ip)
             self.bans[ip] = True
             self.write_banlist()
+            if not was_banned:
+                for listener in self.ban_listeners:
+                    listener(ip, True)
 
     def remove_ban(self, client, ip):
         try:
@@ -60,8 +66,11 @@ class BanManager:
         except ValueError:
             if not len(ip) == 12:
                 raise ServerError('Argument must be an IP address or 10-digit number.')
-        del self.bans[ip]
+        was_banned = self.bans.pop(ip)
         self.write_banlist()
+        if was_banned:
+            for listener in self.ban_listeners:
+                listener(ip, False)
 
     def is_banned(self, ipid):
         try:
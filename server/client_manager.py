@@ -15,6 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 import re
 import time
 import random
@@ -23,13 +24,15 @@ from heapq import heappop, heappush
 from server import logger
 from server.constants import TargetType
 from server.exceptions import ClientError, AreaError
+from server.packet import encode_command
 
 
 class ClientManager:
     class Client:
-        def __init__(self, server, transport, user_id, ipid):
+        def __init__(self, server, transport, user_id, ipid, ipreal):
             self.is_checked = False
             self.transport = transport
+            self.ipreal = ipreal
             self.hdid = ''
             self.pm_mute = False
             self.id = user_id
@@ -59,6 +62,10 @@ class ClientManager:
             self.voting_at = 0
             self.is_checked = False
             self.websocket = None
+            self.send_buffer = []
+            self.write_paused = False
+            self.send_queue = []
+            self.queued_bytes = 0
 
             # flood-guard stuff
             self.mus_counter = 0
@@ -71,23 +78,104 @@ class ClientManager:
                               range(self.server.config['wtce_floodguard']['times_per_interval'])]
 
         def send_raw_message(self, msg):
+            self.send_raw_bytes(msg.encode('utf-8'))
+
+        def send_raw_bytes(self, data, droppable=False):
             if self.websocket:
-                self.websocket.send_text(msg.encode('utf-8'))
+                self.write(self.websocket.frame(data), droppable and self.websocket.compressor is None)
             else:
-                self.transport.write(msg.encode('utf-8'))
+                self.write(data, droppable)
 
-        def send_command(self, command, *args):
-            if args:
-                if command == 'MS':
-                    for evi_num in range(len(self.evi_list)):
-                        if self.evi_list[evi_num] == args[11]:
-                            lst = list(args)
-                            lst[11] = evi_num
-                            args = tuple(lst)
-                            break
-                self.send_raw_message('{}#{}#%'.format(command, '#'.join([str(x) for x in args])))
+        def send_packet(self, packet):
+            droppable = packet.command in self.server.client_manager.drop_commands
+            if self.websocket:
+                # with context takeover every frame depends on the ones before it, so none may be shed
+                self.write(self.websocket.packet_frame(packet), droppable and self.websocket.compressor is None)
             else:
-                self.send_raw_message('{}#%'.format(command))
+                self.write(packet.raw, droppable)
+
+        def write(self, data, droppable=False):
+            if self.write_paused:
+                self.enqueue(data, droppable)
+                return
+            # corked until the end of the current event loop iteration
+            if not self.send_buffer:
+                self.server.client_manager.schedule_flush(self)
+            self.send_buffer.append((data, droppable))
+
+        def flush(self):
+            buf = self.send_buffer
+            if not buf:
+                return
+            self.send_buffer = []
+            if self.transport.is_closing():
+                return
+            if self.write_paused:
+                for data, droppable in buf:
+                    self.enqueue(data, droppable)
+            elif len(buf) == 1:
+                self.transport.write(buf[0][0])
+            else:
+                self.transport.writelines([data for data, _ in buf])
+
+        def enqueue(self, data, droppable):
+            """ Holds data back while the transport is over its high-water mark.
+
+            :param data: bytes to send once the transport drains
+            :param droppable: whether the data may be discarded to make room
+            """
+            if self.transport.is_closing():
+                return
+            self.send_queue.append((data, droppable))
+            self.queued_bytes += len(data)
+            if self.queued_bytes > self.server.client_manager.max_queue:
+                self.shed_queue()
+
+        def shed_queue(self):
+            """ Makes room in an overfull send queue, first by dropping
+            low-priority packets and then by disconnecting the client.
+            """
+            stats = self.server.client_manager.net_stats
+            kept = [entry for entry in self.send_queue if not entry[1]]
+            dropped = len(self.send_queue) - len(kept)
+            if dropped:
+                stats['dropped'] += dropped
+                self.send_queue = kept
+                self.queued_bytes = sum(len(data) for data, _ in kept)
+            if self.queued_bytes > self.server.client_manager.max_queue:
+                stats['evicted'] += 1
+                logger.log_server('Disconnected slow client, {} bytes queued.'.format(self.queued_bytes), self)
+                self.send_queue = []
+                self.queued_bytes = 0
+                self.transport.abort()
+
+        def pause_writing(self):
+            self.write_paused = True
+            self.server.client_manager.net_stats['paused'] += 1
+
+        def resume_writing(self):
+            self.write_paused = False
+            queue = self.send_queue
+            if not queue:
+                return
+            self.send_queue = []
+            self.queued_bytes = 0
+            self.transport.writelines([data for data, _ in queue])
+
+        def send_command(self, command, *args):
+            if command == 'MS' and args:
+                evi_num = self.get_local_evidence_id(args[11])
+                if evi_num != args[11]:
+                    lst = list(args)
+                    lst[11] = evi_num
+                    args = tuple(lst)
+            self.send_raw_bytes(encode_command(command, args), command in self.server.client_manager.drop_commands)
+
+        def get_local_evidence_id(self, evi_id):
+            for evi_num in range(len(self.evi_list)):
+                if self.evi_list[evi_num] == evi_id:
+                    return evi_num
+            return evi_id
 
         def send_host_message(self, msg):
             self.send_command('CT', self.server.config['hostname'], msg)
@@ -104,7 +192,7 @@ class ClientManager:
             name_ws = name.replace(' ', '')
             if not name_ws or name_ws.isdigit():
                 return False
-            for client in self.server.client_manager.clients:
+            for client in self.server.client_manager.by_name.get(name.lower().strip(), ()):
                 if client.name == name:
                     return False
             return True
@@ -114,6 +202,7 @@ class ClientManager:
             self.disconnect()
 
         def disconnect(self):
+            self.flush()
             self.transport.close()
 
         def change_character(self, char_id, force=False):
@@ -121,13 +210,11 @@ class ClientManager:
                 raise ClientError('Invalid Character ID.')
             if not self.area.is_char_available(char_id):
                 if force:
-                    for client in self.area.clients:
-                        if client.char_id == char_id:
-                            client.char_select()
+                    self.area.get_char_client(char_id).char_select()
                 else:
                     raise ClientError('Character not available.')
             old_char = self.get_char_name()
-            self.char_id = char_id
+            self.set_char_id(char_id)
             self.pos = ''
             self.send_command('PV', self.id, 'CID', self.char_id)
             logger.log_server('[{}]Changed character from {} to {}.'
@@ -276,11 +363,7 @@ class ClientManager:
             self.send_host_message(info)
 
         def send_done(self):
-            avail_char_ids = set(range(len(self.server.char_list))) - set([x.char_id for x in self.area.clients])
-            char_list = [-1] * len(self.server.char_list)
-            for x in avail_char_ids:
-                char_list[x] = 0
-            self.send_command('CharsCheck', *char_list)
+            self.send_packet(self.area.get_chars_check_packet())
             self.send_command('HP', 1, self.area.hp_def)
             self.send_command('HP', 2, self.area.hp_pro)
             self.send_command('BN', self.area.background)
@@ -289,9 +372,28 @@ class ClientManager:
             self.send_command('DONE')
 
         def char_select(self):
-            self.char_id = -1
+            self.set_char_id(-1)
             self.send_done()
 
+        def set_char_id(self, char_id):
+            old_char_id = self.char_id
+            old_char_name = self.get_char_name()
+            self.char_id = char_id
+            self.area.char_changed(self, old_char_id)
+            self.server.client_manager.reindex(self, self.server.client_manager.by_char, old_char_name.lower(),
+                                               self.get_char_name().lower())
+
+        def set_name(self, name):
+            old_name = self.name
+            self.name = name
+            self.server.client_manager.reindex(self, self.server.client_manager.by_name, old_name.lower().strip(),
+                                               name.lower().strip())
+
+        def set_hdid(self, hdid):
+            old_hdid = self.hdid
+            self.hdid = hdid
+            self.server.client_manager.reindex(self, self.server.client_manager.by_hdid, old_hdid, hdid)
+
         def auth_mod(self, password):
             if self.is_mod:
                 raise ClientError('Already logged in.')
@@ -304,7 +406,7 @@ class ClientManager:
             return self.ipid
 
         def get_ipreal(self):
-            return self.transport.get_extra_info('peername')[0]
+            return self.ipreal
 
         def get_char_name(self):
             if self.char_id == -1:
@@ -336,52 +438,114 @@ class ClientManager:
         self.server = server
         self.cur_id = [i for i in range(self.server.config['playerlimit'])]
         self.clients_list = []
+        self.pending_flush = []
+        self.flush_handle = None
+        send_queue = self.server.config['send_queue']
+        self.high_water = send_queue['high_water']
+        self.low_water = send_queue['low_water']
+        self.max_queue = send_queue['max_queue']
+        self.drop_commands = frozenset(send_queue['drop_commands'])
+        self.net_stats = {'paused': 0, 'dropped': 0, 'evicted': 0}
+        # indexes for get_targets; all but by_id map a key to the set of
+        # clients with it, empty names and HDIDs are left out
+        self.by_id = {}
+        self.by_ip = {}
+        self.by_ipid = {}
+        self.by_hdid = {}
+        self.by_name = {}
+        self.by_char = {}
 
     def new_client(self, transport):
-        c = self.Client(self.server, transport, heappop(self.cur_id),
-                        self.server.get_ipid(transport.get_extra_info('peername')[0]))
+        ipreal = transport.get_extra_info('peername')[0]
+        c = self.Client(self.server, transport, heappop(self.cur_id), self.server.get_ipid(ipreal), ipreal)
+        transport.set_write_buffer_limits(self.high_water, self.low_water)
         self.clients.add(c)
+        self.by_id[c.id] = c
+        self.reindex(c, self.by_ip, '', ipreal.lower())
+        self.reindex(c, self.by_ipid, '', c.ipid)
+        self.reindex(c, self.by_char, '', c.get_char_name().lower())
         return c
 
     def remove_client(self, client):
         heappush(self.cur_id, client.id)
         self.clients.remove(client)
+        del self.by_id[client.id]
+        self.reindex(client, self.by_ip, client.ipreal.lower(), '')
+        self.reindex(client, self.by_ipid, client.ipid, '')
+        self.reindex(client, self.by_hdid, client.hdid, '')
+        self.reindex(client, self.by_name, client.name.lower().strip(), '')
+        self.reindex(client, self.by_char, client.get_char_name().lower(), '')
+        client.send_buffer = []
+        client.send_queue = []
+        client.queued_bytes = 0
+
+    def schedule_flush(self, client):
+        self.pending_flush.append(client)
+        if self.flush_handle is None:
+            self.flush_handle = asyncio.get_event_loop().call_soon(self.flush_clients)
+
+    def flush_clients(self):
+        """ Writes out everything the clients were sent during the last
+        event loop iteration, with one transport write per client.
+        """
+        self.flush_handle = None
+        pending = self.pending_flush
+        self.pending_flush = []
+        for client in pending:
+            client.flush()
+
+    @staticmethod
+    def reindex(client, index, old_key, new_key):
+        """ Moves a client from one key of an index to another.
+
+        :param client: client
+        :param index: one of the by_* dicts
+        :param old_key: key it was under, '' if none
+        :param new_key: key it is under now, '' if none
+        """
+        if old_key == new_key:
+            return
+        if old_key:
+            clients = index.get(old_key)
+            if clients is not None:
+                clients.discard(client)
+                if not clients:
+                    del index[old_key]
+        if new_key:
+            index.setdefault(new_key, set()).add(client)
 
     def get_targets(self, client, key, value, local=False):
         # possible keys: ip, OOC, id, cname, ipid, hdid
-        areas = None
-        if local:
-            areas = [client.area]
-        else:
-            areas = client.server.area_manager.areas
-        targets = []
         if key == TargetType.ALL:
-            for nkey in range(6):
+            targets = []
+            for nkey in (TargetType.IP, TargetType.OOC_NAME, TargetType.ID, TargetType.CHAR_NAME, TargetType.IPID,
+                         TargetType.HDID):
                 targets += self.get_targets(client, nkey, value, local)
-        for area in areas:
-            for client in area.clients:
-                if key == TargetType.IP:
-                    if value.lower().startswith(client.get_ipreal().lower()):
-                        targets.append(client)
-                elif key == TargetType.OOC_NAME:
-                    if value.lower().strip() == client.name.lower().strip() and client.name:
-                        targets.append(client)
-                elif key == TargetType.CHAR_NAME:
-                    if value.lower() == client.get_char_name().lower():
-                        targets.append(client)
-                elif key == TargetType.ID:
-                    try:
-                        if client.id == int(value):
-                            targets.append(client)
-                    except(ValueError):
-                        pass
-                elif key == TargetType.IPID:
-                    if client.ipid == value:
-                        targets.append(client)
-                elif key == TargetType.HDID:
-                    if value == client.hdid:
-                        targets.append(client)
-        return targets
+            return targets
+        if key == TargetType.IP:
+            # matches clients whose IP is a prefix of the value
+            value = value.lower()
+            found = set()
+            for end in range(1, len(value) + 1):
+                found.update(self.by_ip.get(value[:end], ()))
+        elif key == TargetType.OOC_NAME:
+            found = self.by_name.get(value.lower().strip(), ())
+        elif key == TargetType.CHAR_NAME:
+            found = self.by_char.get(value.lower(), ())
+        elif key == TargetType.ID:
+            try:
+                found = [self.by_id[int(value)]] if int(value) in self.by_id else []
+            except ValueError:
+                found = []
+        elif key == TargetType.IPID:
+            found = self.by_ipid.get(value, ())
+        elif key == TargetType.HDID:
+            found = self.by_hdid.get(value, ())
+        else:
+            found = ()
+        if local:
+            return [target for target in found if target.area == client.area]
+        return list(found)
 
     def get_muted_clients(self):
         clients = []
@@ -17,10 +17,12 @@
 # possible keys: ip, OOC, id, cname, ipid, hdid
 import hashlib
 import random
+import re
 import string
 
 from server import logger
 from server.constants import TargetType
+from server.eventlog import parse_query, format_event
 from server.exceptions import ClientError, ServerError, ArgumentError, AreaError
 
 targetreturntype = {
@@ -597,14 +599,11 @@ def ooc_cmd_pm(client, arg):
     msg = ' '.join(args[ooc_name:])
     if not msg:
         raise ArgumentError('Not enough arguments. Use /pm <target>: <message>.')
-    for char_name in client.server.char_list:
-        if namedrop.lower() == char_name.lower():
-            try:
-                c = client.server.client_manager.get_targets(client, TargetType.CHAR_NAME, char_name, True)
-            except Exception as n:
-                client.send_host_message('{}'.format(n))
-            if c:
-                target_clients += c
+    try:
+        char_name = client.server.char_list[client.server.get_char_id_by_name(namedrop)]
+        target_clients = client.server.client_manager.get_targets(client, TargetType.CHAR_NAME, char_name, True)
+    except ServerError:
+        pass
     if not target_clients:
         try:
             target_clients = client.server.client_manager.get_targets(client, TargetType.OOC_NAME, namedrop, False)
@@ -1168,6 +1167,102 @@ def ooc_cmd_refresh(client, arg):
             raise
 
 
+def ooc_cmd_netstats(client, arg):
+    if not client.is_mod:
+        raise ClientError('You must be authorized to do that.')
+    if len(arg) != 0:
+        raise ArgumentError('This command does not take any arguments.')
+    stats = client.server.client_manager.net_stats
+    paused = [c for c in client.server.client_manager.clients if c.write_paused]
+    msg = '== Network Stats =='
+    msg += '\r\nWrites paused: {} times, {} clients now'.format(stats['paused'], len(paused))
+    msg += '\r\nQueued: {} bytes'.format(sum(c.queued_bytes for c in paused))
+    msg += '\r\nDropped packets: {}'.format(stats['dropped'])
+    msg += '\r\nSlow clients disconnected: {}'.format(stats['evicted'])
+    rejected = client.server.connection_limiter.rejected
+    msg += '\r\nConnections refused: {} server full, {} per-IP limit, {} rate limit'.format(
+        rejected['full'], rejected['per_ip'], rejected['rate'])
+    log_stats = logger.get_log_stats()
+    msg += '\r\nLog queue: {}/{} records, {} written, {} dropped'.format(
+        log_stats['depth'], log_stats['size'], log_stats['written'], log_stats['dropped'])
+    client.send_host_message(msg)
+
+
+def ooc_cmd_stats(client, arg):
+    if not client.is_mod:
+        raise ClientError('You must be authorized to do that.')
+    args = arg.split()
+    usage = 'Usage: /stats top <chars|songs|areas> [period] or /stats hours [area id] [period], ' \
+            'where period is like 24h or 7d.'
+    hours = 7 * 24
+    if args and re.fullmatch(r'\d+[hd]', args[-1].lower()):
+        period = args.pop().lower()
+        hours = int(period[:-1]) * (24 if period.endswith('d') else 1)
+        if hours < 1:
+            raise ArgumentError(usage)
+    stats = client.server.stats_manager
+    if len(args) == 2 and args[0].lower() == 'top' and args[1].lower() in ('chars', 'songs', 'areas'):
+        what = args[1].lower()
+        if what == 'areas':
+            future, covered = stats.top_activity('char', 'area', hours)
+        else:
+            future, covered = stats.top_activity('char' if what == 'chars' else 'music', 'name', hours)
+        title = '== Top {} (last {}h) =='.format(what, covered)
+    elif 1 <= len(args) <= 2 and args[0].lower() == 'hours':
+        area_id = None
+        if len(args) == 2:
+            try:
+                area_id = int(args[1])
+            except ValueError:
+                raise ArgumentError(usage)
+        future = stats.activity_by_hour(hours, area_id)
+        what = 'hours'
+        title = '== IC messages by hour, UTC (last {}h) =='.format(min(hours, stats.hourly_days * 24))
+    else:
+        raise ArgumentError(usage)
+
+    def send_result(f):
+        if f.cancelled() or f.exception() is not None:
+            client.send_host_message('Could not read the statistics.')
+            return
+        msg = title
+        for key, count in f.result():
+            if what == 'areas':
+                try:
+                    key = client.server.area_manager.get_area_by_id(key).name
+                except AreaError:
+                    key = 'Area {}'.format(key)
+            elif what == 'hours':
+                key = '{:02}:00'.format(key)
+            msg += '\r\n{}: {}'.format(key, count)
+        client.send_host_message(msg)
+
+    future.add_done_callback(send_result)
+
+
+def ooc_cmd_logsearch(client, arg):
+    if not client.is_mod:
+        raise ClientError('You must be authorized to do that.')
+    if len(arg) == 0:
+        raise ArgumentError('Usage: /logsearch <filters>, e.g. /logsearch type=ic ipid=X area=3 last=2h')
+    future = client.server.event_log.search(parse_query(arg))
+
+    def send_result(f):
+        if f.cancelled() or f.exception() is not None:
+            client.send_host_message('Could not search the event log.')
+            return
+        rows = f.result()
+        if not rows:
+            client.send_host_message('No matching events.')
+            return
+        msg = '== Events (UTC) =='
+        for row in rows:
+            msg += '\r\n' + format_event(row)
+        client.send_host_message(msg)
+
+    future.add_done_callback(send_result)
+
+
 def ooc_cmd_judgelog(client, arg):
     if not client.is_mod:
         raise ClientError('You must be authorized to do that.')
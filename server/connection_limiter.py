@@ -0,0 +1,120 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import ipaddress
+import time
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated = now
+
+
+class ConnectionLimiter:
+    """
+    Decides whether a new connection may become a client, before anything
+    is set up for it. Enforces the player limit, a cap on concurrent
+    connections per IP, and token buckets that limit how fast new
+    connections are accepted from one IP and from its subnet (/24 for
+    IPv4, /64 for IPv6). Addresses listed in exempt, such as a load test
+    running locally, are only held to the player limit.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        config = server.config['connection_limits']
+        self.per_ip = config['per_ip']
+        self.ip_rate = config['ip_rate']
+        self.ip_burst = config['ip_burst']
+        self.subnet_rate = config['subnet_rate']
+        self.subnet_burst = config['subnet_burst']
+        self.exempt = frozenset(config['exempt'] or ())
+        self.connections = {}
+        self.ip_buckets = {}
+        self.subnet_buckets = {}
+        self.rejected = {'full': 0, 'per_ip': 0, 'rate': 0}
+        self.server.timers.schedule(self, 60, self.prune)
+
+    def admit(self, ip):
+        """ Checks a new connection and counts it if it is let in.
+
+        :param ip: remote address
+        :return: True if the connection may proceed
+        """
+        if self.server.get_player_count() >= self.server.config['playerlimit']:
+            self.rejected['full'] += 1
+            return False
+        if ip in self.exempt:
+            self.connections[ip] = self.connections.get(ip, 0) + 1
+            return True
+        if self.connections.get(ip, 0) >= self.per_ip:
+            self.rejected['per_ip'] += 1
+            return False
+        now = time.monotonic()
+        ip_bucket = self.refill(self.ip_buckets, ip, self.ip_rate, self.ip_burst, now)
+        subnet_bucket = self.refill(self.subnet_buckets, self.get_subnet(ip), self.subnet_rate, self.subnet_burst, now)
+        if ip_bucket.tokens < 1 or subnet_bucket.tokens < 1:
+            self.rejected['rate'] += 1
+            return False
+        ip_bucket.tokens -= 1
+        subnet_bucket.tokens -= 1
+        self.connections[ip] = self.connections.get(ip, 0) + 1
+        return True
+
+    def release(self, ip):
+        """ Forgets a connection that was admitted.
+
+        :param ip: remote address
+        """
+        count = self.connections.get(ip, 0) - 1
+        if count > 0:
+            self.connections[ip] = count
+        else:
+            self.connections.pop(ip, None)
+
+    @staticmethod
+    def refill(buckets, key, rate, burst, now):
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(burst, now)
+        else:
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+        return bucket
+
+    @staticmethod
+    def get_subnet(ip):
+        if '.' in ip:
+            # IPv4, or IPv4 mapped into IPv6
+            return ip.rsplit('.', 1)[0]
+        try:
+            return ipaddress.ip_address(ip).exploded[:19]
+        except ValueError:
+            return ip
+
+    def prune(self):
+        """ Drops buckets that have refilled completely, they are the same as new ones. """
+        now = time.monotonic()
+        for buckets, rate, burst in ((self.ip_buckets, self.ip_rate, self.ip_burst),
+                                     (self.subnet_buckets, self.subnet_rate, self.subnet_burst)):
+            full = [key for key, bucket in buckets.items() if bucket.tokens + (now - bucket.updated) * rate >= burst]
+            for key in full:
+                del buckets[key]
+        self.server.timers.schedule(self, 60, self.prune)
@@ -1,17 +1,66 @@
 import yaml
 import os
-import copy
+import queue
+from collections import OrderedDict
+from concurrent.futures import Future
+import asyncio
+import functools
 import sqlite3
+import threading
+import time
+
+from server import logger
 
 
 DATABASE_NAME = "storage/stats/aov_database.db"
 
-class Database:
+# talking and music are counted per group of area statuses
+IDLE, BUILD_RECESS, CASING = range(3)
+STATUS_BUCKETS = {
+    'IDLE': IDLE,
+    'BUILDING-OPEN': BUILD_RECESS,
+    'BUILDING-FULL': BUILD_RECESS,
+    'RECESS': BUILD_RECESS,
+    'CASING-OPEN': CASING,
+    'CASING-FULL': CASING,
+}
 
+class Database:
+    """
+    Keeps the statistics in memory. Records that changed since the last
+    save are remembered in dirty sets, and save_alldata hands just those
+    rows to a writer thread, which writes them in one transaction.
+
+    Character and music records are all loaded at startup. User records are
+    loaded when the user connects or is looked up, and kept in an LRU cache
+    of stats_user_cache entries. A connecting user is read on the writer
+    thread, and its connections are kept in loading until the row is there.
+    An evicted record whose changes have not been written yet is held in
+    evicted until the writer has committed them, so that loading it again
+    never reads a stale row.
+
+    Activity (IC messages per character, songs played) is also counted per
+    hour and area in activity. Each save adds those counts to the
+    activity_hourly table, and once a day has passed its hours are rolled
+    up into activity_daily. Hourly rows are kept for hourly_days days.
+    """
+    hourly_days = 14
 
     def __init__(self, server):
         self.server = server
+        self.dirty_chars = set()
+        self.dirty_music = set()
+        self.dirty_users = set()
+        self.user_cache_size = server.config['stats_user_cache']
+        self.evicted = {}
+        self.loading = {}
+        self.generation = 0
+        self.activity = {}
         self.setup_database()
+        self.conn = sqlite3.connect(DATABASE_NAME)
+        rolled_day = self.conn.execute('SELECT MAX(day) FROM activity_daily').fetchone()[0]
+        self.rolled_day = -1 if rolled_day is None else rolled_day
+        self.writer = DatabaseWriter(DATABASE_NAME)
 
     def setup_database(self):
         try:
@@ -27,10 +76,9 @@ class Database:
         self.initialize_database()
         self.char_data = self.make_char_database()
         self.music_data = self.make_music_database()
-        self.user_data = self.make_user_database()
+        self.user_data = OrderedDict()
         self.check_char_list()
         self.check_music_list()
-        self.check_user_list()
 
     def initialize_database(self):
         conn = sqlite3.connect(DATABASE_NAME)
@@ -44,8 +92,7 @@ class Database:
         if char:
             char_arr = []
             for cid, cdata in char.items():
-                char_arr.append((cdata.id, cdata.name, cdata.data["picked"], cdata.data["times_talked_idle"],
-                                 cdata.data["times_talked_build_recess"], cdata.data["times_talked_casing"]))
+                char_arr.append(cdata.row())
             cur.executemany('INSERT INTO character VALUES (?,?,?,?,?,?)', char_arr)
         try:
             cur.execute(
@@ -58,9 +105,7 @@ class Database:
             music_arr = []
             midc = 0
             for mid, mdata in music.items():
-                music_arr.append((midc, mdata.name, mdata.data["times_played_idle"],
-                                 mdata.data["times_played_build_recess"],
-                                 mdata.data["times_played_casing"]))
+                music_arr.append((midc,) + mdata.row()[1:])
                 midc += 1
             cur.executemany('INSERT INTO music VALUES (?,?,?,?,?)', music_arr)
         try:
@@ -75,12 +120,14 @@ class Database:
         if user:
             user_arr = []
             for uid, udata in user.items():
-                user_arr.append((udata.ipid, udata.data["times_connected"],
-                                 udata.data["times_talked_idle"], udata.data["times_talked_build_recess"],
-                                 udata.data["times_talked_casing"], udata.data["times_kicked"],
-                                  udata.data["times_muted"], udata.data["times_banned"],
-                                  udata.data["times_voted"], udata.data["times_doc"]))
+                user_arr.append(udata.row())
             cur.executemany('INSERT INTO user VALUES (?,?,?,?,?,?,?,?,?,?)', user_arr)
+        cur.execute('CREATE TABLE IF NOT EXISTS activity_hourly (hour INTEGER NOT NULL, area INTEGER NOT NULL, '
+                    'kind TEXT NOT NULL, name TEXT NOT NULL, count INTEGER NOT NULL, '
+                    'PRIMARY KEY (hour, area, kind, name));')
+        cur.execute('CREATE TABLE IF NOT EXISTS activity_daily (day INTEGER NOT NULL, area INTEGER NOT NULL, '
+                    'kind TEXT NOT NULL, name TEXT NOT NULL, count INTEGER NOT NULL, '
+                    'PRIMARY KEY (day, area, kind, name));')
         self.delete_jsons()
         conn.commit()
         conn.close()
@@ -116,12 +163,11 @@ class Database:
         return data
 
     def delete_jsons(self):
-        try:
-            os.remove('storage/stats/user.yaml')
-            os.remove('storage/stats/chars.yaml')
-            os.remove('storage/stats/music.yaml')
-        except FileNotFoundError:
-            return
+        for name in ('user', 'chars', 'music'):
+            try:
+                os.remove('storage/stats/{}.yaml'.format(name))
+            except FileNotFoundError:
+                pass
 
     def make_char_database(self):
         conn = sqlite3.connect(DATABASE_NAME)
@@ -136,11 +182,7 @@ class Database:
             cdata = cur.fetchall()
             fdata = {}
             for chara in cdata:
-                fdata[chara[0]] = charData(chara[0], chara[1].lower())
-                fdata[chara[0]].data["picked"] = chara[2]
-                fdata[chara[0]].data["times_talked_idle"] = chara[3]
-                fdata[chara[0]].data["times_talked_build_recess"] = chara[4]
-                fdata[chara[0]].data["times_talked_casing"] = chara[5]
+                fdata[chara[0]] = charData.from_row(chara)
             conn.close()
             return fdata
 
@@ -157,76 +199,92 @@ class Database:
             mdata = cur.fetchall()
             mfdata = {}
             for music in mdata:
-                mfdata[music[0]] = charData(music[0], music[1].lower())
-                mfdata[music[0]].data["times_played_idle"] = music[2]
-                mfdata[music[0]].data["times_played_build_recess"] = music[3]
-                mfdata[music[0]].data["times_played_casing"] = music[4]
+                record = musicData.from_row(music)
+                mfdata[record.name] = record
             conn.close()
             return mfdata
 
-    def make_user_database(self):
-        conn = sqlite3.connect(DATABASE_NAME)
-        cur = conn.cursor()
-        cur.execute('SELECT count(*) FROM user')
-        count = cur.fetchone()
-        if count[0] == 0:
-            conn.close()
-            return self.create_new_char_database()
+    def get_user(self, ipid):
+        """ Returns the statistics of an IPID, loading them into the cache
+        if they are not there.
+
+        Connected users are loaded by connect_data on the writer thread, so
+        this reads the database on the loop only for users that are not
+        connected, such as the target of an offline ban, or that are still
+        being loaded. That is a primary key lookup, and in WAL mode it does
+        not wait for the writer.
+
+        :param ipid: IPID
+        :return: userData, or None if the IPID has no statistics
+        """
+        record = self.user_data.get(ipid)
+        if record is not None:
+            self.user_data.move_to_end(ipid)
+            return record
+        if ipid in self.evicted:
+            record = self.evicted.pop(ipid)[0]
         else:
-            cur.execute('SELECT * FROM user')
-            usdata = cur.fetchall()
-            udata = {}
-            for user in usdata:
-                udata[user[0]] = userData(user[0])
-                udata[user[0]].data["times_connected"] = user[1]
-                udata[user[0]].data["times_talked_idle"] = user[2]
-                udata[user[0]].data["times_talked_build_recess"] = user[3]
-                udata[user[0]].data["times_talked_casing"] = user[4]
-                udata[user[0]].data["times_kicked"] = user[5]
-                udata[user[0]].data["times_muted"] = user[6]
-                udata[user[0]].data["times_banned"] = user[7]
-                udata[user[0]].data["times_voted"] = user[8]
-                udata[user[0]].data["times_doc"] = user[9]
-            conn.close()
-            return udata
-
+            row = self.conn.execute('SELECT * FROM user WHERE ipid = ?', (ipid,)).fetchone()
+            if ipid in self.loading:
+                # its connections have not been counted yet
+                return self.add_user(ipid, row, self.loading.pop(ipid)[1])
+            if row is None:
+                return None
+            record = userData.from_row(row)
+        self.cache_user(record)
+        return record
+
+    def add_user(self, ipid, row, connects):
+        """ Caches the statistics of a connecting user and counts its
+        connections, creating them if the user is new.
+
+        :param ipid: IPID
+        :param row: its row in the user table, or None
+        :param connects: number of connections to count
+        :return: userData
+        """
+        if row is None:
+            # the first connection is not counted
+            record = userData(ipid)
+            connects -= 1
+        else:
+            record = userData.from_row(row)
+        record.times_connected += connects
+        self.cache_user(record)
+        self.dirty_users.add(record)
+        return record
+
+    def cache_user(self, record):
+        self.user_data[record.ipid] = record
+        while len(self.user_data) > self.user_cache_size:
+            ipid, old = self.user_data.popitem(last=False)
+            # batches up to self.generation may still be queued, and a dirty
+            # record goes out with the next one
+            needed = self.generation + 1 if old in self.dirty_users else self.generation
+            if needed > self.writer.written:
+                self.evicted[ipid] = (old, needed)
 
     def check_char_list(self):
-        for char in self.char_data:
-            obj = self.char_data[char]
-            for index in list(obj.indexes.keys()):
-                if index not in obj.data:
-                    self.char_data[char].data[index] = obj.indexes[index]
-
-
-    def write_music_data(self):
-        data = copy.deepcopy(self.music_data)
-        with open('storage/stats/music.yaml', 'w') as mdata:
-            yaml.dump(data, mdata, default_flow_style = False)
+        for i, ch in enumerate(self.server.char_list):
+            if i not in self.char_data:
+                self.char_data[i] = charData(i, ch.lower())
+                self.dirty_chars.add(self.char_data[i])
 
     def check_music_list(self):
-        for char in self.music_data:
-            obj = self.music_data[char]
-            for index in list(obj.indexes.keys()):
-                if index not in obj.data:
-                    obj.data[index] = obj.indexes[index]
-
-    def check_user_list(self):
-        for char in self.user_data:
-            obj = self.user_data[char]
-            for index in list(obj.indexes.keys()):
-                if index not in obj.data:
-                    obj.data[index] = obj.indexes[index]
-
-    def write_user_data(self):
-        data = copy.deepcopy(self.user_data)
-        with open('storage/stats/user.yaml', 'w') as udata:
-            yaml.dump(data, udata, default_flow_style = False)
+        next_id = max((obj.id for obj in self.music_data.values()), default=-1) + 1
+        for cat in self.server.music_list:
+            for song in cat['songs']:
+                name = song['name'].lower()
+                if name not in self.music_data:
+                    self.music_data[name] = musicData(next_id, name)
+                    self.dirty_music.add(self.music_data[name])
+                    next_id += 1
 
     def create_new_char_database(self):
         data = {}
         for i, ch in enumerate(self.server.char_list):
             data[i] = charData(i, ch.lower())
+        self.dirty_chars.update(data.values())
         return data
 
     def create_new_music_database(self):
@@ -234,144 +292,373 @@ class Database:
         i = 0
         for cat in self.server.music_list:
             for song in cat['songs']:
-                data[song['name'].lower()] = musicData(i, song['name'].lower())
+                if song['name'].lower() not in data:
+                    data[song['name'].lower()] = musicData(i, song['name'].lower())
+                    i += 1
+        self.dirty_music.update(data.values())
         return data
 
     def character_picked(self, cid):
-        self.char_data[cid].data["picked"] += 1
-
-    def char_talked(self, cid, ipid, status):
-        if status.lower() == 'idle':
-            self.char_data[cid].data["times_talked_idle"] += 1
-            self.user_data[ipid].data["times_talked_idle"] += 1
-        if status.lower() == 'building-open' or status.lower() == 'building-full' or status.lower() == 'recess':
-            self.char_data[cid].data["times_talked_build_recess"] += 1
-            self.user_data[ipid].data["times_talked_build_recess"] += 1
-        if status.lower() == 'casing-open' or status.lower() == 'casing-full':
-            self.char_data[cid].data["times_talked_casing"] += 1
-            self.user_data[ipid].data["times_talked_casing"] += 1
-
-    def music_played(self, name, status):
-        if status.lower() == 'idle':
-            self.music_data[name.lower()].data["times_talked_idle"] += 1
-        if status.lower() == 'building-open' or status.lower() == 'building-full' or status.lower() == 'recess':
-            self.music_data[name.lower()].data["times_played_build_recess"] += 1
-        if status.lower() == 'casing-open' or status.lower() == 'casing-full':
-            self.music_data[name.lower()].data["times_played_casing"] += 1
+        self.char_data[cid].picked += 1
+        self.dirty_chars.add(self.char_data[cid])
+
+    def char_talked(self, cid, ipid, bucket):
+        """ Counts an IC message.
+
+        :param cid: character id
+        :param ipid: IPID of the speaker
+        :param bucket: status bucket of the area, or None to not count it
+        """
+        if bucket is None:
+            return
+        char = self.char_data[cid]
+        char.times_talked[bucket] += 1
+        self.dirty_chars.add(char)
+        user = self.get_user(ipid)
+        if user is not None:
+            user.times_talked[bucket] += 1
+            self.dirty_users.add(user)
+
+    def music_played(self, name, bucket):
+        if bucket is None:
+            return
+        music = self.music_data[name.lower()]
+        music.times_played[bucket] += 1
+        self.dirty_music.add(music)
+
+    def count_activity(self, area_id, kind, name):
+        """ Counts one event towards the current hour.
+
+        :param area_id: area it happened in
+        :param kind: 'char' for IC messages, 'music' for songs played
+        :param name: character or song name
+        """
+        key = (int(time.time()) // 3600, area_id, kind, name)
+        self.activity[key] = self.activity.get(key, 0) + 1
 
     def connect_data(self, ipid, hdid):
-        if ipid not in self.user_data:
-            self.user_data[ipid] = userData(ipid, hdid)
+        """ Counts a connection. If the user is not cached, its row is read
+        on the writer thread and the connection is counted once it is there.
+
+        :param ipid: IPID
+        :param hdid: HDID
+        """
+        if ipid in self.loading:
+            self.loading[ipid][1] += 1
+        elif ipid in self.user_data or ipid in self.evicted:
+            record = self.get_user(ipid)
+            record.times_connected += 1
+            self.dirty_users.add(record)
+        else:
+            future = asyncio.wrap_future(self.writer.submit(fetch_one, 'SELECT * FROM user WHERE ipid = ?', (ipid,)))
+            self.loading[ipid] = [future, 1]
+            future.add_done_callback(functools.partial(self.user_loaded, ipid))
+
+    def user_loaded(self, ipid, future):
+        entry = self.loading.get(ipid)
+        if entry is None or entry[0] is not future:
+            # get_user loaded it on the loop meanwhile and counted it there
+            return
+        del self.loading[ipid]
+        if future.cancelled() or future.exception() is not None:
+            logger.log_error('Could not load the statistics of {}, reading them on the loop.'.format(ipid))
+            row = self.conn.execute('SELECT * FROM user WHERE ipid = ?', (ipid,)).fetchone()
         else:
-            self.user_data[ipid].data["times_connected"] += 1
+            row = future.result()
+        self.add_user(ipid, row, entry[1])
 
-    def kicked_user(self, ipid):
-        try:
-            self.user_data[ipid].data["times_kicked"] += 1
-        except IndexError:
+    def user_event(self, ipid, counter):
+        record = self.get_user(ipid)
+        if record is None:
             return
+        setattr(record, counter, getattr(record, counter) + 1)
+        self.dirty_users.add(record)
+
+    def kicked_user(self, ipid):
+        self.user_event(ipid, "times_kicked")
 
     def muted_user(self, ipid):
-        try:
-            self.user_data[ipid].data["times_muted"] += 1
-        except IndexError:
-            return
+        self.user_event(ipid, "times_muted")
 
     def banned_user(self, ipid):
-        try:
-            self.user_data[ipid].data["times_banned"] += 1
-        except IndexError:
-            return
+        self.user_event(ipid, "times_banned")
 
     def user_voted(self, ipid):
-        try:
-            self.user_data[ipid].data["times_voted"] += 1
-        except IndexError:
-            return
+        self.user_event(ipid, "times_voted")
 
     def user_doc(self, ipid):
+        self.user_event(ipid, "times_doc")
+
+    def save_alldata(self):
+        """ Hands the rows changed since the last save to the writer thread. """
+        written = self.writer.written
+        self.evicted = {ipid: entry for ipid, entry in self.evicted.items() if entry[1] > written}
+        batch = []
+        for statement, dirty in (('INSERT OR REPLACE INTO character VALUES (?,?,?,?,?,?)', self.dirty_chars),
+                                 ('INSERT OR REPLACE INTO music VALUES (?,?,?,?,?)', self.dirty_music),
+                                 ('INSERT OR REPLACE INTO user VALUES (?,?,?,?,?,?,?,?,?,?)', self.dirty_users)):
+            if dirty:
+                batch.append((statement, [record.row() for record in dirty]))
+                dirty.clear()
+        if self.activity:
+            if sqlite3.sqlite_version_info >= (3, 24, 0):
+                batch.append(('INSERT INTO activity_hourly VALUES (?,?,?,?,?) ON CONFLICT (hour, area, kind, name) '
+                              'DO UPDATE SET count = count + excluded.count',
+                              [key + (count,) for key, count in self.activity.items()]))
+            else:
+                # no upsert before SQLite 3.24, add to existing rows and insert the rest
+                batch.append(('UPDATE activity_hourly SET count = count + ? '
+                              'WHERE hour = ? AND area = ? AND kind = ? AND name = ?',
+                              [(count,) + key for key, count in self.activity.items()]))
+                batch.append(('INSERT OR IGNORE INTO activity_hourly VALUES (?,?,?,?,?)',
+                              [key + (count,) for key, count in self.activity.items()]))
+            self.activity = {}
+        today = int(time.time()) // 86400
+        if self.rolled_day < today - 1:
+            # every count of the finished days is in the batch above, so
+            # they can be rolled up in the same transaction
+            batch.append(('INSERT OR REPLACE INTO activity_daily SELECT hour / 24, area, kind, name, SUM(count) '
+                          'FROM activity_hourly WHERE hour >= ? AND hour < ? GROUP BY hour / 24, area, kind, name',
+                          [((self.rolled_day + 1) * 24, today * 24)]))
+            batch.append(('DELETE FROM activity_hourly WHERE hour < ?', [((today - self.hourly_days) * 24,)]))
+            self.rolled_day = today - 1
+        if batch:
+            self.generation += 1
+            self.writer.write(self.generation, batch)
+
+    def top_activity(self, kind, group, hours, limit=10):
+        """ Sums activity over the last hours, on the writer thread, after
+        saving what was counted so far.
+
+        Days that lie fully inside the period are read from the daily
+        rollup, and the hours of the first, partial day from the hourly rows.
+        If those have been pruned already, the whole first day is counted,
+        and the period covered is longer than the one asked for.
+
+        :param kind: 'char' or 'music'
+        :param group: column to group by, 'name' or 'area'
+        :param hours: length of the period
+        :param limit: number of rows
+        :return: (asyncio future of a list of (name or area id, count), hours covered)
+        """
+        self.save_alldata()
+        now_hour = int(time.time()) // 3600
+        start_hour = now_hour - hours + 1
+        first_day = -(-start_hour // 24)
+        if start_hour < (self.rolled_day + 1 - self.hourly_days) * 24:
+            first_day = start_hour // 24
+            start_hour = first_day * 24
+        # rolled up days are read from activity_daily, the hours before and
+        # after them from activity_hourly
+        query = ('SELECT {0}, SUM(count) FROM ('
+                 'SELECT area, name, count FROM activity_daily WHERE kind = ? AND day >= ? AND day <= ? '
+                 'UNION ALL SELECT area, name, count FROM activity_hourly WHERE kind = ? AND hour >= ? '
+                 'AND (hour < ? OR hour >= ?)) '
+                 'GROUP BY {0} ORDER BY SUM(count) DESC LIMIT ?').format(group)
+        params = (kind, first_day, self.rolled_day, kind, start_hour, first_day * 24, (self.rolled_day + 1) * 24,
+                  limit)
+        future = asyncio.wrap_future(self.writer.submit(fetch_all, query, params))
+        return future, now_hour - start_hour + 1
+
+    def activity_by_hour(self, hours, area_id=None):
+        """ Sums IC messages per hour of the day (UTC) over the last hours,
+        which are limited to the hourly rows that are kept.
+
+        :param hours: length of the period
+        :param area_id: only count this area
+        :return: asyncio future of a list of (hour of day, count)
+        """
+        self.save_alldata()
+        hours = min(hours, self.hourly_days * 24)
+        query = 'SELECT hour % 24, SUM(count) FROM activity_hourly WHERE kind = \'char\' AND hour >= ?'
+        params = (int(time.time()) // 3600 - hours + 1,)
+        if area_id is not None:
+            query += ' AND area = ?'
+            params += (area_id,)
+        query += ' GROUP BY hour % 24 ORDER BY hour % 24'
+        return asyncio.wrap_future(self.writer.submit(fetch_all, query, params))
+
+    def close(self):
+        """ Saves the remaining changes and waits for the writer to finish. """
+        self.save_alldata()
+        self.writer.close()
+        self.conn.close()
+
+
+class DatabaseWriter:
+    """
+    Owns the connection used for saving statistics and runs the writes on
+    its own thread, so the event loop only queues the rows. written is the
+    generation of the last batch that was committed. Queries submitted to
+    it run in order with the writes, so they see everything saved before.
+    A batch that fails is kept and run again in front of the next one, and
+    written does not move past it until it has been committed. After
+    max_retries failed attempts, each statement is written in its own
+    transaction and the ones that still fail are logged and dropped.
+    """
+    max_retries = 3
+
+    def __init__(self, path):
+        self.path = path
+        self.written = 0
+        self.failed = []
+        self.retries = 0
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name='DatabaseWriter', daemon=True)
+        self.thread.start()
+
+    def write(self, generation, batch):
+        """ Queues statements to be run in one transaction.
+
+        :param generation: increasing number of the batch
+        :param batch: list of (statement, rows) pairs
+        """
+        self.queue.put(functools.partial(self.write_batch, generation, batch))
+
+    def submit(self, fn, *args):
+        """ Runs fn(connection, *args) on the writer thread.
+
+        :return: concurrent.futures.Future of its result
+        """
+        future = Future()
+        self.queue.put(functools.partial(self.call, future, fn, args))
+        return future
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            item(conn)
+        if self.failed:
+            logger.log_error('Gave up writing {} statements to {}.'.format(len(self.failed), self.path))
+        conn.close()
+
+    def write_batch(self, generation, batch, conn):
+        # the failed statements were rolled back, so running them again
+        # before the newer ones applies everything once and in order
+        batch = self.failed + batch
         try:
-            self.user_data[ipid].data["times_doc"] += 1
-        except IndexError:
+            with conn:
+                for statement, rows in batch:
+                    conn.executemany(statement, rows)
+        except sqlite3.Error as e:
+            self.retries += 1
+            if self.retries <= self.max_retries:
+                logger.log_error('Failed to write to {}, will retry with the next save: {}'.format(self.path, e))
+                self.failed = batch
+                return
+            # write what still can be written and drop the statements that
+            # keep failing, so that newer batches are not held up forever
+            for statement, rows in batch:
+                try:
+                    with conn:
+                        conn.executemany(statement, rows)
+                except sqlite3.Error as e:
+                    logger.log_error('Dropped {} rows of "{}" after {} failed writes to {}: {}'.format(
+                        len(rows), statement, self.retries, self.path, e))
+        self.failed = []
+        self.retries = 0
+        self.written = generation
+
+    @staticmethod
+    def call(future, fn, args, conn):
+        if not future.set_running_or_notify_cancel():
             return
+        try:
+            future.set_result(fn(conn, *args))
+        except Exception as e:
+            future.set_exception(e)
 
-    def save_alldata(self):
-            conn = sqlite3.connect(DATABASE_NAME)
-            cur = conn.cursor()
-            char_arr = []
-            for cid, cdata in self.char_data.items():
-                char_arr.append((cdata.id, cdata.name, cdata.data["picked"], cdata.data["times_talked_idle"],
-                                 cdata.data["times_talked_build_recess"], cdata.data["times_talked_casing"]))
-            music_arr = []
-            midc = 0
-            for mid, mdata in self.music_data.items():
-                music_arr.append((midc, mdata.name, mdata.data["times_played_idle"],
-                                 mdata.data["times_played_build_recess"],
-                                 mdata.data["times_played_casing"]))
-                midc += 1
-            user_arr = []
-            for uid, udata in self.user_data.items():
-                user_arr.append((udata.ipid, udata.data["times_connected"],
-                                 udata.data["times_talked_idle"], udata.data["times_talked_build_recess"],
-                                 udata.data["times_talked_casing"], udata.data["times_kicked"],
-                                  udata.data["times_muted"], udata.data["times_banned"],
-                                  udata.data["times_voted"], udata.data["times_doc"]))
-            cur.execute('DELETE FROM character')
-            cur.execute('DELETE FROM music')
-            cur.execute('DELETE FROM user')
-            cur.executemany('INSERT INTO character VALUES (?,?,?,?,?,?)', char_arr)
-            cur.executemany('INSERT INTO music VALUES (?,?,?,?,?)', music_arr)
-            cur.executemany('INSERT INTO user VALUES (?,?,?,?,?,?,?,?,?,?)', user_arr)
-            conn.commit()
-            conn.close()
 
-class charData:
+def fetch_all(conn, query, params):
+    return conn.execute(query, params).fetchall()
+
+
+def fetch_one(conn, query, params):
+    return conn.execute(query, params).fetchone()
 
-    indexes =  {
-        "picked": 0,
-        "times_talked_idle": 0,
-        "times_talked_build_recess": 0,
-        "times_talked_casing": 0,
-    }
+class charData:
+    __slots__ = ('id', 'name', 'picked', 'times_talked')
 
-    def __init__(self, id, name):
+    def __init__(self, id, name, picked=0, times_talked=(0, 0, 0)):
         self.id = id
         self.name = name
-        self.data = {}
-        for i in self.indexes:
-            self.data[i] = self.indexes[i]
+        self.picked = picked
+        # indexed by status bucket
+        self.times_talked = list(times_talked)
 
-class musicData:
+    @classmethod
+    def from_row(cls, row):
+        return cls(row[0], row[1].lower(), row[2], row[3:6])
+
+    def row(self):
+        return (self.id, self.name, self.picked) + tuple(self.times_talked)
+
+    def __setstate__(self, state):
+        # chars.yaml from before the database kept the counters in a data dict
+        data = state['data']
+        self.__init__(state['id'], state['name'], data.get('picked', 0),
+                      (data.get('times_talked_idle', 0), data.get('times_talked_build_recess', 0),
+                       data.get('times_talked_casing', 0)))
 
-    indexes =  {
-        "times_played_idle": 0,
-        "times_played_build_recess": 0,
-        "times_played_casing": 0,
-    }
+class musicData:
+    __slots__ = ('id', 'name', 'times_played')
 
-    def __init__(self, id, name):
+    def __init__(self, id, name, times_played=(0, 0, 0)):
         self.id = id
         self.name = name
-        self.data = {}
-        for i in self.indexes:
-            self.data[i] = self.indexes[i]
+        # indexed by status bucket
+        self.times_played = list(times_played)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row[0], row[1].lower(), row[2:5])
+
+    def row(self):
+        return (self.id, self.name) + tuple(self.times_played)
+
+    def __setstate__(self, state):
+        data = state['data']
+        self.__init__(state['id'], state['name'],
+                      (data.get('times_played_idle', 0), data.get('times_played_build_recess', 0),
+                       data.get('times_played_casing', 0)))
 
 class userData:
+    __slots__ = ('ipid', 'times_connected', 'times_talked', 'times_kicked', 'times_muted', 'times_banned',
+                 'times_voted', 'times_doc')
 
-    indexes =  {
-        "times_connected": 0,
-        "times_talked_idle": 0,
-        "times_talked_build_recess": 0,
-        "times_talked_casing": 0,
-        "times_kicked": 0,
-        "times_muted": 0,
-        "times_banned": 0,
-        "times_voted": 0,
-        "times_doc": 0,
-    }
-
-    def __init__(self, id):
+    def __init__(self, id, times_connected=0, times_talked=(0, 0, 0), times_kicked=0, times_muted=0,
+                 times_banned=0, times_voted=0, times_doc=0):
         self.ipid = id
-        self.data = {}
-        for i in self.indexes:
-            self.data[i] = self.indexes[i]
+        self.times_connected = times_connected
+        # indexed by status bucket
+        self.times_talked = list(times_talked)
+        self.times_kicked = times_kicked
+        self.times_muted = times_muted
+        self.times_banned = times_banned
+        self.times_voted = times_voted
+        self.times_doc = times_doc
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row[0], row[1], row[2:5], *row[5:10])
+
+    def row(self):
+        return (self.ipid, self.times_connected) + tuple(self.times_talked) + \
+               (self.times_kicked, self.times_muted, self.times_banned, self.times_voted, self.times_doc)
+
+    def __setstate__(self, state):
+        data = state['data']
+        self.__init__(state['ipid'], data.get('times_connected', 0),
+                      (data.get('times_talked_idle', 0), data.get('times_talked_build_recess', 0),
+                       data.get('times_talked_casing', 0)),
+                      data.get('times_kicked', 0), data.get('times_muted', 0), data.get('times_banned', 0),
+                      data.get('times_voted', 0), data.get('times_doc', 0))
@@ -0,0 +1,197 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import shlex
+import sqlite3
+import time
+
+from server.database import DatabaseWriter
+from server.exceptions import ArgumentError
+
+EVENT_DATABASE = 'storage/events.db'
+EVENT_KINDS = ('IC', 'OOC', 'MUSIC', 'WTCE', 'HP', 'MOD')
+QUERY_USAGE = 'Filters: type=<{}> area=<id> ipid=<ipid> hdid=<hdid> char=<name> text=<words> ' \
+              'last=<number><m|h|d> limit=<1-100>'.format('|'.join(EVENT_KINDS).lower())
+
+
+class EventLog:
+    """
+    Structured log of what happens in areas, kept in SQLite with indexes on
+    time, area, IPID, HDID and character, so lookups do not have to read
+    the text logs. Events are collected in memory and written once a
+    second by a writer thread, which also runs the searches. Every hour,
+    events older than max_days, or beyond the newest max_rows, are pruned.
+    """
+    flush_interval = 1
+    prune_interval = 3600
+
+    def __init__(self, server):
+        self.server = server
+        self.max_days = server.config['event_log']['max_days']
+        self.max_rows = server.config['event_log']['max_rows']
+        self.pending = []
+        self.generation = 0
+        conn = sqlite3.connect(EVENT_DATABASE)
+        conn.execute('CREATE TABLE IF NOT EXISTS event (time REAL NOT NULL, kind TEXT NOT NULL, '
+                     'area INTEGER NOT NULL, ipid TEXT NOT NULL, hdid TEXT NOT NULL, char TEXT NOT NULL, '
+                     'name TEXT NOT NULL, message TEXT NOT NULL);')
+        conn.execute('CREATE INDEX IF NOT EXISTS event_time ON event (time);')
+        conn.execute('CREATE INDEX IF NOT EXISTS event_area ON event (area, time);')
+        conn.execute('CREATE INDEX IF NOT EXISTS event_ipid ON event (ipid, time);')
+        conn.execute('CREATE INDEX IF NOT EXISTS event_hdid ON event (hdid, time);')
+        conn.execute('CREATE INDEX IF NOT EXISTS event_char ON event (char COLLATE NOCASE, time);')
+        conn.commit()
+        conn.close()
+        self.writer = DatabaseWriter(EVENT_DATABASE)
+        self.server.timers.schedule(self, self.flush_interval, self.flush)
+        self.prune()
+
+    def add(self, kind, client, message):
+        """ Records an event by a client in its current area.
+
+        :param kind: one of EVENT_KINDS
+        :param client: client it came from
+        :param message: text of the event
+        """
+        self.pending.append((time.time(), kind, client.area.id, client.ipid, client.hdid, client.get_char_name(),
+                             client.name, message))
+
+    def flush(self):
+        self.server.timers.schedule(self, self.flush_interval, self.flush)
+        self.write_pending()
+
+    def prune(self):
+        self.server.timers.schedule((self, 'prune'), self.prune_interval, self.prune)
+        since = time.time() - self.max_days * 86400 if self.max_days else None
+        self.writer.submit(prune_events, since, self.max_rows)
+
+    def write_pending(self):
+        if self.pending:
+            self.generation += 1
+            self.writer.write(self.generation, [('INSERT INTO event VALUES (?,?,?,?,?,?,?,?)', self.pending)])
+            self.pending = []
+
+    def search(self, query):
+        """ Searches the events on the writer thread, after writing the
+        pending ones.
+
+        :param query: filters from parse_query
+        :return: asyncio future of a list of event rows, oldest first
+        """
+        self.write_pending()
+        return asyncio.wrap_future(self.writer.submit(search_events, query))
+
+    def close(self):
+        self.server.timers.cancel(self)
+        self.server.timers.cancel((self, 'prune'))
+        self.write_pending()
+        self.writer.close()
+
+
+def parse_query(text):
+    """ Parses search filters such as 'type=ic ipid=X area=3 last=2h'.
+
+    :param text: key=value pairs, values with spaces in quotes
+    :return: dict of filters
+    :raises: ArgumentError if a filter is not understood
+    """
+    try:
+        words = shlex.split(text)
+    except ValueError:
+        raise ArgumentError('Unbalanced quotes. ' + QUERY_USAGE)
+    query = {'limit': 20}
+    for word in words:
+        key, sep, value = word.partition('=')
+        key = key.lower()
+        if not sep or not value:
+            raise ArgumentError(QUERY_USAGE)
+        if key == 'type':
+            if value.upper() not in EVENT_KINDS:
+                raise ArgumentError(QUERY_USAGE)
+            query['kind'] = value.upper()
+        elif key in ('area', 'limit'):
+            try:
+                query[key] = int(value)
+            except ValueError:
+                raise ArgumentError(QUERY_USAGE)
+        elif key in ('ipid', 'hdid', 'char', 'text'):
+            query[key] = value
+        elif key == 'last':
+            units = {'m': 60, 'h': 3600, 'd': 86400}
+            try:
+                query['since'] = time.time() - int(value[:-1]) * units[value[-1].lower()]
+            except (ValueError, KeyError):
+                raise ArgumentError(QUERY_USAGE)
+        else:
+            raise ArgumentError(QUERY_USAGE)
+    query['limit'] = max(1, min(query['limit'], 100))
+    return query
+
+
+def search_events(conn, query):
+    """ Runs a query from parse_query.
+
+    :param conn: connection to the event database
+    :param query: dict of filters
+    :return: list of (time, kind, area, ipid, hdid, char, name, message), oldest first
+    """
+    where = []
+    params = []
+    if 'since' in query:
+        where.append('time >= ?')
+        params.append(query['since'])
+    for key in ('kind', 'area', 'ipid', 'hdid'):
+        if key in query:
+            where.append('{} = ?'.format(key))
+            params.append(query[key])
+    if 'char' in query:
+        where.append('char = ? COLLATE NOCASE')
+        params.append(query['char'])
+    if 'text' in query:
+        where.append('message LIKE ?')
+        params.append('%{}%'.format(query['text']))
+    sql = 'SELECT * FROM event'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY time DESC LIMIT ?'
+    params.append(query['limit'])
+    rows = conn.execute(sql, params).fetchall()
+    rows.reverse()
+    return rows
+
+
+def prune_events(conn, since, max_rows):
+    """ Deletes old events.
+
+    :param conn: connection to the event database
+    :param since: time of the oldest event to keep, or None
+    :param max_rows: number of newest events to keep, or 0 for no limit
+    """
+    with conn:
+        if since is not None:
+            conn.execute('DELETE FROM event WHERE time < ?', (since,))
+        if max_rows:
+            # rows are numbered in the order they were written
+            conn.execute('DELETE FROM event WHERE rowid <= (SELECT rowid FROM event ORDER BY rowid DESC '
+                         'LIMIT 1 OFFSET ?)', (max_rows,))
+
+
+def format_event(row):
+    event_time, kind, area, ipid, hdid, char, name, message = row
+    return '[{}][{}][{}][{}][{}]{}'.format(time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(event_time)), area,
+                                           kind, ipid, char, message)
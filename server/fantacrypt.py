@@ -18,13 +18,40 @@
 # fantacrypt was a mistake, just hardcoding some numbers is good enough
 
 import binascii
+from functools import lru_cache
 
 CRYPT_CONST_1 = 53761
 CRYPT_CONST_2 = 32618
 CRYPT_KEY = 5
 
 
+@lru_cache(maxsize=256)
 def fanta_decrypt(data):
+    """ Decrypts a fantacrypt hex string. Clients only ever encrypt a
+    handful of command names, so results are cached.
+
+    :param data: hex string
+    :return: decrypted string
+    """
+    try:
+        data_bytes = bytes.fromhex(data)
+    except ValueError:
+        return fanta_decrypt_slow(data)
+    if len(data_bytes) * 2 != len(data):
+        # fromhex skips whitespace, the original parser did not
+        return fanta_decrypt_slow(data)
+    ret = bytearray(len(data_bytes))
+    key = CRYPT_KEY
+    for i, byte in enumerate(data_bytes):
+        ret[i] = byte ^ (key >> 8)
+        key = ((byte + key) * CRYPT_CONST_1 + CRYPT_CONST_2) & 0xffff
+    return ret.decode('latin-1')
+
+
+def fanta_decrypt_slow(data):
+    """ The original decryptor, kept for input that is not plain hex
+    (odd length, signs or whitespace that int() accepts).
+    """
     data_bytes = [int(data[x:x + 2], 16) for x in range(0, len(data), 2)]
     key = CRYPT_KEY
     ret = ''
@@ -0,0 +1,122 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import sqlite3
+
+from server import logger
+
+IDENTITY_DATABASE = 'storage/identities.db'
+LEGACY_HDID_FILE = 'storage/hd_ids.json'
+
+
+class IdentityManager:
+    """
+    Remembers which HDIDs connected from which IPIDs. Every pair ever seen is
+    stored in SQLite and kept in memory as an index both ways, together with
+    the number of banned IPIDs each HDID has connected from, which makes
+    "is any IPID of this HDID banned" a single lookup. Only direct links
+    count, an HDID is not banned because another HDID shared an IPID with it.
+    """
+    commit_interval = 30
+
+    def __init__(self, server):
+        self.server = server
+        self.ipids = {}
+        self.hdids = {}
+        self.banned = {}
+        self.pending = set()
+        self.conn = sqlite3.connect(IDENTITY_DATABASE)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS hdid_link (hdid TEXT NOT NULL, ipid TEXT NOT NULL, '
+                          'PRIMARY KEY (hdid, ipid));')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS hdid_link_ipid ON hdid_link (ipid);')
+        self.migrate_json()
+        for hdid, ipid in self.conn.execute('SELECT hdid, ipid FROM hdid_link'):
+            self.add_link(hdid, ipid)
+        server.ban_manager.ban_listeners.append(self.ban_changed)
+        server.timers.schedule(self, self.commit_interval, self.periodic_commit)
+
+    def migrate_json(self):
+        """ Imports the old storage/hd_ids.json and renames it, so it is only done once. """
+        if not os.path.exists(LEGACY_HDID_FILE):
+            return
+        try:
+            with open(LEGACY_HDID_FILE, 'r', encoding='utf-8') as whole_list:
+                hdid_list = json.load(whole_list)
+        except ValueError:
+            logger.log_debug('Failed to load hd_ids.json from ./storage, not importing it.')
+            return
+        self.conn.executemany('INSERT OR IGNORE INTO hdid_link VALUES (?,?)',
+                              ((hdid, ipid) for hdid, ipids in hdid_list.items() for ipid in ipids))
+        self.conn.commit()
+        os.replace(LEGACY_HDID_FILE, LEGACY_HDID_FILE + '.migrated')
+
+    def add_link(self, hdid, ipid):
+        """ Adds a pair to the in-memory indexes.
+
+        :return: True if the pair was new
+        """
+        ipids = self.ipids.setdefault(hdid, set())
+        if ipid in ipids:
+            return False
+        ipids.add(ipid)
+        self.hdids.setdefault(ipid, set()).add(hdid)
+        if self.server.ban_manager.is_banned(ipid):
+            self.banned[hdid] = self.banned.get(hdid, 0) + 1
+        return True
+
+    def link(self, hdid, ipid):
+        """ Records that an HDID connected from an IPID. The row is written
+        with the next commit.
+
+        :param hdid: hardware id
+        :param ipid: IPID
+        """
+        if self.add_link(hdid, ipid):
+            self.pending.add((hdid, ipid))
+
+    def is_banned(self, hdid):
+        """ Checks whether any IPID the HDID has connected from is banned.
+
+        :param hdid: hardware id
+        """
+        return self.banned.get(hdid, 0) > 0
+
+    def ban_changed(self, ipid, banned):
+        for hdid in self.hdids.get(ipid, ()):
+            count = self.banned.get(hdid, 0) + (1 if banned else -1)
+            if count > 0:
+                self.banned[hdid] = count
+            else:
+                self.banned.pop(hdid, None)
+
+    def commit(self):
+        """ Writes the links seen since the last commit in one transaction. """
+        if self.pending:
+            pending, self.pending = self.pending, set()
+            self.conn.executemany('INSERT OR IGNORE INTO hdid_link VALUES (?,?)', pending)
+            self.conn.commit()
+
+    def periodic_commit(self):
+        self.commit()
+        self.server.timers.schedule(self, self.commit_interval, self.periodic_commit)
+
+    def close(self):
+        self.server.timers.cancel(self)
+        self.commit()
+        self.conn.close()
@@ -15,88 +15,195 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import atexit
+import gzip
 import logging
 import logging.handlers
 import os
-from server import area_manager
+import queue
+import shutil
+import threading
 
 import time
 
-
-def setup_logger(debug, log_size, log_backups, areas):
+log_queue = None
+queue_handler = None
+log_writer = None
+formatter = logging.Formatter('[%(asctime)s UTC]%(message)s')
+
+
+class BatchFlushMixin:
+    """ Leaves flushing to the log writer, which flushes once per batch instead of once per record. """
+
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()
+
+    def close(self):
+        self.flush_batch()
+        super().close()
+
+
+class BatchRotatingFileHandler(BatchFlushMixin, logging.handlers.RotatingFileHandler):
+    """ Rotating file handler whose rotated files are gzipped. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.namer = lambda name: name + '.gz'
+        self.rotator = compress_log
+
+
+class BatchFileHandler(BatchFlushMixin, logging.FileHandler):
+    pass
+
+
+def compress_log(source, dest):
+    with open(source, 'rb') as log_file, gzip.open(dest, 'wb') as gz_file:
+        shutil.copyfileobj(log_file, gz_file)
+    os.remove(source)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """ Queues records for the log writer, dropping them when the queue is full. """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # our messages are formatted already; the file handlers add the time on the writer thread
+        if record.args or record.exc_info:
+            return super().prepare(record)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogWriter:
+    """
+    Takes records off the queue on its own thread and hands them to the file
+    handlers of the logger they were logged to. Records are handled in
+    batches, and the files that were written to are flushed once per batch,
+    so disk I/O, rotation and compression never run on the event loop.
+    """
+    batch_size = 512
+
+    def __init__(self, log_queue, routes):
+        self.queue = log_queue
+        self.routes = routes
+        self.written = 0
+        self.thread = threading.Thread(target=self.run, name='LogWriter', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            touched = set()
+            for record in batch:
+                if record is None:
+                    running = False
+                    continue
+                self.written += 1
+                for handler in self.routes.get(record.name, ()):
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+                        touched.add(handler)
+            for handler in touched:
+                handler.flush_batch()
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+        for handlers in self.routes.values():
+            for handler in handlers:
+                handler.close()
+
+
+def setup_logger(debug, log_size, log_backups, queue_size=10000):
+    global log_queue, queue_handler, log_writer
     logging.Formatter.converter = time.gmtime
-    debug_formatter = logging.Formatter('[%(asctime)s UTC]%(message)s')
-    srv_formatter = logging.Formatter('[%(asctime)s UTC]%(message)s')
 
-    debug_log = logging.getLogger('debug')
-    debug_log.setLevel(logging.DEBUG)
+    log_queue = queue.Queue(queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    log_writer = LogWriter(log_queue, {})
+    atexit.register(stop_logger)
 
     # 0 maxBytes = no rotation
     # backupCount = number of old logs to save
-    debug_handler = logging.handlers.RotatingFileHandler('logs/debug.log', maxBytes=log_size, backupCount=log_backups,
-                                                         encoding='utf-8')
-    debug_handler.setLevel(logging.DEBUG)
-    debug_handler.setFormatter(debug_formatter)
-    debug_log.addHandler(debug_handler)
-
+    debug_log = add_logger('debug', logging.DEBUG,
+                           BatchRotatingFileHandler('logs/debug.log', maxBytes=log_size, backupCount=log_backups,
+                                                    encoding='utf-8'))
     if not debug:
         debug_log.disabled = True
 
-    server_log = logging.getLogger('server')
-    server_log.setLevel(logging.INFO)
-
-    server_handler = logging.handlers.RotatingFileHandler('logs/server.log', maxBytes=log_size, backupCount=log_backups,
-                                                          encoding='utf-8')
-    server_handler.setLevel(logging.INFO)
-    server_handler.setFormatter(srv_formatter)
-    server_log.addHandler(server_handler)
-
-    mod_log = logging.getLogger('mod')
-    mod_log.setLevel(logging.INFO)
-
-    mod_handler = logging.handlers.RotatingFileHandler('logs/mod.log', maxBytes=log_size, backupCount=log_backups,
-                                                          encoding='utf-8')
-    mod_handler.setLevel(logging.INFO)
-    mod_handler.setFormatter(srv_formatter)
-    mod_log.addHandler(mod_handler)
-
-    user_log = logging.getLogger('user')
-    user_log.setLevel(logging.INFO)
-
-    user_handler = logging.handlers.RotatingFileHandler('logs/user.log', maxBytes=log_size, backupCount=log_backups,
-                                                       encoding='utf-8')
-    user_handler.setLevel(logging.INFO)
-    user_handler.setFormatter(srv_formatter)
-    user_log.addHandler(user_handler)
-
-    connection_log = logging.getLogger('connect')
-    connection_log.setLevel(logging.INFO)
-    connection_handler = logging.FileHandler('logs/connection.log', encoding='utf-8')
-    connection_handler.setLevel(logging.INFO)
-    connection_handler.setFormatter(srv_formatter)
-    connection_log.addHandler(connection_handler)
-
-    serverpoll_log = logging.getLogger('serverpoll')
-    serverpoll_log.setLevel(logging.INFO)
-    serverpoll_handler = logging.FileHandler('logs/serverpoll.log', encoding='utf-8')
-    serverpoll_handler.setLevel(logging.INFO)
-    serverpoll_handler.setFormatter(srv_formatter)
-    serverpoll_log.addHandler(serverpoll_handler)
-
-    area_logs = []
-    area_handler = []
-    i = 0
+    add_logger('server', logging.INFO,
+               BatchRotatingFileHandler('logs/server.log', maxBytes=log_size, backupCount=log_backups,
+                                        encoding='utf-8'))
+    add_logger('mod', logging.INFO,
+               BatchRotatingFileHandler('logs/mod.log', maxBytes=log_size, backupCount=log_backups,
+                                        encoding='utf-8'))
+    add_logger('user', logging.INFO,
+               BatchRotatingFileHandler('logs/user.log', maxBytes=log_size, backupCount=log_backups,
+                                        encoding='utf-8'))
+    add_logger('connect', logging.INFO, BatchFileHandler('logs/connection.log', encoding='utf-8'))
+    add_logger('serverpoll', logging.INFO, BatchFileHandler('logs/serverpoll.log', encoding='utf-8'))
+
+
+def setup_area_loggers(areas, log_size, log_backups):
+    """ Adds a log file per area. These are set up apart from the others,
+    which are needed before the areas are loaded.
+
+    :param areas: list of areas
+    :param log_size: size at which a file is rotated, 0 for no rotation
+    :param log_backups: number of rotated files to keep
+    """
     if not os.path.exists('logs/area/'):
         os.makedirs('logs/area/')
     for area in areas:
-        area_logs.append(logging.getLogger(area.name))
-        area_logs[i].setLevel(logging.INFO)
-        area_handler.append(logging.handlers.RotatingFileHandler('logs/area/'+ area.name + '.log', maxBytes=log_size, backupCount=log_backups,
-                                                           encoding='utf-8'))
-        area_handler[i].setLevel(logging.INFO)
-        area_handler[i].setFormatter(srv_formatter)
-        area_logs[i].addHandler(area_handler[i])
-        i += 1
+        add_logger(area.name, logging.INFO,
+                   BatchRotatingFileHandler('logs/area/' + area.name + '.log', maxBytes=log_size,
+                                            backupCount=log_backups, encoding='utf-8'))
+
+
+def add_logger(name, level, handler):
+    """ Routes the records of a logger through the queue to a file handler. """
+    log = logging.getLogger(name)
+    log.setLevel(level)
+    log.addHandler(queue_handler)
+    handler.setLevel(level)
+    handler.setFormatter(formatter)
+    # the writer only looks routes up, so one can be added while it runs
+    log_writer.routes[name] = [handler]
+    return log
+
+
+def stop_logger():
+    """ Writes out the queued records and closes the log files. """
+    global log_writer
+    if log_writer is not None:
+        log_writer.stop()
+        log_writer = None
+
+
+def get_log_stats():
+    """ Returns the queue depth, the queue size, and the records dropped and written so far. """
+    if log_writer is None:
+        return {'depth': 0, 'size': 0, 'dropped': 0, 'written': 0}
+    return {'depth': log_queue.qsize(), 'size': log_queue.maxsize, 'dropped': queue_handler.dropped,
+            'written': log_writer.written}
+
 
 def log_debug(msg, client=None):
     msg = parse_client_info(client) + msg
@@ -111,6 +218,12 @@ def log_server(msg, client=None):
     logging.getLogger('server').info(msg)
 
 
+def log_error(msg, client=None):
+    msg = parse_client_info(client) + msg
+    logging.getLogger('server').error(msg)
+    logging.getLogger('debug').error(msg)
+
+
 def log_mod(msg, client=None):
     msg = parse_client_info(client) + msg
     logging.getLogger('mod').info(msg)
@@ -0,0 +1,68 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from server.websocket import deflate, make_frame
+
+
+def encode_command(command, args):
+    """ Serializes a command into the bytes sent over raw TCP.
+
+    :param command: command name
+    :param args: tuple of arguments, converted with str()
+    :return: encoded packet
+    """
+    if args:
+        return '{}#{}#%'.format(command, '#'.join([str(x) for x in args])).encode('utf-8')
+    return '{}#%'.format(command).encode('utf-8')
+
+
+class Packet:
+    """
+    A command that is serialized once and then written to any number of
+    clients. The WebSocket frames are only built when the first WebSocket
+    client asks for them.
+    """
+    __slots__ = ('command', 'raw', '_frame', '_deflated_frame')
+
+    def __init__(self, command, *args):
+        self.command = command
+        self.raw = encode_command(command, args)
+        self._frame = None
+        self._deflated_frame = None
+
+    def prebuild(self):
+        """ Builds the WebSocket frames right away, for packets that are
+        kept around and sent on every join.
+
+        :return: the packet itself
+        """
+        self._frame = make_frame(self.raw)
+        self._deflated_frame = make_frame(deflate(self.raw), compressed=True)
+        return self
+
+    @property
+    def frame(self):
+        if self._frame is None:
+            self._frame = make_frame(self.raw)
+        return self._frame
+
+    @property
+    def deflated_frame(self):
+        """ permessage-deflate frame for clients without server context takeover """
+        if self._deflated_frame is None:
+            self._deflated_frame = make_frame(deflate(self.raw), compressed=True)
+        return self._deflated_frame
@@ -18,14 +18,66 @@
 import json
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import yaml
 
 from server import logger
+from server.database import CASING
 from server.exceptions import ServerError
 
+POLL_JOURNAL = 'storage/poll/journal.jsonl'
+# journal being compacted into the poll files
+POLL_JOURNAL_OLD = 'storage/poll/journal.jsonl.1'
+
+
+class VoterIndex:
+    """
+    Who voted in a poll, and for what: the IPIDs and HDIDs in its log, and
+    the choices each of them made. Built from the log when a poll is loaded
+    and kept up to date with every vote.
+    """
+    __slots__ = ('ipids', 'hdids', 'choices')
+
+    def __init__(self, log=()):
+        self.ipids = set()
+        self.hdids = set()
+        # ('ipid', ipid) or ('hdid', hdid) -> set of lowercased votes
+        self.choices = {}
+        for entry in log:
+            self.add(entry)
+
+    def add(self, entry):
+        """ Adds a vote log entry.
+
+        :param entry: [time, ipid, hdid, vote, ...]
+        """
+        ipid, hdid, vote = entry[1], entry[2], entry[3].lower()
+        self.ipids.add(ipid)
+        self.hdids.add(hdid)
+        self.choices.setdefault(('ipid', ipid), set()).add(vote)
+        self.choices.setdefault(('hdid', hdid), set()).add(vote)
+
+    def chose(self, ipid, hdid, vote):
+        """ Checks whether the IPID, or the HDID if given, already chose a vote. """
+        vote = vote.lower()
+        if vote in self.choices.get(('ipid', ipid), ()):
+            return True
+        return hdid is not None and vote in self.choices.get(('hdid', hdid), ())
+
 
 class ServerpollManager:
+    """
+    Keeps every listed poll in memory. Changes are applied in memory and
+    appended to a JSON-lines journal, and every snapshot_interval seconds
+    the polls that changed are written back to their YAML files on a
+    worker thread, after which the journal they came from is removed. Each
+    journal entry has a sequence number, and each poll file records the
+    last one it includes, so replaying the journal at startup applies
+    every change exactly once.
+    """
+    snapshot_interval = 60
+
     def __init__(self, server):
         self.server = server
         self.poll_list = []
@@ -36,6 +88,17 @@ class ServerpollManager:
         self.slots = []
         self.voting = 0
         self.voting_at = 0
+        self.polls = {}
+        # stem -> VoterIndex of the poll
+        self.voters = {}
+        self.dirty = set()
+        self.failed = set()
+        self.seq = 0
+        self.load_polls()
+        self.journal = open(POLL_JOURNAL, 'a', encoding='utf-8')
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.snapshot_future = None
+        self.server.timers.schedule(self, self.snapshot_interval, self.snapshot)
 
     def load_poll_list(self):
         try:
@@ -50,6 +113,142 @@ class ServerpollManager:
         except ValueError:
             return
 
+    def load_polls(self):
+        """ Reads the files of the listed polls, replays the journals left
+        from the last run into them and writes them back.
+        """
+        for name, created in self.poll_list:
+            stem = self.get_stem(name, created)
+            try:
+                with open('storage/poll/{}.yaml'.format(stem), 'r') as poll_file:
+                    self.polls[stem] = yaml.load(poll_file)
+            except FileNotFoundError:
+                logger.log_serverpoll('Poll \'{}\' has no file associated with it.'.format(name))
+                continue
+            self.voters[stem] = VoterIndex(self.polls[stem]['log'])
+            self.seq = max(self.seq, self.polls[stem].get('seq', 0))
+        for path in (POLL_JOURNAL_OLD, POLL_JOURNAL):
+            try:
+                with open(path, 'r', encoding='utf-8') as journal:
+                    for line in journal:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            # cut short by a crash
+                            break
+                        self.seq = max(self.seq, entry['seq'])
+                        poll = self.polls.get(entry['poll'])
+                        if poll is None and entry['op'] != 'create' or \
+                                poll is not None and entry['seq'] <= poll.get('seq', 0):
+                            continue
+                        self.apply(entry)
+                        self.dirty.add(entry['poll'])
+            except FileNotFoundError:
+                pass
+        if self.dirty:
+            self.write_snapshots({stem: self.copy_poll(self.polls[stem]) for stem in self.dirty})
+            self.dirty = set()
+        if not self.failed:
+            for path in (POLL_JOURNAL_OLD, POLL_JOURNAL):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    @staticmethod
+    def get_stem(name, created):
+        return '{} \'{}\''.format(created, name)
+
+    @staticmethod
+    def copy_poll(poll):
+        # log entries are never changed once added, copying the lists is enough
+        return dict(poll, choices=list(poll['choices']), votes=dict(poll['votes']), log=list(poll['log']),
+                    faillog=list(poll['faillog']))
+
+    def apply(self, entry):
+        if entry['op'] == 'create':
+            self.polls[entry['poll']] = entry['data']
+            self.voters[entry['poll']] = VoterIndex(entry['data']['log'])
+        poll = self.polls[entry['poll']]
+        if entry['op'] == 'set':
+            poll.update(entry['fields'])
+        elif entry['op'] == 'vote':
+            if entry['choice'] is not None:
+                poll['votes'][entry['choice']] += 1
+            poll['log'].append(entry['entry'])
+            self.voters[entry['poll']].add(entry['entry'])
+        elif entry['op'] == 'fail':
+            poll['faillog'].append(entry['entry'])
+        poll['seq'] = entry['seq']
+
+    def record(self, stem, op, **fields):
+        """ Applies a change to a poll and appends it to the journal.
+
+        :param stem: file name of the poll, without extension
+        :param op: 'create', 'set', 'vote' or 'fail'
+        :param fields: the rest of the journal entry
+        """
+        self.seq += 1
+        entry = dict(fields, seq=self.seq, poll=stem, op=op)
+        self.journal.write(json.dumps(entry) + '\n')
+        self.journal.flush()
+        self.apply(entry)
+        self.dirty.add(stem)
+
+    def snapshot(self):
+        """ Rotates the journal and writes the changed polls back on the
+        worker thread.
+        """
+        self.server.timers.schedule(self, self.snapshot_interval, self.snapshot)
+        if self.snapshot_future is not None and not self.snapshot_future.done():
+            return
+        self.dirty |= self.failed
+        self.failed = set()
+        if not self.dirty:
+            return
+        snapshots = {stem: self.copy_poll(self.polls[stem]) for stem in self.dirty}
+        self.dirty = set()
+        self.rotate_journal()
+        self.snapshot_future = self.executor.submit(self.write_snapshots, snapshots)
+        listed = {self.get_stem(name, created) for name, created in self.poll_list}
+        for stem in [stem for stem in self.polls if stem not in listed]:
+            del self.polls[stem]
+            del self.voters[stem]
+
+    def rotate_journal(self):
+        self.journal.close()
+        if os.path.exists(POLL_JOURNAL_OLD):
+            # the last snapshot failed, keep its entries
+            with open(POLL_JOURNAL_OLD, 'a', encoding='utf-8') as old, \
+                    open(POLL_JOURNAL, 'r', encoding='utf-8') as journal:
+                old.write(journal.read())
+            os.remove(POLL_JOURNAL)
+        else:
+            os.replace(POLL_JOURNAL, POLL_JOURNAL_OLD)
+        self.journal = open(POLL_JOURNAL, 'a', encoding='utf-8')
+
+    def write_snapshots(self, snapshots):
+        try:
+            for stem, poll in snapshots.items():
+                path = 'storage/poll/{}.yaml'.format(stem)
+                with open(path + '.tmp', 'w') as poll_file:
+                    yaml.dump(poll, poll_file, default_flow_style=False)
+                os.replace(path + '.tmp', path)
+            if os.path.exists(POLL_JOURNAL_OLD):
+                os.remove(POLL_JOURNAL_OLD)
+        except OSError as e:
+            logger.log_serverpoll('Failed to save polls: {}'.format(e))
+            self.failed = set(snapshots)
+
+    def close(self):
+        """ Waits for a running snapshot and writes the remaining changes. """
+        self.server.timers.cancel(self)
+        self.executor.shutdown(wait=True)
+        self.dirty |= self.failed
+        if self.dirty:
+            self.rotate_journal()
+            self.write_snapshots({stem: self.copy_poll(self.polls[stem]) for stem in self.dirty})
+            self.dirty = set()
+        self.journal.close()
+
     def write_poll_list(self):
         with open('storage/poll/polllist.json', 'w') as poll_list_file:
             json.dump(self.poll_list, poll_list_file)
@@ -61,6 +260,22 @@ class ServerpollManager:
     def poll_number(self):
         return len(self.poll_list)
 
+    def get_poll(self, value, ignore_case=False):
+        """ Finds a listed poll.
+
+        :param value: poll name
+        :param ignore_case: whether to match the name case-insensitively
+        :return: (stem, poll), or None if no poll has that name
+        :raises: ServerError if the poll has no file
+        """
+        for name, created in self.poll_list:
+            if name == value or (ignore_case and name.lower() == value.lower()):
+                stem = self.get_stem(name, created)
+                if stem not in self.polls:
+                    raise ServerError('The specified poll has no file associated with it.')
+                return stem, self.polls[stem]
+        return None
+
     def add_poll(self, value):
         test = time.strftime('%y-%m-%d %H%M-%S')
         if not ([item for item in self.poll_list if item[0] == value]):
@@ -77,9 +292,8 @@ class ServerpollManager:
                     'log': [],
                     'faillog': [],
                 }
-                with open('storage/poll/{} \'{}\'.yaml'.format(test, value), 'w') as file:
-                    yaml.dump(newfile, file, default_flow_style=False)
-                    logger.log_serverpoll('Poll \'{}\' added successfully.'.format(value))
+                self.record(self.get_stem(value, test), 'create', data=newfile)
+                logger.log_serverpoll('Poll \'{}\' added successfully.'.format(value))
             else:
                 logger.log_serverpoll('Failed to add poll. Reason: The poll queue is full.')
                 raise ServerError('The Poll Queue is full!')
@@ -101,29 +315,21 @@ class ServerpollManager:
         self.write_poll_list()
 
     def polldetail(self, value, detail):
-        for i in self.poll_list:
-            if i[0].lower() == value.lower():
-                stream = open('storage/poll/{} \'{}\'.yaml'.format(i[1], i[0]), 'r')
-                hold = yaml.load(stream)
-                hold['polldetail'] = detail
-                write = open('storage/poll/{} \'{}\'.yaml'.format(i[1], i[0]), 'w')
-                yaml.dump(hold, write, default_flow_style=False)
-                return 1
-        return 0
+        found = self.get_poll(value, ignore_case=True)
+        if found is None:
+            return 0
+        self.record(found[0], 'set', fields={'polldetail': detail})
+        return 1
 
     def returndetail(self, value):
-        for i in self.poll_list:
-            if i[0].lower() == value.lower():
-                stream = open('storage/poll/{} \'{}\'.yaml'.format(i[1], i[0]), 'r')
-                hold = yaml.load(stream)
-                return hold['polldetail']
+        found = self.get_poll(value, ignore_case=True)
+        if found is not None:
+            return found[1]['polldetail']
 
     def returnmulti(self, value):
-        for i in self.poll_list:
-            if i[0].lower() == value.lower():
-                stream = open('storage/poll/{} \'{}\'.yaml'.format(i[1], i[0]), 'r')
-                hold = yaml.load(stream)
-                return hold['multivote']
+        found = self.get_poll(value, ignore_case=True)
+        if found is not None:
+            return found[1]['multivote']
 
     def poll_exists(self, value):
         if [i for i in self.poll_list if i[0] == "{}".format(value)]:
@@ -139,221 +345,100 @@ class ServerpollManager:
             return
 
     def get_votelist(self, value):
-        try:
-            if [i for i in self.poll_list if i[0] == "{}".format(value)]:
-                poll_selected = [i[1] for i in self.poll_list if i[0] == "{}".format(value)]
-                output = ('{} \'{}\''.format("".join(poll_selected), value))
-                stream = open('storage/poll/{}.yaml'.format(output), 'r')
-                stream2 = yaml.load(stream)
-                log = stream2['log']
-                return log
-            else:
-                return None
-        except FileNotFoundError:
-            raise ServerError('The specified poll has no file associated with it.')
-        except IndexError:
-            raise ServerError('The poll list is currently empty.')
+        found = self.get_poll(value)
+        if found is not None:
+            return found[1]['log']
 
     def get_poll_choices(self, value):
-        try:
-            if [i for i in self.poll_list if i[0] == "{}".format(value)]:
-                poll_selected = [i[1] for i in self.poll_list if i[0] == "{}".format(value)]
-                output = ('{} \'{}\''.format("".join(poll_selected), value))
-                stream = open('storage/poll/{}.yaml'.format(output), 'r')
-                stream2 = yaml.load(stream)
-                choices = stream2['choices']
-                return choices
-            else:
-                return None
-        except FileNotFoundError:
-            raise ServerError('The specified poll has no file associated with it.')
-        except IndexError:
-            return
+        found = self.get_poll(value)
+        if found is not None:
+            return found[1]['choices']
 
     def clear_poll_choice(self, value):
-        try:
-            if [i for i in self.poll_list if i[0] == "{}".format(value)]:
-                poll_selected = [i[1] for i in self.poll_list if i[0] == "{}".format(value)]
-                output = ('{} \'{}\''.format("".join(poll_selected), value))
-                stream = open('storage/poll/{}.yaml'.format(output), 'r')
-                stream2 = yaml.load(stream)
-                stream2['choices'] = []
-                stream2['votes'] = {}
-                with open('storage/poll/{}.yaml'.format(output), 'w') as votelist_file:
-                    yaml.dump(stream2, votelist_file, default_flow_style=False)
-                return stream2['choices']
-            else:
-                return None
-        except FileNotFoundError:
-            raise ServerError('The specified poll has no file associated with it.')
-        except IndexError:
-            return
+        found = self.get_poll(value)
+        if found is None:
+            return None
+        self.record(found[0], 'set', fields={'choices': [], 'votes': {}})
+        return found[1]['choices']
 
     def remove_poll_choice(self, client, value, remove):
-        try:
-            if [i for i in self.poll_list if i[0] == "{}".format(value)]:
-                poll_selected = [i[1] for i in self.poll_list if i[0] == "{}".format(value)]
-                output = ('{} \'{}\''.format("".join(poll_selected), value))
-                stream = open('storage/poll/{}.yaml'.format(output), 'r')
-                stream2 = yaml.load(stream)
-                choices = stream2['choices']
-                if not remove in choices:
-                    client.send_host_message('Item is not a choice.')
-                    return
-                stream2['choices'] = [x for x in choices if not x == remove]
-                stream2['votes'].pop(remove.lower())
-                with open('storage/poll/{}.yaml'.format(output), 'w') as votelist_file:
-                    yaml.dump(stream2, votelist_file, default_flow_style=False)
-                return stream2['choices']
-            else:
-                return None
-        except FileNotFoundError:
-            raise ServerError('The specified poll has no file associated with it.')
-        except IndexError:
+        found = self.get_poll(value)
+        if found is None:
+            return None
+        stem, poll = found
+        if not remove in poll['choices']:
+            client.send_host_message('Item is not a choice.')
             return
+        votes = dict(poll['votes'])
+        votes.pop(remove.lower(), None)
+        self.record(stem, 'set', fields={'choices': [x for x in poll['choices'] if not x == remove], 'votes': votes})
+        return poll['choices']
 
     def add_poll_choice(self, client, value, add):
-        try:
-            if [i for i in self.poll_list if i[0] == "{}".format(value)]:
-                poll_selected = [i[1] for i in self.poll_list if i[0] == "{}".format(value)]
-                output = ('{} \'{}\''.format("".join(poll_selected), value))
-                stream = open('storage/poll/{}.yaml'.format(output), 'r')
-                stream2 = yaml.load(stream)
-                if add.lower() in [x.lower() for x in stream2['choices']]:
-                    client.send_host_message('Item already a choice.')
-                    return
-                stream2['choices'].append(str(add))
-                stream2['votes'][add.lower()] = 0
-                with open('storage/poll/{}.yaml'.format(output), 'w') as votelist_file:
-                    yaml.dump(stream2, votelist_file, default_flow_style=False)
-                return stream2['choices']
-            else:
-                return None
-        except FileNotFoundError:
-            raise ServerError('The specified poll has no file associated with it.')
-        except IndexError:
+        found = self.get_poll(value)
+        if found is None:
+            return None
+        stem, poll = found
+        if add.lower() in [x.lower() for x in poll['choices']]:
+            client.send_host_message('Item already a choice.')
             return
+        votes = dict(poll['votes'])
+        votes[add.lower()] = 0
+        self.record(stem, 'set', fields={'choices': poll['choices'] + [str(add)], 'votes': votes})
+        return poll['choices']
 
     def make_multipoll(self, value):
-        try:
-            if [i for i in self.poll_list if i[0] == "{}".format(value)]:
-                poll_selected = [i[1] for i in self.poll_list if i[0] == "{}".format(value)]
-                output = ('{} \'{}\''.format("".join(poll_selected), value))
-                stream = open('storage/poll/{}.yaml'.format(output), 'r')
-                stream2 = yaml.load(stream)
-                stream2['multivote'] = not stream2['multivote']
-                with open('storage/poll/{}.yaml'.format(output), 'w') as votelist_file:
-                    yaml.dump(stream2, votelist_file, default_flow_style=False)
-                return stream2['choices']
-            else:
-                return None
-        except FileNotFoundError:
-            raise ServerError('The specified poll has no file associated with it.')
-        except IndexError:
-            return
+        found = self.get_poll(value)
+        if found is None:
+            return None
+        self.record(found[0], 'set', fields={'multivote': not found[1]['multivote']})
+        return found[1]['choices']
 
     def add_vote(self, value, vote, client):
         tmp = time.strftime('%y-%m-%d %H:%M:%S')
-        data_c = self.server.stats_manager.user_data[client.ipid]
-        try:
-            # Open that shit up and extract the important parts.
-            poll_voting = []
-            for poll in self.poll_list:
-                if poll[0].lower() == value.lower():
-                    poll_voting = poll
-                    break
-            if not poll_voting:
-                raise ServerError('Poll not found.')
-            stream = open('storage/poll/{} \'{}\'.yaml'.format(poll_voting[1], poll_voting[0]), 'r')
-            self.vote = yaml.load(stream)
-            log = self.vote["log"]
-            ipid_voted = self.check_ipid(log, client)
-            hdid_voted = self.check_hdid(log, client)
-            if (ipid_voted or hdid_voted) and (not self.vote['multivote']):
-                # Now to log their failed vote
-                self.vote['faillog'] += (['FAILED VOTE', tmp, client.ipid, client.hdid, vote,
-                                      "{} ({}) at area {}".format(client.name, client.get_char_name(),
-                                                                  client.area.name),
-                                      "Times voted: {}, Times spoken in casing: {}, Times used doc: {}".format( data_c.data["times_voted"],data_c.data["times_talked_casing"]
-                                                                                                                , data_c.data["times_doc"])],)
-                self.write_votelist(poll_voting)
-                logger.log_serverpoll(
-                    'Vote in poll {} \'{}\' failed by {} ({}) in {}, with IP {} and HDID {}, at {}. Reason: Already voted.'.format(
-                        poll[0], vote, client.name, client.get_char_name(), client.area.name, client.ipid, client.hdid,
-                        tmp))
-                client.send_host_message('You have already voted in this poll.')
-            elif (ipid_voted or hdid_voted) and [item for item in log if item[3].lower() == vote.lower()]:
-                self.vote['faillog'] += (['FAILED VOTE', tmp, client.ipid, client.hdid, vote,
-                                      "{} ({}) at area {}".format(client.name, client.get_char_name(),
-                                                                  client.area.name),
-                                      "Times voted: {}, Times spoken in casing: {}, Times used doc: {}".format( data_c.data["times_voted"],data_c.data["times_talked_casing"]
-                                                                                                                , data_c.data["times_doc"])],)
-                self.write_votelist(poll_voting)
-                logger.log_serverpoll(
-                    'Vote in poll {} \'{}\' failed by {} ({}) in {}, with IP {} and HDID {}, at {}. Reason: Already voted.'.format(
-                        poll[0], vote, client.name, client.get_char_name(), client.area.name, client.ipid, client.hdid,
-                        tmp))
-                client.send_host_message('You have chosen this choice already.')
-            else:
-                # If they aren't a filthy rigger, they should get to this point
-                if vote.lower() in [x.lower() for x in self.vote['choices']]:
-                    self.vote['votes'][vote.lower()] += 1
-                tmp = time.strftime('%y-%m-%d %H:%M:%S')
-                self.vote['log'] += ([tmp, client.ipid, client.hdid, vote,
-                                      "{} ({}) at area {}".format(client.name, client.get_char_name(),
-                                                                  client.area.name),
-                                      "Times voted: {}, Times spoken in casing: {}, Times used doc: {}".format( data_c.data["times_voted"],data_c.data["times_talked_casing"]
-                                                                                                                , data_c.data["times_doc"])],)
-                self.write_votelist(poll_voting)
-                self.server.stats_manager.user_voted(client.ipid)
-                logger.log_serverpoll(
-                    'Vote in poll {} \'{}\' added succesfully by {} ({}) in {}, with IP {} and HDID {}, at {}.'.format(
-                        poll[0], vote, client.name, client.get_char_name(), client.area.name, client.ipid, client.hdid,
-                        tmp))
-                client.send_host_message('You have successfully voted! Congratulations.')
-        except FileNotFoundError:
+        data_c = self.server.stats_manager.get_user(client.ipid)
+        found = self.get_poll(value, ignore_case=True)
+        if found is None:
+            raise ServerError('Poll not found.')
+        stem, poll = found
+        details = ["{} ({}) at area {}".format(client.name, client.get_char_name(), client.area.name),
+                   "Times voted: {}, Times spoken in casing: {}, Times used doc: {}".format(
+                       data_c.times_voted, data_c.times_talked[CASING], data_c.times_doc)]
+        voters = self.voters[stem]
+        ipid_voted = self.check_ipid(voters, client)
+        hdid_voted = self.check_hdid(voters, client)
+        if (ipid_voted or hdid_voted) and (not poll['multivote']):
+            # Now to log their failed vote
+            self.record(stem, 'fail', entry=['FAILED VOTE', tmp, client.ipid, client.hdid, vote] + details)
             logger.log_serverpoll(
-                'Vote in poll {} \'{}\' failed by {} ({}) in {}, with IP {} and HDID {}, at {}. Reason:FileNotFound error.'.format(
-                    poll[0], vote, client.name, client.get_char_name(), client.area.name, client.ipid, client.hdid,
+                'Vote in poll {} \'{}\' failed by {} ({}) in {}, with IP {} and HDID {}, at {}. Reason: Already voted.'.format(
+                    poll['name'], vote, client.name, client.get_char_name(), client.area.name, client.ipid, client.hdid,
                     tmp))
-            client.send_host_message('Voting Error - Poll does not exist.')
-            raise ServerError('The specified poll does not have a file associated with it.')
-        except IndexError:
-            # todo: A bit redundant. There's probably a better way.
-            if vote.lower() in [x.lower() for x in self.vote['choices']]:
-                self.vote['votes'][vote.lower()] += 1
-            tmp = time.strftime('%y-%m-%d %H:%M:%S')
-            self.vote['log'] += ([tmp, client.ipid, client.hdid, vote,
-                                  "{} ({}) at area {}".format(client.name, client.get_char_name(), client.area.name),
-                                      "Times voted: {}, Times spoken in casing: {}, Times used doc: {}".format( data_c.data["times_voted"],data_c.data["times_talked_casing"]
-                                                                                                                , data_c.data["times_doc"])],)
-            self.write_votelist(poll_voting)
-            self.server.stats_manager.user_voted(client.ipid)
-            logger.log_serverpoll('Vote \'{}\' added successfully by {}'.format(vote, client.get_ip()))
+            client.send_host_message('You have already voted in this poll.')
+        elif (ipid_voted or hdid_voted) and voters.chose(client.ipid, client.hdid if hdid_voted else None, vote):
+            self.record(stem, 'fail', entry=['FAILED VOTE', tmp, client.ipid, client.hdid, vote] + details)
+            logger.log_serverpoll(
+                'Vote in poll {} \'{}\' failed by {} ({}) in {}, with IP {} and HDID {}, at {}. Reason: Already voted.'.format(
+                    poll['name'], vote, client.name, client.get_char_name(), client.area.name, client.ipid, client.hdid,
+                    tmp))
+            client.send_host_message('You have chosen this choice already.')
+        else:
+            # If they aren't a filthy rigger, they should get to this point
+            choice = None
+            if vote.lower() in [x.lower() for x in poll['choices']]:
+                choice = vote.lower()
+            self.record(stem, 'vote', choice=choice, entry=[tmp, client.ipid, client.hdid, vote] + details)
             self.server.stats_manager.user_voted(client.ipid)
+            logger.log_serverpoll(
+                'Vote in poll {} \'{}\' added succesfully by {} ({}) in {}, with IP {} and HDID {}, at {}.'.format(
+                    poll['name'], vote, client.name, client.get_char_name(), client.area.name, client.ipid, client.hdid,
+                    tmp))
             client.send_host_message('You have successfully voted! Congratulations.')
 
-    def write_votelist(self, poll):
-        with open('storage/poll/{} \'{}\'.yaml'.format(poll[1], poll[0]), 'w') as votelist_file:
-            yaml.dump(self.vote, votelist_file, default_flow_style=False)
-            #           Clear variables to default now that you're done writing.
-            self.vote = []
-
-    def check_ipid(self, log, client):
-        voted = False
-        ipid = client.ipid
-        for item in log:
-            if item[1] == ipid:
-                voted = True
-        return voted
-
-
-    def check_hdid(self, log, client):
-        voted = False
-        hdid = client.hdid
-        if hdid in client.server.ban_manager.hdid_exempt:
-            return voted
-        for item in log:
-            if item[2] == hdid:
-                voted = True
-        return voted
\ No newline at end of file
+    def check_ipid(self, voters, client):
+        return client.ipid in voters.ipids
+
+    def check_hdid(self, voters, client):
+        if client.hdid in client.server.ban_manager.hdid_exempt:
+            return False
+        return client.hdid in voters.hdids
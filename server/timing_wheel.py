@@ -0,0 +1,94 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import math
+
+
+class TimingWheel:
+    """
+    Hashed timing wheel for coarse timers such as ping timeouts. Every timer
+    has a key, and setting a timer for a key that already has one moves it,
+    so a keepalive costs two set operations instead of a cancelled handle
+    left in the event loop's heap. Expired timers are swept once per tick
+    from a single event loop callback, so they fire up to one tick late.
+    """
+
+    def __init__(self, resolution=1.0, slots=512):
+        self.resolution = resolution
+        self.slots = [set() for _ in range(slots)]
+        self.timers = {}
+        self.tick = 0
+        self.loop = None
+        self.start_time = 0
+        self.handle = None
+
+    def start(self, loop=None):
+        """ Starts ticking on the given (or current) event loop.
+
+        :param loop: event loop
+        """
+        self.loop = loop or asyncio.get_event_loop()
+        self.start_time = self.loop.time()
+        self.tick = 0
+        self.handle = self.loop.call_later(self.resolution, self.advance)
+
+    def stop(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+    def schedule(self, key, delay, callback, *args):
+        """ Sets the timer for a key, replacing any timer it already had.
+
+        :param key: hashable owner of the timer
+        :param delay: seconds until the callback runs
+        :param callback: function to call
+        :param args: arguments for the callback
+        """
+        self.cancel(key)
+        tick = self.tick + max(1, math.ceil(delay / self.resolution))
+        self.timers[key] = (tick, callback, args)
+        self.slots[tick % len(self.slots)].add(key)
+
+    def cancel(self, key):
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            self.slots[timer[0] % len(self.slots)].discard(key)
+
+    def __contains__(self, key):
+        return key in self.timers
+
+    def __len__(self):
+        return len(self.timers)
+
+    def advance(self):
+        """ Runs every timer that expired since the last tick and schedules
+        the next one, catching up if the loop was blocked.
+        """
+        now_tick = int((self.loop.time() - self.start_time) / self.resolution)
+        while self.tick < now_tick:
+            self.tick += 1
+            slot = self.slots[self.tick % len(self.slots)]
+            expired = [key for key in slot if self.timers[key][0] <= self.tick]
+            for key in expired:
+                slot.discard(key)
+                _, callback, args = self.timers.pop(key)
+                # a failing callback must not stop the wheel
+                self.loop.call_soon(callback, *args)
+        next_time = self.start_time + (self.tick + 1) * self.resolution
+        self.handle = self.loop.call_at(next_time, self.advance)
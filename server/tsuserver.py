@@ -28,22 +28,31 @@ from server.aoprotocol import AOProtocol
 from server.area_manager import AreaManager
 from server.ban_manager import BanManager
 from server.client_manager import ClientManager
+from server.connection_limiter import ConnectionLimiter
 from server.districtclient import DistrictClient
+from server.eventlog import EventLog
 from server.exceptions import ServerError
+from server.identity_manager import IdentityManager
 from server.masterserverclient import MasterServerClient
+from server.packet import Packet
 from server.serverpoll_manager import ServerpollManager
+from server.timing_wheel import TimingWheel
 from server.database import Database
 
 class TsuServer3:
     def __init__(self):
         self.config = None
         self.allowed_iniswaps = None
-        self.loaded_ips = {}
         self.load_config()
+        logger.setup_logger(debug=self.config['debug'], log_size=self.config['log_size'],
+                            log_backups=self.config['log_backups'], queue_size=self.config['log_queue_size'])
         self.load_iniswaps()
         self.load_gimps()
+        self.timers = TimingWheel()
         self.client_manager = ClientManager(self)
+        self.connection_limiter = ConnectionLimiter(self)
         self.area_manager = AreaManager(self)
+        logger.setup_area_loggers(self.area_manager.areas, self.config['log_size'], self.config['log_backups'])
         self.serverpoll_manager = ServerpollManager(self)
         self.ban_manager = BanManager()
         self.software = 'tsuserver3'
@@ -56,26 +65,35 @@ class TsuServer3:
         self.music_list = None
         self.music_list_ao2 = None
         self.music_pages_ao1 = None
+        self.char_list_packet = None
+        self.char_page_packets = None
+        self.music_list_packet = None
+        self.music_page_packets = None
+        self.server_info_packet = None
         self.backgrounds = None
+        # casefolded names, rebuilt with their lists
+        self.char_index = {}
+        self.song_index = {}
+        self.background_index = {}
         self.data = None
         self.features = set()
         self.load_characters()
         self.load_music()
         self.load_backgrounds()
         self.load_data()
-        self.load_ids()
         self.enable_features()
+        self.identity_manager = IdentityManager(self)
+        self.event_log = EventLog(self)
         self.stats_manager = Database(self)
         self.district_client = None
         self.ms_client = None
         self.rp_mode = False
         self.runner = True
         self.runtime = 0
-        logger.setup_logger(debug=self.config['debug'], log_size=self.config['log_size'],
-                            log_backups=self.config['log_backups'], areas=self.area_manager.areas)
 
     def start(self):
-        loop = asyncio.get_event_loop()
+        loop = self.new_event_loop()
+        self.timers.start(loop)
 
         bound_ip = '0.0.0.0'
         if self.config['local']:
@@ -92,7 +110,8 @@ class TsuServer3:
             self.ms_client = MasterServerClient(self)
             asyncio.ensure_future(self.ms_client.connect(), loop=loop)
 
-        logger.log_debug('Server started.')
+        loop_name = '{}.{}'.format(type(loop).__module__, type(loop).__name__)
+        logger.log_debug('Server started on {}.'.format(loop_name))
         print("Welcome to AOVserver version " + str(self.release) + "." + str(self.major_version) + "." + str(self.minor_version))
 
         loop.run_until_complete(self.load_runner())
@@ -103,21 +122,42 @@ class TsuServer3:
 
         logger.log_debug('Server shutting down.')
         self.runner = False
+        self.timers.stop()
+        self.identity_manager.close()
+        self.stats_manager.close()
+        self.serverpoll_manager.close()
+        self.event_log.close()
         ao_server.close()
         loop.run_until_complete(ao_server.wait_closed())
         loop.close()
-
-
+        logger.stop_logger()
+
+    def new_event_loop(self):
+        """ Creates and installs the event loop chosen by the event_loop
+        config option, falling back to asyncio if uvloop is not installed.
+
+        :return: the new event loop
+        """
+        if self.config['event_loop'] == 'uvloop':
+            try:
+                import uvloop
+                asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            except ImportError:
+                logger.log_debug('uvloop is not installed, using the asyncio event loop.')
+                print('uvloop is not installed, using the asyncio event loop.')
+        elif self.config['event_loop'] != 'asyncio':
+            raise ServerError('Unknown event loop: {}.'.format(self.config['event_loop']))
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.set_debug(self.config['loop_debug'])
+        loop.slow_callback_duration = self.config['slow_callback_duration']
+        return loop
 
     def get_version_string(self):
         return str(self.release) + '.' + str(self.major_version) + '.' + str(self.minor_version)
 
     def new_client(self, transport):
-        ip = transport.get_extra_info('peername')[0]
         c = self.client_manager.new_client(transport)
-        if ip not in self.loaded_ips:
-            self.loaded_ips[ip] = 0
-        self.loaded_ips[ip] += 1
         if self.rp_mode:
             c.in_rp = True
         c.server = self
@@ -156,30 +196,58 @@ class TsuServer3:
             self.config['log_size'] = 1048576
         if 'log_backups' not in self.config:
             self.config['log_backups'] = 5
+        if 'log_queue_size' not in self.config:
+            self.config['log_queue_size'] = 10000
+        if 'event_loop' not in self.config:
+            self.config['event_loop'] = 'asyncio'
+        if 'loop_debug' not in self.config:
+            self.config['loop_debug'] = False
+        if 'slow_callback_duration' not in self.config:
+            self.config['slow_callback_duration'] = 0.1
+        # sections with several settings, missing keys get their defaults
+        sections = {
+            'websocket_deflate': {'enabled': False, 'threshold': 256, 'context_takeover': False},
+            'connection_limits': {'per_ip': 16, 'ip_rate': 1, 'ip_burst': 10, 'subnet_rate': 5, 'subnet_burst': 30,
+                                  'exempt': []},
+            'send_queue': {'high_water': 65536, 'low_water': 16384, 'max_queue': 262144, 'drop_commands': ['CT']},
+            'event_log': {'max_days': 30, 'max_rows': 1000000},
+        }
+        for section, defaults in sections.items():
+            self.config[section] = dict(defaults, **(self.config.get(section) or {}))
+        if 'stats_user_cache' not in self.config:
+            self.config['stats_user_cache'] = 1024
 
     def load_gimps(self):
         with open('config/gimp.yaml', 'r', encoding='utf-8') as cfg:
             self.gimp_list = yaml.load(cfg)
 
-    def load_ids(self):
-        self.hdid_list = {}
-        # load hdids
-        try:
-            with open('storage/hd_ids.json', 'r', encoding='utf-8') as whole_list:
-                self.hdid_list = json.loads(whole_list.read())
-        except:
-            logger.log_debug('Failed to load hd_ids.json from ./storage. If hd_ids.json is exist then remove it.')
-
     def load_characters(self):
         with open('config/characters.yaml', 'r', encoding='utf-8') as chars:
-            self.char_list = yaml.load(chars)
+            char_list = yaml.load(chars)
+        char_index = {}
+        for i, ch in enumerate(char_list):
+            char_index.setdefault(ch.casefold(), i)
+        self.char_list, self.char_index = char_list, char_index
         self.build_char_pages_ao1()
+        self.char_list_packet = Packet('SC', *self.char_list).prebuild()
+        self.char_page_packets = [Packet('CI', *page).prebuild() for page in self.char_pages_ao1]
+        self.build_server_info_packet()
 
     def load_music(self):
         with open('config/music.yaml', 'r', encoding='utf-8') as music:
-            self.music_list = yaml.load(music)
+            music_list = yaml.load(music)
+        song_index = {}
+        for item in music_list:
+            song_index.setdefault(str(item['category']).casefold(), (item['category'], -1, item['category']))
+            for song in item['songs']:
+                song_index.setdefault(str(song['name']).casefold(),
+                                      (song['name'], song.get('length', -1), item['category']))
+        self.music_list, self.song_index = music_list, song_index
         self.build_music_pages_ao1()
         self.build_music_list_ao2()
+        self.music_list_packet = Packet('SM', *self.music_list_ao2).prebuild()
+        self.music_page_packets = [Packet('EM', *page).prebuild() for page in self.music_pages_ao1]
+        self.build_server_info_packet()
 
     def load_data(self):
         with open('config/data.yaml', 'r') as data:
@@ -189,10 +257,6 @@ class TsuServer3:
         with open('config/data.yaml', 'w') as data:
             json.dump(self.data, data)
 
-    def save_id(self):
-        with open('storage/hd_ids.json', 'w') as data:
-            json.dump(self.hdid_list, data)
-
     def get_ipid(self, ip):
         x = ip + str(self.config['server_number'])
         hash_object = hashlib.sha256(x.encode('utf-8'))
@@ -201,7 +265,11 @@ class TsuServer3:
 
     def load_backgrounds(self):
         with open('config/backgrounds.yaml', 'r', encoding='utf-8') as bgs:
-            self.backgrounds = yaml.load(bgs)
+            backgrounds = yaml.load(bgs)
+        background_index = {}
+        for bg in backgrounds:
+            background_index.setdefault(str(bg).casefold(), bg)
+        self.backgrounds, self.background_index = backgrounds, background_index
 
     def load_iniswaps(self):
         try:
@@ -234,6 +302,13 @@ class TsuServer3:
                 index += 1
         self.music_pages_ao1 = [self.music_pages_ao1[x:x + 10] for x in range(0, len(self.music_pages_ao1), 10)]
 
+    def build_server_info_packet(self):
+        """ Builds the SI packet once both the character and music lists are loaded. """
+        if self.char_list is None or self.music_pages_ao1 is None:
+            return
+        music_cnt = sum([len(x) for x in self.music_pages_ao1])
+        self.server_info_packet = Packet('SI', len(self.char_list), 0, music_cnt).prebuild()
+
     def build_music_list_ao2(self):
         self.music_list_ao2 = []
         # add areas first
@@ -249,27 +324,37 @@ class TsuServer3:
         return len(self.char_list) > char_id >= 0
 
     def get_char_id_by_name(self, name):
-        for i, ch in enumerate(self.char_list):
-            if ch.lower() == name.lower():
-                return i
-        raise ServerError('Character not found.')
+        try:
+            return self.char_index[name.casefold()]
+        except KeyError:
+            raise ServerError('Character not found.')
 
     def get_song_data(self, music):
-        for item in self.music_list:
-            if item['category'] == music:
-                return item['category'], -1
-            for song in item['songs']:
-                if song['name'] == music:
-                    try:
-                        return song['name'], song['length']
-                    except KeyError:
-                        return song['name'], -1
-        raise ServerError('Music not found.')
+        """ Looks up a song or category by name, ignoring case.
+
+        :param music: name
+        :return: tuple of the listed name and its length, -1 if unknown or a category
+        :raises: ServerError if there is no such song
+        """
+        try:
+            name, length, _ = self.song_index[music.casefold()]
+        except KeyError:
+            raise ServerError('Music not found.')
+        return name, length
+
+    def get_background(self, name):
+        """ Looks up a background by name, ignoring case.
+
+        :param name: name
+        :return: the listed name, or None if there is no such background
+        """
+        return self.background_index.get(name.casefold())
 
     def send_all_cmd_pred(self, cmd, *args, pred=lambda x: True):
+        packet = Packet(cmd, *args)
         for client in self.client_manager.clients:
             if pred(client):
-                client.send_command(cmd, *args)
+                client.send_packet(packet)
 
     def broadcast_global(self, client, msg, as_mod=False):
         char_name = client.get_char_name()
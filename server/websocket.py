@@ -20,6 +20,7 @@
 
 import re
 import struct
+import zlib
 from base64 import b64encode
 from hashlib import sha1
 
@@ -28,6 +29,7 @@ from server import logger
 
 class Bitmasks:
     FIN = 0x80
+    RSV1 = 0x40
     OPCODE = 0x0f
     MASKED = 0x80
     PAYLOAD_LEN = 0x7f
@@ -44,11 +46,78 @@ class Opcode:
     PONG = 0xA
 
 
+class CloseCode:
+    PROTOCOL_ERROR = 1002
+    INVALID_DATA = 1007
+    TOO_BIG = 1009
+
+
+def make_frame(payload, opcode=Opcode.TEXT, compressed=False):
+    """
+    Builds a single unmasked, unfragmented server frame around an already
+    encoded payload. Kept separate from WebSocket so that a broadcast can be
+    framed once and written to every WebSocket client as is.
+    """
+    header = bytearray()
+    payload_length = len(payload)
+    if compressed:
+        opcode |= Bitmasks.RSV1
+
+    # Normal payload
+    if payload_length <= 125:
+        header.append(Bitmasks.FIN | opcode)
+        header.append(payload_length)
+
+    # Extended payload
+    elif payload_length >= 126 and payload_length <= 65535:
+        header.append(Bitmasks.FIN | opcode)
+        header.append(Bitmasks.PAYLOAD_LEN_EXT16)
+        header.extend(struct.pack(">H", payload_length))
+
+    # Huge extended payload
+    elif payload_length < (1 << 64):
+        header.append(Bitmasks.FIN | opcode)
+        header.append(Bitmasks.PAYLOAD_LEN_EXT64)
+        header.extend(struct.pack(">Q", payload_length))
+
+    else:
+        raise Exception("Message is too big")
+
+    return bytes(header + payload)
+
+
+def unmask(payload, mask):
+    """
+    XORs a client payload with its 4 byte mask in one big-integer operation
+    instead of byte by byte.
+    """
+    length = len(payload)
+    if not length:
+        return b''
+    key = (bytes(mask) * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')).to_bytes(length, 'big')
+
+
+def deflate(payload, wbits=15, compressor=None):
+    """
+    Compresses a message for permessage-deflate. Without a compressor every
+    message starts from an empty window (no context takeover), so the result
+    only depends on the payload.
+    """
+    if compressor is None:
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -wbits)
+    data = compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    if data.endswith(b'\x00\x00\xff\xff'):
+        data = data[:-4]
+    return data
+
+
 class WebSocket:
     """
     State data for clients that are connected via a WebSocket that wraps
     over a conventional TCP connection.
     """
+    max_message = 65536
 
     def __init__(self, client, protocol):
         self.client = client
@@ -57,6 +126,16 @@ class WebSocket:
         self.keep_alive = True
         self.handshake_done = False
         self.valid = False
+        self.buffer = bytearray()
+        self.fragments = None
+        self.fragment_opcode = None
+        self.fragment_size = 0
+        self.fragment_compressed = False
+        self.deflate = False
+        self.deflate_threshold = 0
+        self.deflate_wbits = 15
+        self.compressor = None
+        self.decompressor = None
 
     def handle(self, data):
         if not self.handshake_done:
@@ -64,71 +143,219 @@ class WebSocket:
         return self.parse(data)
 
     def parse(self, data):
-        b1, b2 = 0, 0
-        if len(data) >= 2:
-            b1, b2 = data[0], data[1]
-
-        fin = b1 & Bitmasks.FIN
-        opcode = b1 & Bitmasks.OPCODE
-        masked = b2 & Bitmasks.MASKED
-        payload_length = b2 & Bitmasks.PAYLOAD_LEN
-
-        if not b1:
-            # Connection closed
-            self.keep_alive = 0
-            return
-        if opcode == Opcode.CLOSE_CONN:
-            # Connection close requested
-            self.keep_alive = 0
-            return
-        if not masked:
-            # Client was not masked (spec violation)
-            logger.log_debug("ws: client was not masked.", self.client)
-            self.keep_alive = 0
-            print(data)
-            return
-        if opcode == Opcode.CONTINUATION:
-            # No continuation frames supported
-            logger.log_debug("ws: client tried to send continuation frame.", self.client)
-            return
-        elif opcode == Opcode.BINARY:
-            # No binary frames supported
-            logger.log_debug("ws: client tried to send binary frame.", self.client)
-            return
-        elif opcode == Opcode.TEXT:
-            def opcode_handler(s, msg):
-                return msg
-        elif opcode == Opcode.PING:
-            opcode_handler = self.send_pong
-        elif opcode == Opcode.PONG:
-            opcode_handler = lambda s, msg: None
-        else:
-            # Unknown opcode
-            logger.log_debug("ws: unknown opcode!", self.client)
-            self.keep_alive = 0
-            return
-
-        mask_offset = 2
-        if payload_length == 126:
-            payload_length = struct.unpack(">H", data[2:4])[0]
-            mask_offset = 4
-        elif payload_length == 127:
-            payload_length = struct.unpack(">Q", data[2:10])[0]
-            mask_offset = 10
-
-        masks = data[mask_offset:mask_offset + 4]
-        decoded = ""
-        for char in data[mask_offset + 4:payload_length + mask_offset + 4]:
-            char ^= masks[len(decoded) % 4]
-            decoded += chr(char)
-
-        return opcode_handler(self, decoded)
+        """ Adds data to the frame buffer and unpacks every frame that is
+        now complete. Control frames are answered here.
+
+        :param data: bytes received from the transport
+        :return: payloads of all completed text messages, joined
+        """
+        buf = self.buffer
+        buf.extend(data)
+        messages = []
+        while self.keep_alive and len(buf) >= 2:
+            b1, b2 = buf[0], buf[1]
+            fin = b1 & Bitmasks.FIN
+            opcode = b1 & Bitmasks.OPCODE
+            compressed = b1 & Bitmasks.RSV1
+            payload_length = b2 & Bitmasks.PAYLOAD_LEN
+
+            if not b2 & Bitmasks.MASKED:
+                # Client was not masked (spec violation)
+                logger.log_debug("ws: client was not masked.", self.client)
+                self.close(CloseCode.PROTOCOL_ERROR)
+                break
+
+            mask_offset = 2
+            if payload_length == 126:
+                if len(buf) < 4:
+                    break
+                payload_length = int.from_bytes(buf[2:4], 'big')
+                mask_offset = 4
+            elif payload_length == 127:
+                if len(buf) < 10:
+                    break
+                payload_length = int.from_bytes(buf[2:10], 'big')
+                mask_offset = 10
+
+            if payload_length + self.fragment_size > self.max_message:
+                logger.log_debug("ws: message too big.", self.client)
+                self.close(CloseCode.TOO_BIG)
+                break
+
+            frame_end = mask_offset + 4 + payload_length
+            if len(buf) < frame_end:
+                break
+            if compressed and (not self.deflate or opcode not in (Opcode.TEXT, Opcode.BINARY)):
+                logger.log_debug("ws: unexpected compressed frame.", self.client)
+                self.close(CloseCode.PROTOCOL_ERROR)
+                break
+
+            payload = unmask(buf[mask_offset + 4:frame_end], buf[mask_offset:mask_offset + 4])
+            del buf[:frame_end]
+
+            if opcode == Opcode.TEXT or opcode == Opcode.BINARY:
+                if self.fragments is not None:
+                    logger.log_debug("ws: client interrupted a fragmented message.", self.client)
+                    self.close(CloseCode.PROTOCOL_ERROR)
+                    break
+                if opcode == Opcode.BINARY:
+                    # No binary frames supported, but their fragments must be skipped
+                    logger.log_debug("ws: client tried to send binary frame.", self.client)
+                if not fin:
+                    self.fragments = [payload]
+                    self.fragment_opcode = opcode
+                    self.fragment_size = len(payload)
+                    self.fragment_compressed = compressed
+                elif opcode == Opcode.TEXT:
+                    if compressed:
+                        payload = self.inflate(payload)
+                        if payload is None:
+                            break
+                    messages.append(payload)
+            elif opcode == Opcode.CONTINUATION:
+                if self.fragments is None:
+                    logger.log_debug("ws: continuation frame without a message.", self.client)
+                    self.close(CloseCode.PROTOCOL_ERROR)
+                    break
+                self.fragments.append(payload)
+                self.fragment_size += len(payload)
+                if fin:
+                    payload = b''.join(self.fragments)
+                    self.fragments = None
+                    self.fragment_size = 0
+                    if self.fragment_opcode == Opcode.TEXT:
+                        if self.fragment_compressed:
+                            payload = self.inflate(payload)
+                            if payload is None:
+                                break
+                        messages.append(payload)
+            elif opcode == Opcode.PING:
+                self.send_pong(payload)
+            elif opcode == Opcode.PONG:
+                pass
+            elif opcode == Opcode.CLOSE_CONN:
+                # Connection close requested, echo the status code back
+                self.close(payload[:2])
+                break
+            else:
+                # Unknown opcode
+                logger.log_debug("ws: unknown opcode!", self.client)
+                self.close(CloseCode.PROTOCOL_ERROR)
+                break
+
+        return b''.join(messages)
+
+    def inflate(self, payload):
+        """ Decompresses a permessage-deflate message, closing the
+        connection if it is corrupt or inflates past max_message.
+
+        :param payload: compressed message
+        :return: the message, or None if the connection was closed
+        """
+        try:
+            data = self.decompressor.decompress(payload + b'\x00\x00\xff\xff', self.max_message + 1)
+        except zlib.error:
+            logger.log_debug("ws: invalid compressed message.", self.client)
+            self.close(CloseCode.INVALID_DATA)
+            return None
+        if len(data) > self.max_message:
+            logger.log_debug("ws: message too big.", self.client)
+            self.close(CloseCode.TOO_BIG)
+            return None
+        return data
+
+    def frame(self, payload):
+        """ Frames a text payload for this client, compressing it if
+        permessage-deflate was negotiated and the payload is big enough.
+
+        :param payload: encoded message
+        :return: frame bytes
+        """
+        if not self.deflate or len(payload) < self.deflate_threshold:
+            return make_frame(payload)
+        return make_frame(deflate(payload, self.deflate_wbits, self.compressor), compressed=True)
+
+    def packet_frame(self, packet):
+        """ Like frame, but reuses the frames cached on a broadcast Packet
+        whenever they are valid for this client.
+
+        :param packet: Packet to send
+        :return: frame bytes
+        """
+        if not self.deflate or len(packet.raw) < self.deflate_threshold:
+            return packet.frame
+        if self.compressor is None and self.deflate_wbits == 15:
+            return packet.deflated_frame
+        return self.frame(packet.raw)
+
+    def negotiate_deflate(self, message):
+        """ Picks the first permessage-deflate offer in the handshake that
+        the server can honour and sets up compression for it.
+
+        :param message: handshake request
+        :return: the Sec-WebSocket-Extensions response value, or None
+        """
+        config = self.client.server.config['websocket_deflate']
+        if not config['enabled']:
+            return None
+        headers = re.findall('\nsec-websocket-extensions[ \t]*:[ \t]*(.*)\r\n', message, re.IGNORECASE)
+        for offer in ','.join(headers).split(','):
+            params = [param.strip() for param in offer.split(';') if param.strip()]
+            if not params:
+                # no header at all, or an empty item in the list
+                continue
+            name, *params = params
+            if name != 'permessage-deflate':
+                continue
+            takeover = config['context_takeover']
+            wbits = 15
+            for param in params:
+                key, _, value = param.partition('=')
+                key, value = key.strip(), value.strip().strip('"')
+                if key == 'server_no_context_takeover' and not value:
+                    takeover = False
+                elif key == 'client_no_context_takeover' and not value:
+                    pass
+                elif key == 'server_max_window_bits' and value.isdigit() and 9 <= int(value) <= 15:
+                    # zlib cannot produce raw deflate streams with an 8 bit window
+                    wbits = int(value)
+                elif key == 'client_max_window_bits' and (not value or value.isdigit() and 8 <= int(value) <= 15):
+                    pass
+                else:
+                    break
+            else:
+                self.deflate = True
+                self.deflate_threshold = config['threshold']
+                self.deflate_wbits = wbits
+                self.decompressor = zlib.decompressobj(-15)
+                response = ['permessage-deflate']
+                if takeover:
+                    self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -wbits)
+                else:
+                    response.append('server_no_context_takeover')
+                if wbits != 15:
+                    response.append('server_max_window_bits={}'.format(wbits))
+                return '; '.join(response)
+        return None
+
+    def close(self, code):
+        """ Sends a close frame and drops the connection.
+
+        :param code: close status code as int, or the raw bytes to echo
+        """
+        if isinstance(code, int):
+            code = struct.pack(">H", code)
+        self.keep_alive = False
+        self.buffer.clear()
+        self.fragments = None
+        self.client.write(make_frame(code, Opcode.CLOSE_CONN))
+        self.client.disconnect()
 
     def send_message(self, message):
         self.send_text(message)
 
-    def send_pong(self, message):
-        self.send_text(message, Opcode.PONG)
+    def send_pong(self, payload):
+        self.client.write(make_frame(bytes(payload), Opcode.PONG))
 
     def send_text(self, message, opcode=Opcode.TEXT):
         """
@@ -144,35 +371,15 @@ class WebSocket:
         else:
             raise TypeError("Message must be either str or bytes")
 
-        header = bytearray()
-        payload = message.encode("utf-8")
-        payload_length = len(payload)
-
-        # Normal payload
-        if payload_length <= 125:
-            header.append(Bitmasks.FIN | opcode)
-            header.append(payload_length)
-
-        # Extended payload
-        elif payload_length >= 126 and payload_length <= 65535:
-            header.append(Bitmasks.FIN | opcode)
-            header.append(Bitmasks.PAYLOAD_LEN_EXT16)
-            header.extend(struct.pack(">H", payload_length))
-
-        # Huge extended payload
-        elif payload_length < (1 << 64):
-            header.append(Bitmasks.FIN | opcode)
-            header.append(Bitmasks.PAYLOAD_LEN_EXT64)
-            header.extend(struct.pack(">Q", payload_length))
-
+        if opcode == Opcode.TEXT:
+            self.client.write(self.frame(message.encode("utf-8")))
         else:
-            raise Exception("Message is too big")
-
-        self.transport.write(header + payload)
+            self.client.write(make_frame(message.encode("utf-8"), opcode))
 
     def handshake(self, data):
+        head, _, frames = data.partition(b'\r\n\r\n')
         try:
-            message = data[0:1024].decode().strip()
+            message = head[0:1024].decode().strip() + '\r\n'
         except UnicodeDecodeError:
             return False
 
@@ -189,20 +396,24 @@ class WebSocket:
             self.keep_alive = False
             return False
 
-        response = self.make_handshake_response(key)
+        response = self.make_handshake_response(key, self.negotiate_deflate(message))
         print(response.encode())
         self.transport.write(response.encode())
+        # frames the client sent right behind the request
+        self.buffer.extend(frames)
         self.handshake_done = True
         self.valid = True
         return True
 
-    def make_handshake_response(self, key):
-        return \
+    def make_handshake_response(self, key, extensions=None):
+        response = \
             'HTTP/1.1 101 Switching Protocols\r\n' \
             'Upgrade: websocket\r\n' \
             'Connection: Upgrade\r\n' \
-            'Sec-WebSocket-Accept: %s\r\n' \
-            '\r\n' % self.calculate_response_key(key)
+            'Sec-WebSocket-Accept: %s\r\n' % self.calculate_response_key(key)
+        if extensions:
+            response += 'Sec-WebSocket-Extensions: %s\r\n' % extensions
+        return response + '\r\n'
 
     def calculate_response_key(self, key):
         GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
@@ -0,0 +1,28 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import functools
+
+import pytest
+import yaml
+
+
+@pytest.fixture
+def old_yaml_load(monkeypatch):
+    """ The server is written against PyYAML's old default loader, which
+    newer versions no longer fall back to. """
+    monkeypatch.setattr(yaml, 'load', functools.partial(yaml.load, Loader=yaml.Loader))
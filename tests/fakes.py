@@ -0,0 +1,169 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Stand-ins for the server objects the tested classes talk to, so that a
+test does not need the config folder, sockets or an event loop.
+"""
+
+
+class FakeTransport:
+    def __init__(self, ip='127.0.0.1'):
+        self.ip = ip
+        self.written = []
+        self.closing = False
+        self.aborted = False
+
+    def get_extra_info(self, name):
+        return (self.ip, 50000)
+
+    def set_write_buffer_limits(self, high, low):
+        pass
+
+    def write(self, data):
+        self.written.append(data)
+
+    def writelines(self, lines):
+        self.written.extend(lines)
+
+    def is_closing(self):
+        return self.closing
+
+    def abort(self):
+        self.aborted = True
+        self.closing = True
+
+    def close(self):
+        self.closing = True
+
+
+CHARACTERS = ['Phoenix', 'Miles', 'Maya']
+
+
+class FakeArea:
+    def __init__(self, area_id=0, clients=()):
+        self.id = area_id
+        self.name = 'Area {}'.format(area_id)
+        self.clients = set(clients)
+
+    def char_changed(self, client, old_char_id):
+        pass
+
+
+class FakeAreaManager:
+    def __init__(self):
+        self.areas = [FakeArea(0), FakeArea(1)]
+
+    def default_area(self):
+        return self.areas[0]
+
+
+class FakeClient:
+    """ Records what is sent to it instead of writing to a transport. """
+
+    def __init__(self, server=None, char_id=0, ipid='ipid', hdid='hdid', muted=False, evidence=None):
+        self.server = server
+        self.id = 0
+        self.char_id = char_id
+        self.name = ''
+        self.ipid = ipid
+        self.hdid = hdid
+        self.is_mod = False
+        self.is_ooc_muted = muted
+        self.area = FakeArea()
+        self.transport = FakeTransport()
+        # local evidence ids by area evidence id
+        self.evidence = evidence or {}
+        self.messages = []
+        self.packets = []
+        self.written = []
+        self.disconnected = False
+
+    def get_ipreal(self):
+        return self.transport.ip
+
+    def get_char_name(self):
+        return CHARACTERS[self.char_id] if self.char_id >= 0 else 'CHAR_SELECT'
+
+    def get_local_evidence_id(self, evi_id):
+        return self.evidence.get(evi_id, evi_id)
+
+    def set_name(self, name):
+        self.name = name
+
+    def send_host_message(self, msg):
+        self.messages.append(msg)
+
+    def send_packet(self, packet):
+        self.packets.append(packet)
+
+    def write(self, data, droppable=False):
+        self.written.append(data)
+
+    def disconnect(self):
+        self.disconnected = True
+
+
+class FakeBanManager:
+    def __init__(self):
+        self.bans = {}
+        self.ban_listeners = []
+        self.hdid_exempt = {}
+
+    def is_banned(self, ipid):
+        return self.bans.get(ipid, False)
+
+    def add_ban(self, ipid):
+        if not self.is_banned(ipid):
+            self.bans[ipid] = True
+            for listener in self.ban_listeners:
+                listener(ipid, True)
+
+    def remove_ban(self, client, ipid):
+        if self.bans.pop(ipid):
+            for listener in self.ban_listeners:
+                listener(ipid, False)
+
+
+class FakeTimers:
+    def __init__(self):
+        self.timers = {}
+
+    def schedule(self, key, delay, callback, *args):
+        self.timers[key] = (delay, callback, args)
+
+    def cancel(self, key):
+        self.timers.pop(key, None)
+
+
+class FakeServer:
+    def __init__(self, **config):
+        self.config = {
+            'playerlimit': 100,
+            'music_change_floodguard': {'times_per_interval': 1, 'interval_length': 0, 'mute_length': 0},
+            'wtce_floodguard': {'times_per_interval': 1, 'interval_length': 0, 'mute_length': 0},
+            'send_queue': {'high_water': 65536, 'low_water': 16384, 'max_queue': 262144, 'drop_commands': ['CT']},
+        }
+        self.config.update(config)
+        self.char_list = list(CHARACTERS)
+        self.music_list = []
+        self.area_manager = FakeAreaManager()
+        self.timers = FakeTimers()
+        self.client_manager = None
+
+    def get_ipid(self, ip):
+        return 'ipid-' + ip
@@ -0,0 +1,131 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import types
+
+import pytest
+
+from server.area_manager import AreaManager
+from server.client_manager import ClientManager
+from server.exceptions import AreaError, ClientError
+from server.tsuserver import TsuServer3
+from tests.fakes import FakeServer, FakeTransport
+
+
+@pytest.fixture
+def server():
+    server = FakeServer(hostname='host')
+    server.rp_mode = False
+    server.client_manager = ClientManager(server)
+    server.area_manager.areas = [AreaManager.Area(0, server, 'Basement', 'gs4', False, True),
+                                 AreaManager.Area(1, server, 'Courtroom', 'gs4', False, False)]
+    for name in ('new_client', 'remove_client', 'is_valid_char_id'):
+        setattr(server, name, types.MethodType(getattr(TsuServer3, name), server))
+    return server
+
+
+def join(server, ip, char_id=-1):
+    client = server.new_client(FakeTransport(ip))
+    if char_id != -1:
+        client.change_character(char_id)
+    return client
+
+
+def chars_check(area):
+    return area.get_chars_check_packet().raw
+
+
+def test_join_and_change_character(server):
+    area = server.area_manager.areas[0]
+    assert chars_check(area) == b'CharsCheck#0#0#0#%'
+    packet = area.get_chars_check_packet()
+    client = join(server, '10.0.0.1')
+    assert area.char_clients == {}
+    assert area.get_chars_check_packet() is packet
+    client.change_character(0)
+    assert area.get_char_client(0) is client
+    assert not area.is_char_available(0)
+    assert chars_check(area) == b'CharsCheck#-1#0#0#%'
+    packet = area.get_chars_check_packet()
+    assert area.get_chars_check_packet() is packet
+    client.change_character(2)
+    assert area.char_clients == {2: client}
+    assert area.is_char_available(0)
+    assert chars_check(area) == b'CharsCheck#0#0#-1#%'
+
+
+def test_taking_a_character(server):
+    area = server.area_manager.areas[0]
+    first = join(server, '10.0.0.1', 1)
+    second = join(server, '10.0.0.2')
+    with pytest.raises(ClientError):
+        second.change_character(1)
+    assert area.get_char_client(1) is first
+    second.change_character(1, force=True)
+    assert first.char_id == -1
+    assert area.char_clients == {1: second}
+    assert chars_check(area) == b'CharsCheck#0#-1#0#%'
+
+
+def test_moving_between_areas(server):
+    basement, courtroom = server.area_manager.areas
+    first = join(server, '10.0.0.1', 0)
+    chars_check(basement)
+    chars_check(courtroom)
+    first.change_area(courtroom)
+    assert basement.char_clients == {}
+    assert chars_check(basement) == b'CharsCheck#0#0#0#%'
+    assert courtroom.char_clients == {0: first}
+    assert chars_check(courtroom) == b'CharsCheck#-1#0#0#%'
+    # the character is taken in the courtroom, so the second one gets another
+    second = join(server, '10.0.0.2', 0)
+    second.change_area(courtroom)
+    assert second.char_id in (1, 2)
+    assert courtroom.char_clients == {0: first, second.char_id: second}
+    assert chars_check(courtroom).count(b'-1') == 2
+    assert chars_check(basement) == b'CharsCheck#0#0#0#%'
+
+
+def test_disconnect_frees_the_character(server):
+    area = server.area_manager.areas[0]
+    first = join(server, '10.0.0.1', 0)
+    second = join(server, '10.0.0.2', 1)
+    assert chars_check(area) == b'CharsCheck#-1#-1#0#%'
+    server.remove_client(first)
+    assert area.char_clients == {1: second}
+    assert chars_check(area) == b'CharsCheck#0#-1#0#%'
+
+
+def test_random_available_character(server):
+    area = server.area_manager.areas[0]
+    join(server, '10.0.0.1', 0)
+    join(server, '10.0.0.2', 2)
+    for _ in range(20):
+        assert area.get_rand_avail_char_id() == 1
+    join(server, '10.0.0.3', 1)
+    with pytest.raises(AreaError):
+        area.get_rand_avail_char_id()
+
+
+def test_chars_check_follows_a_longer_char_list(server):
+    area = server.area_manager.areas[0]
+    join(server, '10.0.0.1', 1)
+    assert chars_check(area) == b'CharsCheck#0#-1#0#%'
+    server.char_list.append('Franziska')
+    assert chars_check(area) == b'CharsCheck#0#-1#0#0#%'
+    join(server, '10.0.0.2', 3)
+    assert chars_check(area) == b'CharsCheck#0#-1#0#-1#%'
@@ -0,0 +1,123 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from server.client_manager import ClientManager
+from server.constants import TargetType
+from tests.fakes import FakeServer, FakeTransport
+
+
+@pytest.fixture
+def manager():
+    server = FakeServer()
+    server.client_manager = ClientManager(server)
+    return server.client_manager
+
+
+def connect(manager, ip, name='', hdid='', char_id=-1):
+    client = manager.new_client(FakeTransport(ip))
+    if hdid:
+        client.set_hdid(hdid)
+    if name:
+        client.set_name(name)
+    if char_id != -1:
+        client.set_char_id(char_id)
+    return client
+
+
+def targets(manager, key, value, client=None, local=False):
+    return {target.id for target in manager.get_targets(client, key, value, local)}
+
+
+def test_lookup_by_each_key(manager):
+    first = connect(manager, '10.0.0.1', 'Alice', 'hd1', 0)
+    second = connect(manager, '10.0.0.2', 'Bob', 'hd2', 1)
+    assert targets(manager, TargetType.ID, str(second.id)) == {second.id}
+    assert targets(manager, TargetType.ID, 'x') == set()
+    assert targets(manager, TargetType.IPID, first.ipid) == {first.id}
+    assert targets(manager, TargetType.HDID, 'hd2') == {second.id}
+    assert targets(manager, TargetType.OOC_NAME, ' alice ') == {first.id}
+    assert targets(manager, TargetType.CHAR_NAME, 'MILES') == {second.id}
+
+
+def test_ip_matches_prefix_of_value(manager):
+    first = connect(manager, '10.0.0.1')
+    connect(manager, '10.0.0.2')
+    # the value only has to start with the client's address
+    assert targets(manager, TargetType.IP, '10.0.0.1') == {first.id}
+    assert targets(manager, TargetType.IP, '10.0.0.1:1234') == {first.id}
+    assert targets(manager, TargetType.IP, '10.0.0') == set()
+
+
+def test_all_keys(manager):
+    first = connect(manager, '10.0.0.1', 'Alice', 'hd1')
+    second = connect(manager, '10.0.0.2', str(first.id))
+    assert targets(manager, TargetType.ALL, str(first.id)) == {first.id, second.id}
+
+
+def test_changes_move_clients_between_keys(manager):
+    client = connect(manager, '10.0.0.1', 'Alice', 'hd1', 0)
+    client.set_name('Alicia')
+    client.set_hdid('hd9')
+    client.set_char_id(2)
+    assert targets(manager, TargetType.OOC_NAME, 'alice') == set()
+    assert targets(manager, TargetType.OOC_NAME, 'alicia') == {client.id}
+    assert targets(manager, TargetType.HDID, 'hd1') == set()
+    assert targets(manager, TargetType.HDID, 'hd9') == {client.id}
+    assert targets(manager, TargetType.CHAR_NAME, 'phoenix') == set()
+    assert targets(manager, TargetType.CHAR_NAME, 'maya') == {client.id}
+    assert 'alice' not in manager.by_name
+    assert 'phoenix' not in manager.by_char
+
+
+def test_clients_sharing_a_key(manager):
+    first = connect(manager, '10.0.0.1', 'Alice')
+    second = connect(manager, '10.0.0.1', 'alice')
+    assert targets(manager, TargetType.OOC_NAME, 'ALICE') == {first.id, second.id}
+    assert targets(manager, TargetType.IPID, first.ipid) == {first.id, second.id}
+
+
+def test_disconnect_removes_every_key(manager):
+    client = connect(manager, '10.0.0.1', 'Alice', 'hd1', 0)
+    manager.remove_client(client)
+    for index in (manager.by_id, manager.by_ip, manager.by_ipid, manager.by_hdid, manager.by_name,
+                  manager.by_char):
+        assert index == {}
+    # the id is handed out again
+    assert connect(manager, '10.0.0.2').id == client.id
+
+
+def test_local_targets(manager):
+    first = connect(manager, '10.0.0.1', 'Alice')
+    second = connect(manager, '10.0.0.2', 'alice')
+    second.area = manager.server.area_manager.areas[1]
+    assert targets(manager, TargetType.OOC_NAME, 'alice', first, local=True) == {first.id}
+    assert targets(manager, TargetType.OOC_NAME, 'alice', second, local=True) == {second.id}
+
+
+def test_empty_names_are_not_indexed(manager):
+    connect(manager, '10.0.0.1')
+    assert targets(manager, TargetType.OOC_NAME, '') == set()
+    assert targets(manager, TargetType.HDID, '') == set()
+
+
+def test_name_in_use(manager):
+    client = connect(manager, '10.0.0.1', 'Alice')
+    assert not client.is_valid_name('Alice')
+    assert client.is_valid_name('alice')
+    assert client.is_valid_name('Bob')
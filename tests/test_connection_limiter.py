@@ -0,0 +1,120 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from server import connection_limiter
+from server.connection_limiter import ConnectionLimiter
+from tests.fakes import FakeServer
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(connection_limiter.time, 'monotonic', clock)
+    return clock
+
+
+def make_limiter(players=0, **limits):
+    config = {'per_ip': 3, 'ip_rate': 1, 'ip_burst': 2, 'subnet_rate': 5, 'subnet_burst': 4, 'exempt': []}
+    config.update(limits)
+    server = FakeServer(connection_limits=config, playerlimit=10)
+    server.get_player_count = lambda: players
+    return ConnectionLimiter(server)
+
+
+def test_burst_then_rate(clock):
+    limiter = make_limiter()
+    assert limiter.admit('1.2.3.4')
+    assert limiter.admit('1.2.3.4')
+    assert not limiter.admit('1.2.3.4')
+    assert limiter.rejected['rate'] == 1
+    clock.now += 1
+    assert limiter.admit('1.2.3.4')
+
+
+def test_per_ip_cap_and_release(clock):
+    limiter = make_limiter(ip_burst=10, subnet_burst=10)
+    for _ in range(3):
+        assert limiter.admit('1.2.3.4')
+    assert not limiter.admit('1.2.3.4')
+    assert limiter.rejected['per_ip'] == 1
+    limiter.release('1.2.3.4')
+    assert limiter.admit('1.2.3.4')
+    for _ in range(4):
+        limiter.release('1.2.3.4')
+    assert '1.2.3.4' not in limiter.connections
+
+
+def test_subnet_is_shared(clock):
+    limiter = make_limiter()
+    for last in range(4):
+        assert limiter.admit('10.0.0.{}'.format(last))
+    assert not limiter.admit('10.0.0.200')
+    assert limiter.admit('10.0.1.1')
+
+
+def test_ipv6_subnet():
+    assert ConnectionLimiter.get_subnet('2001:db8::1') == ConnectionLimiter.get_subnet('2001:db8::ffff:1')
+    assert ConnectionLimiter.get_subnet('2001:db8::1') != ConnectionLimiter.get_subnet('2001:db8:0:1::1')
+    assert ConnectionLimiter.get_subnet('::ffff:10.0.0.1') == ConnectionLimiter.get_subnet('::ffff:10.0.0.2')
+
+
+def test_player_limit(clock):
+    limiter = make_limiter(players=10)
+    assert not limiter.admit('1.2.3.4')
+    assert limiter.rejected['full'] == 1
+
+
+def test_exempt_address(clock):
+    limiter = make_limiter(exempt=['127.0.0.1'])
+    for _ in range(20):
+        assert limiter.admit('127.0.0.1')
+    assert limiter.connections['127.0.0.1'] == 20
+
+
+def test_exempt_address_still_counts_players(clock):
+    limiter = make_limiter(players=10, exempt=['127.0.0.1'])
+    assert not limiter.admit('127.0.0.1')
+
+
+def test_bucket_refill_is_capped(clock):
+    limiter = make_limiter()
+    limiter.admit('1.2.3.4')
+    clock.now += 100
+    assert limiter.admit('1.2.3.4')
+    assert limiter.admit('1.2.3.4')
+    assert not limiter.admit('1.2.3.4')
+
+
+def test_prune_drops_full_buckets(clock):
+    limiter = make_limiter()
+    limiter.admit('1.2.3.4')
+    limiter.prune()
+    assert '1.2.3.4' in limiter.ip_buckets
+    clock.now += 10
+    limiter.prune()
+    assert limiter.ip_buckets == {}
+    assert limiter.subnet_buckets == {}
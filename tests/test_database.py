@@ -0,0 +1,229 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import types
+
+import pytest
+
+from server import database
+from tests.fakes import FakeServer
+
+# 10:00 UTC on day 100
+NOW = 100 * 86400 + 10 * 3600
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'storage' / 'stats').mkdir(parents=True)
+    monkeypatch.setattr(database, 'time', types.SimpleNamespace(time=lambda: NOW))
+    db = database.Database(FakeServer(stats_user_cache=2))
+    yield db
+    db.close()
+
+
+def fill_activity(db, daily, hourly):
+    with db.conn:
+        db.conn.executemany('INSERT INTO activity_daily VALUES (?,0,\'char\',?,?)', daily)
+        db.conn.executemany('INSERT INTO activity_hourly VALUES (?,0,\'char\',?,?)', hourly)
+    db.rolled_day = max(day for day, _, _ in daily)
+
+
+def top(db, hours):
+    async def query():
+        future, covered = db.top_activity('char', 'name', hours)
+        return dict(await future), covered
+    return asyncio.run(query())
+
+
+ACTIVITY = dict(
+    daily=[(98, 'Maya', 1000), (99, 'Phoenix', 24)],
+    hourly=[(98 * 24 + 10, 'Maya', 100), (98 * 24 + 11, 'Maya', 7),
+            (99 * 24 + 10, 'Phoenix', 5), (99 * 24 + 11, 'Phoenix', 3), (99 * 24 + 23, 'Phoenix', 2),
+            (100 * 24, 'Phoenix', 1), (100 * 24 + 10, 'Miles', 4)])
+
+
+def test_top_activity_reads_partial_day_from_hourly_rows(db):
+    fill_activity(db, **ACTIVITY)
+    # 11:00 on day 99 up to now, day 99 is not fully inside the period
+    assert top(db, 24) == ({'Phoenix': 3 + 2 + 1, 'Miles': 4}, 24)
+
+
+def test_top_activity_reads_full_days_from_rollup(db):
+    fill_activity(db, **ACTIVITY)
+    # 11:00 on day 98 up to now, day 99 counts through its rollup only
+    assert top(db, 48) == ({'Maya': 7, 'Phoenix': 24 + 1, 'Miles': 4}, 48)
+
+
+def test_top_activity_counts_whole_first_day_when_hours_are_pruned(db):
+    fill_activity(db, **ACTIVITY)
+    db.hourly_days = 1
+    assert top(db, 48) == ({'Maya': 1000, 'Phoenix': 24 + 1, 'Miles': 4}, 48 + 11)
+
+
+@pytest.fixture
+def writer(tmp_path):
+    path = str(tmp_path / 'writer.db')
+    writer = database.DatabaseWriter(path)
+    writer.submit(lambda conn: conn.execute('CREATE TABLE t (x INTEGER)')).result()
+    yield writer
+    writer.close()
+
+
+def rows(writer):
+    return writer.submit(database.fetch_all, 'SELECT x FROM t ORDER BY x', ()).result()
+
+
+def test_failed_batch_is_retried_with_the_next_one(writer):
+    writer.write(1, [('INSERT INTO t VALUES (?)', [(1,)]), ('INSERT INTO missing VALUES (?)', [(1,)])])
+    assert rows(writer) == []
+    assert writer.written == 0
+    writer.submit(lambda conn: conn.execute('CREATE TABLE missing (x INTEGER)')).result()
+    writer.write(2, [('INSERT INTO t VALUES (?)', [(2,)])])
+    assert rows(writer) == [(1,), (2,)]
+    assert writer.written == 2
+    assert writer.failed == []
+
+
+def test_failing_statement_is_dropped_after_max_retries(writer):
+    writer.write(1, [('INSERT INTO t VALUES (?)', [(1,)]), ('INSERT INTO missing VALUES (?)', [(1,)])])
+    for generation in range(2, writer.max_retries + 2):
+        writer.write(generation, [('INSERT INTO t VALUES (?)', [(generation,)])])
+    assert rows(writer) == [(x,) for x in range(1, writer.max_retries + 2)]
+    assert writer.written == writer.max_retries + 1
+    assert writer.failed == []
+    writer.write(10, [('INSERT INTO t VALUES (?)', [(10,)])])
+    assert rows(writer)[-1] == (10,)
+    assert writer.written == 10
+
+
+def connect(db, *ipids):
+    async def run():
+        for ipid in ipids:
+            db.connect_data(ipid, 'hdid')
+        while db.loading:
+            await asyncio.sleep(0.001)
+    asyncio.run(run())
+
+
+def stored_user(db, ipid):
+    db.writer.submit(lambda conn: None).result()
+    row = db.conn.execute('SELECT * FROM user WHERE ipid = ?', (ipid,)).fetchone()
+    return None if row is None else database.userData.from_row(row).row()
+
+
+def test_connect_loads_and_counts_users(db):
+    connect(db, 'a', 'a', 'b')
+    assert db.user_data['a'].times_connected == 1
+    assert db.user_data['b'].times_connected == 0
+    db.save_alldata()
+    # c is cached once its row has been read, after a
+    connect(db, 'c', 'a')
+    assert list(db.user_data) == ['a', 'c']
+    assert db.user_data['a'].times_connected == 2
+
+
+def test_evicted_user_is_written_back(db):
+    connect(db, 'a')
+    db.kicked_user('a')
+    connect(db, 'b', 'c')
+    assert 'a' not in db.user_data
+    assert db.evicted['a'][0].times_kicked == 1
+    db.save_alldata()
+    assert stored_user(db, 'a')[5] == 1
+    db.save_alldata()
+    assert 'a' not in db.evicted
+
+
+def test_evicted_user_is_reloaded_before_it_is_written(db):
+    connect(db, 'a')
+    db.save_alldata()
+    db.kicked_user('a')
+    connect(db, 'b', 'c')
+    record = db.evicted['a'][0]
+    # the row in the database does not have the kick yet
+    assert stored_user(db, 'a')[5] == 0
+    assert db.get_user('a') is record
+    assert record.times_kicked == 1
+    assert 'a' not in db.evicted
+    db.kicked_user('a')
+    db.save_alldata()
+    assert stored_user(db, 'a')[5] == 2
+
+
+def test_offline_lookups(db):
+    connect(db, 'a', 'b', 'c')
+    db.save_alldata()
+    db.writer.submit(lambda conn: None).result()
+    db.evicted.clear()
+    assert 'a' not in db.user_data
+    db.banned_user('a')
+    assert db.user_data['a'].times_banned == 1
+    db.banned_user('nobody')
+    assert db.get_user('nobody') is None
+    assert 'nobody' not in db.user_data
+
+
+def test_lookup_while_loading_counts_connection_once(db):
+    async def run():
+        db.connect_data('a', 'hdid')
+        db.connect_data('a', 'hdid')
+        record = db.get_user('a')
+        assert record.times_connected == 1
+        assert not db.loading
+        await asyncio.sleep(0.05)
+        return record
+    record = asyncio.run(run())
+    assert db.user_data['a'] is record
+    assert record.times_connected == 1
+
+
+def test_save_writes_only_changed_rows(db):
+    db.save_alldata()
+    batches = []
+    write = db.writer.write
+    db.writer.write = lambda generation, batch: (batches.append(batch), write(generation, batch))
+    db.save_alldata()
+    assert batches == []
+    db.character_picked(1)
+    db.char_talked(1, 'nobody', database.CASING)
+    db.save_alldata()
+    assert batches == [[('INSERT OR REPLACE INTO character VALUES (?,?,?,?,?,?)', [(1, 'miles', 1, 0, 0, 1)])]]
+    assert not db.dirty_chars
+    db.writer.submit(lambda conn: None).result()
+    assert db.conn.execute('SELECT * FROM character WHERE id = 1').fetchone() == (1, 'miles', 1, 0, 0, 1)
+    assert db.writer.written == db.generation
+
+
+@pytest.mark.parametrize('cls, row', [
+    (database.charData, (3, 'phoenix', 4, 1, 2, 3)),
+    (database.musicData, (7, 'trial', 1, 2, 3)),
+    (database.userData, ('ipid', 5, 1, 2, 3, 4, 5, 6, 7, 8)),
+])
+def test_record_round_trips_through_row(cls, row):
+    record = cls.from_row(row)
+    assert record.row() == row
+    assert not hasattr(record, '__dict__')
+
+
+def test_records_are_counted_per_status_bucket():
+    char = database.charData.from_row((0, 'Phoenix', 0, 0, 0, 0))
+    assert char.name == 'phoenix'
+    char.times_talked[database.STATUS_BUCKETS['RECESS']] += 1
+    char.times_talked[database.STATUS_BUCKETS['CASING-FULL']] += 2
+    assert char.row() == (0, 'phoenix', 0, 0, 1, 2)
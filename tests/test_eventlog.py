@@ -0,0 +1,82 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sqlite3
+import time
+
+import pytest
+
+from server.eventlog import parse_query, search_events, prune_events, format_event
+from server.exceptions import ArgumentError
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE event (time REAL NOT NULL, kind TEXT NOT NULL, area INTEGER NOT NULL, '
+                  'ipid TEXT NOT NULL, hdid TEXT NOT NULL, char TEXT NOT NULL, name TEXT NOT NULL, '
+                  'message TEXT NOT NULL);')
+    conn.executemany('INSERT INTO event VALUES (?,?,?,?,?,?,?,?)', [
+        (100, 'IC', 0, 'aaa', 'h1', 'Phoenix', 'p', 'objection'),
+        (200, 'OOC', 0, 'aaa', 'h1', 'Phoenix', 'p', 'hello there'),
+        (300, 'IC', 1, 'bbb', 'h2', 'Miles', 'm', 'hold it'),
+        (400, 'MOD', 1, 'bbb', 'h2', 'Miles', 'm', '/kick aaa'),
+    ])
+    yield conn
+    conn.close()
+
+
+def test_parse_query():
+    query = parse_query('type=ic ipid=aaa area=3 char=Phoenix "text=take that" limit=500')
+    assert query == {'kind': 'IC', 'ipid': 'aaa', 'area': 3, 'char': 'Phoenix', 'text': 'take that',
+                     'limit': 100}
+    assert parse_query('') == {'limit': 20}
+    assert parse_query('limit=0')['limit'] == 1
+    assert time.time() - 2 * 3600 - 1 < parse_query('last=2h')['since'] <= time.time() - 2 * 3600
+
+
+@pytest.mark.parametrize('text', ['type=foo', 'area=x', 'last=2y', 'last=h', 'colour=red', 'ipid', 'ipid=',
+                                  'text="unbalanced'])
+def test_parse_query_rejects(text):
+    with pytest.raises(ArgumentError):
+        parse_query(text)
+
+
+def messages(rows):
+    return [row[7] for row in rows]
+
+
+def test_search_events(conn):
+    assert messages(search_events(conn, parse_query(''))) == ['objection', 'hello there', 'hold it', '/kick aaa']
+    assert messages(search_events(conn, parse_query('type=ic'))) == ['objection', 'hold it']
+    assert messages(search_events(conn, parse_query('ipid=bbb area=1 type=mod'))) == ['/kick aaa']
+    assert messages(search_events(conn, parse_query('char=phoenix text=there'))) == ['hello there']
+    assert messages(search_events(conn, {'since': 250, 'limit': 20})) == ['hold it', '/kick aaa']
+    # the newest events, oldest first
+    assert messages(search_events(conn, parse_query('limit=2'))) == ['hold it', '/kick aaa']
+
+
+def test_prune_events(conn):
+    prune_events(conn, 150, 0)
+    assert messages(search_events(conn, parse_query(''))) == ['hello there', 'hold it', '/kick aaa']
+    prune_events(conn, None, 2)
+    assert messages(search_events(conn, parse_query(''))) == ['hold it', '/kick aaa']
+
+
+def test_format_event(conn):
+    row = search_events(conn, parse_query('type=mod'))[0]
+    assert format_event(row) == '[1970-01-01 00:06:40][1][MOD][bbb][Miles]/kick aaa'
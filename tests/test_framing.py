@@ -0,0 +1,62 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from server.aoprotocol import AOProtocol
+
+
+def feed(protocol, data):
+    protocol.buffer.extend(data)
+    return list(protocol.get_messages())
+
+
+def test_pipelined_messages():
+    protocol = AOProtocol(None)
+    assert feed(protocol, b'HI#abc#%ID#AO2#2.4#%CH#0#%') == ['HI#abc', 'ID#AO2#2.4', 'CH#0']
+    assert protocol.buffer == b''
+
+
+def test_partial_message_is_kept():
+    protocol = AOProtocol(None)
+    assert feed(protocol, b'CT#name#hel') == []
+    assert feed(protocol, b'lo#%CT#') == ['CT#name#hello']
+    assert protocol.buffer == b'CT#'
+
+
+def test_terminator_split_across_reads():
+    protocol = AOProtocol(None)
+    assert feed(protocol, b'CH#0#') == []
+    assert feed(protocol, b'%') == ['CH#0']
+    assert protocol.buffer == b''
+
+
+def test_multibyte_character_split_across_reads():
+    protocol = AOProtocol(None)
+    data = 'CT#n#ü#%'.encode('utf-8')
+    assert feed(protocol, data[:6]) == []
+    assert feed(protocol, data[6:]) == ['CT#n#ü']
+
+
+def test_invalid_utf8_is_ignored():
+    protocol = AOProtocol(None)
+    assert feed(protocol, b'CT#n#a\xffb#%') == ['CT#n#ab']
+
+
+def test_askchar2_without_terminator():
+    protocol = AOProtocol(None)
+    assert feed(protocol, AOProtocol.askchar2) == [AOProtocol.askchar2.decode()]
+    assert protocol.buffer == b''
+    assert protocol.scan_offset == 0
@@ -0,0 +1,95 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+
+import pytest
+
+from server.identity_manager import IdentityManager
+from tests.fakes import FakeBanManager, FakeServer
+
+IPID_A = 'aaaaaaaaaaaa'
+IPID_B = 'bbbbbbbbbbbb'
+IPID_C = 'cccccccccccc'
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'storage').mkdir()
+    server = FakeServer()
+    server.ban_manager = FakeBanManager()
+    return server
+
+
+def test_banned_ipid_bans_its_hdids(server):
+    identities = IdentityManager(server)
+    identities.link('hd1', IPID_A)
+    identities.link('hd1', IPID_B)
+    assert not identities.is_banned('hd1')
+    server.ban_manager.add_ban(IPID_B)
+    assert identities.is_banned('hd1')
+    server.ban_manager.remove_ban(None, IPID_B)
+    assert not identities.is_banned('hd1')
+
+
+def test_link_to_banned_ipid(server):
+    server.ban_manager.add_ban(IPID_A)
+    identities = IdentityManager(server)
+    identities.link('hd1', IPID_A)
+    assert identities.is_banned('hd1')
+    # linking the same pair again does not count the ban twice
+    identities.link('hd1', IPID_A)
+    server.ban_manager.remove_ban(None, IPID_A)
+    assert not identities.is_banned('hd1')
+
+
+def test_bans_do_not_spread_through_shared_ipids(server):
+    identities = IdentityManager(server)
+    # hd1 and hd2 share IPID_B, as players behind one address would
+    identities.link('hd1', IPID_A)
+    identities.link('hd1', IPID_B)
+    identities.link('hd2', IPID_B)
+    identities.link('hd2', IPID_C)
+    server.ban_manager.add_ban(IPID_A)
+    assert identities.is_banned('hd1')
+    assert not identities.is_banned('hd2')
+
+
+def test_unknown_hdid_is_not_banned(server):
+    assert not IdentityManager(server).is_banned('nobody')
+
+
+def test_links_survive_a_restart(server):
+    identities = IdentityManager(server)
+    identities.link('hd1', IPID_A)
+    identities.close()
+    server.ban_manager.add_ban(IPID_A)
+    identities = IdentityManager(server)
+    assert identities.is_banned('hd1')
+    identities.close()
+
+
+def test_legacy_json_is_imported_once(server, tmp_path):
+    with open('storage/hd_ids.json', 'w') as f:
+        json.dump({'hd1': [IPID_A]}, f)
+    server.ban_manager.add_ban(IPID_A)
+    identities = IdentityManager(server)
+    assert identities.is_banned('hd1')
+    assert not (tmp_path / 'storage' / 'hd_ids.json').exists()
+    assert (tmp_path / 'storage' / 'hd_ids.json.migrated').exists()
+    identities.close()
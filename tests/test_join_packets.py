@@ -0,0 +1,109 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from server.aoprotocol import AOProtocol
+from server.area_manager import AreaManager
+from server.tsuserver import TsuServer3
+from tests.fakes import FakeClient
+
+CHARACTERS = ['Phoenix', 'Miles', 'Maya Fey', 'Gumshoe', 'Édgeworth'] + ['Witness {}'.format(i) for i in range(20)]
+
+AREAS = '''
+- area: Basement
+  background: gs4
+  bglock: false
+  basement: true
+- area: Courtroom 1
+  background: gs4
+  bglock: false
+  basement: false
+'''
+
+MUSIC = '''
+- category: ==Music==
+  songs:
+    - name: Trial(AJ).mp3
+      length: 120
+    - name: Prelude(AJ).mp3
+- category: ==Jingles==
+  songs:
+''' + ''.join('    - name: Jingle {}.mp3\n'.format(i) for i in range(12))
+
+
+@pytest.fixture
+def protocol(tmp_path, monkeypatch, old_yaml_load):
+    monkeypatch.chdir(tmp_path)
+    config = tmp_path / 'config'
+    config.mkdir()
+    (config / 'areas.yaml').write_text(AREAS)
+    (config / 'music.yaml').write_text(MUSIC)
+    (config / 'characters.yaml').write_text(''.join('- {}\n'.format(name) for name in CHARACTERS),
+                                            encoding='utf-8')
+    # only the lists and their packets, without the rest of the server
+    server = TsuServer3.__new__(TsuServer3)
+    server.char_list = None
+    server.music_pages_ao1 = None
+    server.area_manager = AreaManager(server)
+    server.load_characters()
+    server.load_music()
+    protocol = AOProtocol(server)
+    protocol.client = FakeClient()
+    return protocol
+
+
+def old_command(command, *args):
+    """ What Client.send_command wrote before the join packets were prebuilt. """
+    return '{}#{}#%'.format(command, '#'.join([str(x) for x in args])).encode('utf-8')
+
+
+def sent(protocol, handler, *args):
+    protocol.client.packets = []
+    handler(protocol, list(args))
+    return [packet.raw for packet in protocol.client.packets]
+
+
+def test_lists_match_old_packets(protocol):
+    server = protocol.server
+    assert sent(protocol, AOProtocol.net_cmd_rc) == [old_command('SC', *server.char_list)]
+    assert sent(protocol, AOProtocol.net_cmd_rm) == [old_command('SM', *server.music_list_ao2)]
+    music_cnt = sum([len(x) for x in server.music_pages_ao1])
+    assert sent(protocol, AOProtocol.net_cmd_askchaa) == [old_command('SI', len(server.char_list), 0, music_cnt)]
+    assert server.char_list_packet.raw.startswith('SC#Phoenix#Miles#Maya Fey#Gumshoe#Édgeworth#'.encode('utf-8'))
+
+
+def test_pages_match_old_packets(protocol):
+    server = protocol.server
+    assert len(server.char_pages_ao1) == 3
+    assert len(server.music_pages_ao1) == 2
+    assert sent(protocol, AOProtocol.net_cmd_askchar2) == [old_command('CI', *server.char_pages_ao1[0])]
+    for page in range(3):
+        assert sent(protocol, AOProtocol.net_cmd_an, page) == [old_command('CI', *server.char_pages_ao1[page])]
+    # past the last character page, the music list starts
+    assert sent(protocol, AOProtocol.net_cmd_an, 3) == [old_command('EM', *server.music_pages_ao1[0])]
+    for page in range(2):
+        assert sent(protocol, AOProtocol.net_cmd_am, page) == [old_command('EM', *server.music_pages_ao1[page])]
+
+
+def test_packets_follow_reloaded_lists(protocol, tmp_path):
+    (tmp_path / 'config' / 'characters.yaml').write_text('- Phoenix\n- Franziska\n')
+    protocol.server.load_characters()
+    assert sent(protocol, AOProtocol.net_cmd_rc) == [b'SC#Phoenix#Franziska#%']
+    assert sent(protocol, AOProtocol.net_cmd_askchar2) == [b'CI#0#Phoenix&&0&&&0&#1#Franziska&&0&&&0&#%']
+    music_cnt = sum([len(x) for x in protocol.server.music_pages_ao1])
+    assert sent(protocol, AOProtocol.net_cmd_askchaa) == [old_command('SI', 2, 0, music_cnt)]
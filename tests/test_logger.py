@@ -0,0 +1,87 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import queue
+import threading
+import time
+
+import pytest
+
+from server import logger
+
+
+class BlockingHandler(logging.Handler):
+    """ Holds up the log writer on its first record until released. """
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.started = threading.Event()
+        self.unblock = threading.Event()
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+        self.started.set()
+        self.unblock.wait(5)
+
+    def flush_batch(self):
+        pass
+
+
+@pytest.fixture
+def log_setup(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'logs').mkdir()
+    logger.setup_logger(debug=True, log_size=0, log_backups=0, queue_size=2)
+    handler = BlockingHandler()
+    logger.add_logger('test', logging.INFO, handler)
+    yield handler
+    handler.unblock.set()
+    for name in logger.log_writer.routes:
+        logging.getLogger(name).removeHandler(logger.queue_handler)
+    logger.stop_logger()
+
+
+def test_dropping_queue_handler_drops_when_full():
+    handler = logger.DroppingQueueHandler(queue.Queue(2))
+    log = logging.getLogger('test.dropping')
+    for i in range(5):
+        handler.handle(log.makeRecord(log.name, logging.INFO, __file__, 0, 'record %d', (i,), None))
+    assert handler.dropped == 3
+    assert handler.queue.qsize() == 2
+    # records with arguments are formatted before they are queued
+    assert handler.queue.get().msg == 'record 0'
+
+
+def test_log_stats_count_queued_written_and_dropped(log_setup):
+    log = logging.getLogger('test')
+    log.info('first')
+    assert log_setup.started.wait(5)
+    for i in range(3):
+        log.info('queued %d', i)
+    assert logger.get_log_stats() == {'depth': 2, 'size': 2, 'dropped': 1, 'written': 1}
+    log_setup.unblock.set()
+    deadline = time.time() + 5
+    while logger.get_log_stats()['written'] < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    assert logger.get_log_stats() == {'depth': 0, 'size': 2, 'dropped': 1, 'written': 3}
+    assert log_setup.records == ['first', 'queued 0', 'queued 1']
+
+
+def test_log_stats_without_logger():
+    assert logger.get_log_stats() == {'depth': 0, 'size': 0, 'dropped': 0, 'written': 0}
@@ -0,0 +1,129 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from server.area_manager import AreaManager
+from server.exceptions import AreaError, ServerError
+from server.tsuserver import TsuServer3
+
+AREAS = '''
+- area: Basement
+  background: gs4
+  bglock: false
+  basement: true
+- area: Courtroom 1
+  background: gs4
+  bglock: false
+  basement: false
+- area: courtroom 1
+  background: gs4
+  bglock: false
+  basement: false
+'''
+
+MUSIC = '''
+- category: ==Music==
+  songs:
+    - name: Trial(AJ).mp3
+      length: 120
+    - name: Prelude(AJ).mp3
+- category: ==More==
+  songs:
+    - name: trial(aj).MP3
+      length: 5
+    - name: 1999
+'''
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch, old_yaml_load):
+    monkeypatch.chdir(tmp_path)
+    config = tmp_path / 'config'
+    config.mkdir()
+    (config / 'areas.yaml').write_text(AREAS)
+    (config / 'music.yaml').write_text(MUSIC)
+    (config / 'characters.yaml').write_text('- Phoenix\n- Miles\n- phoenix\n')
+    (config / 'backgrounds.yaml').write_text('- gs4\n- DGSJapanCourt\n')
+    # only the lists and their lookups, without the rest of the server
+    server = TsuServer3.__new__(TsuServer3)
+    server.char_list = None
+    server.music_pages_ao1 = None
+    server.area_manager = AreaManager(server)
+    server.load_characters()
+    server.load_music()
+    server.load_backgrounds()
+    return server
+
+
+def test_area_by_name_ignores_case(server):
+    areas = server.area_manager
+    assert areas.get_area_by_name('BASEMENT') is areas.areas[0]
+    # the first of two areas with the same name wins, as in the old scan
+    assert areas.get_area_by_name('courtroom 1') is areas.areas[1]
+    with pytest.raises(AreaError):
+        areas.get_area_by_name('Lobby')
+
+
+def test_area_by_id(server):
+    areas = server.area_manager
+    assert areas.get_area_by_id(2) is areas.areas[2]
+    with pytest.raises(AreaError):
+        areas.get_area_by_id(3)
+    with pytest.raises(AreaError):
+        areas.get_area_by_id('1')
+
+
+def test_song_data(server):
+    assert server.get_song_data('TRIAL(AJ).mp3') == ('Trial(AJ).mp3', 120)
+    assert server.get_song_data('Prelude(AJ).mp3') == ('Prelude(AJ).mp3', -1)
+    assert server.get_song_data('==more==') == ('==More==', -1)
+    assert server.get_song_data('1999') == (1999, -1)
+    assert server.song_index['prelude(aj).mp3'][2] == '==Music=='
+    with pytest.raises(ServerError):
+        server.get_song_data('missing.mp3')
+
+
+def test_char_id_by_name(server):
+    assert server.get_char_id_by_name('MILES') == 1
+    assert server.get_char_id_by_name('phoenix') == 0
+    with pytest.raises(ServerError):
+        server.get_char_id_by_name('Maya')
+
+
+def test_background(server):
+    assert server.get_background('dgsjapancourt') == 'DGSJapanCourt'
+    assert server.get_background('gs5') is None
+
+
+def test_change_background(server):
+    area = server.area_manager.areas[0]
+    area.send_command = lambda *args: None
+    area.change_background('GS4')
+    assert area.background == 'GS4'
+    with pytest.raises(AreaError):
+        area.change_background('gs5')
+
+
+def test_reload_replaces_indexes(server, tmp_path):
+    old_index = server.song_index
+    (tmp_path / 'config' / 'music.yaml').write_text('- category: ==New==\n  songs:\n    - name: New.mp3\n')
+    server.load_music()
+    assert server.song_index is not old_index
+    assert server.get_song_data('new.mp3') == ('New.mp3', -1)
+    with pytest.raises(ServerError):
+        server.get_song_data('Trial(AJ).mp3')
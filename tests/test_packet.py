@@ -0,0 +1,69 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import zlib
+
+from server.area_manager import AreaManager
+from server.packet import Packet, encode_command
+from server.websocket import make_frame
+from tests.fakes import FakeArea, FakeClient
+
+
+def test_encode_command():
+    assert encode_command('CT', ('name', 'hi', 3)) == b'CT#name#hi#3#%'
+    assert encode_command('askchaa', ()) == b'askchaa#%'
+    assert encode_command('CT', ('ü',)) == 'CT#ü#%'.encode('utf-8')
+
+
+def test_packet_frames_are_built_once():
+    packet = Packet('CT', 'name', 'hello')
+    assert packet.raw == b'CT#name#hello#%'
+    assert packet.frame == make_frame(packet.raw)
+    assert packet.frame is packet.frame
+    assert packet.deflated_frame is packet.deflated_frame
+
+
+def test_deflated_frame_inflates_to_raw():
+    packet = Packet('CT', 'name', 'x' * 300)
+    frame = packet.deflated_frame
+    # FIN, RSV1 and the text opcode
+    assert frame[0] == 0xc1
+    length = frame[1]
+    offset = 2
+    if length == 126:
+        length = int.from_bytes(frame[2:4], 'big')
+        offset = 4
+    payload = frame[offset:offset + length]
+    assert zlib.decompressobj(-15).decompress(payload + b'\x00\x00\xff\xff') == packet.raw
+
+
+def test_prebuild_matches_lazy_frames():
+    packet = Packet('SC', 'Phoenix', 'Miles').prebuild()
+    lazy = Packet('SC', 'Phoenix', 'Miles')
+    assert packet.frame == lazy.frame
+    assert packet.deflated_frame == lazy.deflated_frame
+
+
+def test_send_ms_shares_packets_per_evidence_id():
+    same = [FakeClient(), FakeClient()]
+    other = FakeClient(evidence={5: 2})
+    area = FakeArea(clients=same + [other])
+    args = ('chat', '-', 'Miles', 'normal', 'hi', 'def', '0', 0, 1, 0, 0, 5, 0, 0, 0)
+    AreaManager.Area.send_ms(area, args)
+    assert same[0].packets[0] is same[1].packets[0]
+    assert same[0].packets[0].raw.split(b'#')[12] == b'5'
+    assert other.packets[0].raw.split(b'#')[12] == b'2'
@@ -0,0 +1,126 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+
+import pytest
+import yaml
+
+from server import serverpoll_manager
+from server.serverpoll_manager import POLL_JOURNAL, ServerpollManager
+from tests.fakes import FakeServer
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch, old_yaml_load):
+    monkeypatch.chdir(tmp_path)
+    return FakeServer(poll_slots=5)
+
+
+def journal_entries():
+    with open(POLL_JOURNAL, encoding='utf-8') as journal:
+        return [json.loads(line) for line in journal]
+
+
+def test_changes_are_journaled(server):
+    polls = ServerpollManager(server)
+    polls.add_poll('Best court')
+    polls.polldetail('best court', 'Pick one')
+    entries = journal_entries()
+    assert [entry['op'] for entry in entries] == ['create', 'set']
+    assert [entry['seq'] for entry in entries] == [1, 2]
+    stem, poll = polls.get_poll('Best court')
+    assert poll['polldetail'] == 'Pick one'
+    polls.close()
+
+
+def test_journal_is_replayed_after_a_crash(server):
+    polls = ServerpollManager(server)
+    polls.add_poll('Best court')
+    polls.polldetail('Best court', 'Pick one')
+    stem = polls.get_poll('Best court')[0]
+    # no close(), as if the server had crashed
+    polls.journal.close()
+    assert not os.path.exists('storage/poll/{}.yaml'.format(stem))
+
+    polls = ServerpollManager(server)
+    assert polls.get_poll('Best court')[1]['polldetail'] == 'Pick one'
+    # the replay was written back and the journal removed
+    assert os.path.exists('storage/poll/{}.yaml'.format(stem))
+    assert journal_entries() == []
+    polls.close()
+
+
+def test_replay_applies_each_entry_once(server):
+    polls = ServerpollManager(server)
+    polls.add_poll('Best court')
+    stem = polls.get_poll('Best court')[0]
+    polls.record(stem, 'vote', choice='yes', entry=['time', 'ipid', 'hdid', 'yes'])
+    with open(POLL_JOURNAL, encoding='utf-8') as journal:
+        lines = journal.read()
+    polls.close()
+    # the snapshot was written, but its journal came back, as after a
+    # crash between writing the poll file and removing the journal
+    with open(POLL_JOURNAL, 'w', encoding='utf-8') as journal:
+        journal.write(lines)
+
+    polls = ServerpollManager(server)
+    poll = polls.get_poll('Best court')[1]
+    assert poll['votes']['yes'] == 1
+    assert len(poll['log']) == 1
+    polls.close()
+
+
+def test_truncated_journal_line_is_ignored(server):
+    polls = ServerpollManager(server)
+    polls.add_poll('Best court')
+    polls.journal.write('{"seq": 2, "po')
+    polls.journal.close()
+
+    polls = ServerpollManager(server)
+    assert polls.get_poll('Best court') is not None
+    polls.close()
+
+
+def test_snapshot_writes_changed_polls(server):
+    polls = ServerpollManager(server)
+    polls.add_poll('Best court')
+    stem = polls.get_poll('Best court')[0]
+    polls.snapshot()
+    polls.snapshot_future.result()
+    with open('storage/poll/{}.yaml'.format(stem)) as poll_file:
+        saved = yaml.load(poll_file, Loader=yaml.Loader)
+    assert saved['name'] == 'Best court'
+    assert saved['seq'] == 1
+    assert not os.path.exists(serverpoll_manager.POLL_JOURNAL_OLD)
+    assert journal_entries() == []
+    # the snapshot timer was set again
+    assert polls in server.timers.timers
+    polls.close()
+
+
+def test_snapshot_drops_removed_polls(server):
+    polls = ServerpollManager(server)
+    polls.add_poll('Best court')
+    stem = polls.get_poll('Best court')[0]
+    polls.remove_poll('Best court')
+    polls.snapshot()
+    polls.snapshot_future.result()
+    assert stem not in polls.polls
+    assert stem not in polls.voters
+    polls.close()
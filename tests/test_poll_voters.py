@@ -0,0 +1,97 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from server.database import userData
+from server.serverpoll_manager import ServerpollManager, VoterIndex
+from tests.fakes import FakeBanManager, FakeClient, FakeServer
+
+
+class FakeStats:
+    def get_user(self, ipid):
+        return userData(ipid)
+
+    def user_voted(self, ipid):
+        pass
+
+
+@pytest.fixture
+def polls(tmp_path, monkeypatch, old_yaml_load):
+    monkeypatch.chdir(tmp_path)
+    server = FakeServer(poll_slots=5)
+    server.stats_manager = FakeStats()
+    server.ban_manager = FakeBanManager()
+    polls = ServerpollManager(server)
+    polls.add_poll('Best court')
+    yield polls
+    polls.close()
+
+
+def test_index_from_log():
+    voters = VoterIndex([['time', 'ip1', 'hd1', 'Yes'], ['time', 'ip2', 'hd2', 'no']])
+    assert voters.ipids == {'ip1', 'ip2'}
+    assert voters.hdids == {'hd1', 'hd2'}
+    assert voters.chose('ip1', None, 'yes')
+    assert not voters.chose('ip1', None, 'no')
+    assert voters.chose('ip3', 'hd2', 'NO')
+    assert not voters.chose('ip3', None, 'no')
+
+
+def test_second_vote_fails(polls):
+    first = FakeClient(polls.server, ipid='ip1', hdid='hd1')
+    polls.add_vote('Best court', 'yes', first)
+    polls.add_vote('Best court', 'no', first)
+    poll = polls.get_poll('Best court')[1]
+    assert poll['votes'] == {'yes': 1, 'no': 0}
+    assert len(poll['faillog']) == 1
+    assert first.messages[-1] == 'You have already voted in this poll.'
+
+
+def test_same_hdid_on_another_ipid_fails(polls):
+    polls.add_vote('Best court', 'yes', FakeClient(polls.server, ipid='ip1', hdid='hd1'))
+    alt = FakeClient(polls.server, ipid='ip2', hdid='hd1')
+    polls.add_vote('Best court', 'yes', alt)
+    assert polls.get_poll('Best court')[1]['votes']['yes'] == 1
+    assert alt.messages[-1] == 'You have already voted in this poll.'
+
+
+def test_exempt_hdid_is_not_checked(polls):
+    polls.server.ban_manager.hdid_exempt = {'shared': True}
+    polls.add_vote('Best court', 'yes', FakeClient(polls.server, ipid='ip1', hdid='shared'))
+    polls.add_vote('Best court', 'no', FakeClient(polls.server, ipid='ip2', hdid='shared'))
+    assert polls.get_poll('Best court')[1]['votes'] == {'yes': 1, 'no': 1}
+
+
+def test_multivote_allows_each_choice_once(polls):
+    polls.make_multipoll('Best court')
+    voter = FakeClient(polls.server, ipid='ip1', hdid='hd1')
+    polls.add_vote('Best court', 'yes', voter)
+    polls.add_vote('Best court', 'no', voter)
+    polls.add_vote('Best court', 'Yes', voter)
+    assert polls.get_poll('Best court')[1]['votes'] == {'yes': 1, 'no': 1}
+    assert voter.messages[-1] == 'You have chosen this choice already.'
+
+
+def test_index_is_rebuilt_on_load(polls):
+    polls.add_vote('Best court', 'yes', FakeClient(polls.server, ipid='ip1', hdid='hd1'))
+    polls.close()
+    reloaded = ServerpollManager(polls.server)
+    voter = FakeClient(polls.server, ipid='ip1', hdid='hd2')
+    reloaded.add_vote('Best court', 'no', voter)
+    assert voter.messages[-1] == 'You have already voted in this poll.'
+    reloaded.close()
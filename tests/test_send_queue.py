@@ -0,0 +1,80 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from server.client_manager import ClientManager
+from server.packet import Packet
+from tests.fakes import FakeServer, FakeTransport
+
+
+def make_client(max_queue=262144):
+    server = FakeServer()
+    server.config['send_queue']['max_queue'] = max_queue
+    manager = server.client_manager = ClientManager(server)
+    # flushed by hand instead of from the event loop
+    manager.schedule_flush = lambda client: None
+    transport = FakeTransport()
+    return manager.new_client(transport), transport
+
+
+def test_writes_are_corked_until_flush():
+    client, transport = make_client()
+    client.send_packet(Packet('BN', 'gs4'))
+    client.send_packet(Packet('HP', 1, 5))
+    assert transport.written == []
+    client.flush()
+    assert transport.written == [b'BN#gs4#%', b'HP#1#5#%']
+
+
+def test_paused_writes_are_queued_and_resumed():
+    client, transport = make_client()
+    client.pause_writing()
+    client.send_packet(Packet('BN', 'gs4'))
+    assert transport.written == []
+    client.resume_writing()
+    assert transport.written == [b'BN#gs4#%']
+
+
+def test_corked_packets_stay_droppable():
+    client, transport = make_client()
+    client.send_packet(Packet('CT', 'name', 'chat'))
+    client.send_packet(Packet('BN', 'gs4'))
+    client.pause_writing()
+    client.flush()
+    assert client.send_queue == [(b'CT#name#chat#%', True), (b'BN#gs4#%', False)]
+
+
+def test_shedding_drops_droppable_packets_first():
+    client, transport = make_client(max_queue=40)
+    client.pause_writing()
+    client.send_packet(Packet('BN', 'gs4'))
+    for _ in range(3):
+        client.send_packet(Packet('CT', 'name', 'chat'))
+    # the third CT goes over the limit, and every queued CT is dropped
+    assert client.send_queue == [(b'BN#gs4#%', False)]
+    assert client.queued_bytes == len(b'BN#gs4#%')
+    assert client.server.client_manager.net_stats['dropped'] == 3
+    assert not transport.aborted
+
+
+def test_overfull_queue_disconnects():
+    client, transport = make_client(max_queue=20)
+    client.pause_writing()
+    for _ in range(3):
+        client.send_packet(Packet('BN', 'gs4'))
+    assert transport.aborted
+    assert client.send_queue == []
+    assert client.server.client_manager.net_stats['evicted'] == 1
@@ -0,0 +1,142 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from server.timing_wheel import TimingWheel
+
+
+class FakeLoop:
+    """ Loop with a clock that only moves when told to; callbacks passed
+    to call_soon run right away.
+    """
+
+    def __init__(self):
+        self.now = 100.0
+        self.next_advance = None
+
+    def time(self):
+        return self.now
+
+    def call_later(self, delay, callback):
+        return self.call_at(self.now + delay, callback)
+
+    def call_at(self, when, callback):
+        self.next_advance = (when, callback)
+        return self
+
+    def call_soon(self, callback, *args):
+        callback(*args)
+
+    def cancel(self):
+        self.next_advance = None
+
+    def run_until(self, when):
+        while self.next_advance is not None and self.next_advance[0] <= when:
+            self.now, callback = self.next_advance
+            callback()
+        self.now = when
+
+
+def make_wheel(slots=8):
+    loop = FakeLoop()
+    wheel = TimingWheel(resolution=1.0, slots=slots)
+    wheel.start(loop)
+    return wheel, loop
+
+
+def test_timer_fires_after_delay():
+    wheel, loop = make_wheel()
+    fired = []
+    wheel.schedule('a', 3, fired.append, 'a')
+    loop.run_until(102.5)
+    assert fired == []
+    loop.run_until(103)
+    assert fired == ['a']
+    assert 'a' not in wheel
+
+
+def test_reschedule_replaces_timer():
+    wheel, loop = make_wheel()
+    fired = []
+    wheel.schedule('a', 2, fired.append, 1)
+    wheel.schedule('a', 5, fired.append, 2)
+    assert len(wheel) == 1
+    loop.run_until(104)
+    assert fired == []
+    loop.run_until(105)
+    assert fired == [2]
+
+
+def test_cancel():
+    wheel, loop = make_wheel()
+    fired = []
+    wheel.schedule('a', 2, fired.append, 1)
+    wheel.cancel('a')
+    wheel.cancel('missing')
+    loop.run_until(110)
+    assert fired == []
+    assert len(wheel) == 0
+
+
+def test_delay_longer_than_the_wheel():
+    wheel, loop = make_wheel(slots=4)
+    fired = []
+    wheel.schedule('a', 10, fired.append, 'a')
+    # the slot comes round at 2 and 6 before the timer is due
+    loop.run_until(109)
+    assert fired == []
+    loop.run_until(110)
+    assert fired == ['a']
+
+
+def test_short_delay_waits_one_tick():
+    wheel, loop = make_wheel()
+    fired = []
+    wheel.schedule('a', 0, fired.append, 'a')
+    loop.run_until(101)
+    assert fired == ['a']
+
+
+def test_catches_up_after_a_blocked_loop():
+    wheel, loop = make_wheel()
+    fired = []
+    for delay in (1, 2, 3):
+        wheel.schedule(delay, delay, fired.append, delay)
+    # nothing ran for three ticks, then the wheel advances once
+    when, callback = loop.next_advance
+    loop.now = 103.5
+    loop.next_advance = None
+    callback()
+    assert sorted(fired) == [1, 2, 3]
+
+
+def test_callback_can_reschedule_itself():
+    wheel, loop = make_wheel()
+    fired = []
+
+    def tick():
+        fired.append(loop.time())
+        wheel.schedule('tick', 2, tick)
+
+    wheel.schedule('tick', 2, tick)
+    loop.run_until(106)
+    assert fired == [102, 104, 106]
+
+
+def test_stop():
+    wheel, loop = make_wheel()
+    wheel.stop()
+    assert loop.next_advance is None
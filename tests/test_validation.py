@@ -0,0 +1,71 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from server.aoprotocol import AOProtocol, ArgType, compile_schema
+from tests.fakes import FakeClient
+
+
+def test_argument_count():
+    validate = compile_schema(ArgType.STR, ArgType.STR)
+    assert validate(FakeClient(), ['a', 'b'])
+    assert not validate(FakeClient(), ['a'])
+    assert not validate(FakeClient(), ['a', 'b', 'c'])
+
+
+def test_empty_strings():
+    validate = compile_schema(ArgType.STR, ArgType.STR_OR_EMPTY)
+    assert validate(FakeClient(), ['a', ''])
+    assert not validate(FakeClient(), ['', 'b'])
+
+
+def test_integers_are_converted_in_place():
+    validate = compile_schema(ArgType.INT, ArgType.UINT)
+    args = ['-3', '4']
+    assert validate(FakeClient(), args)
+    assert args == [-3, 4]
+    assert not validate(FakeClient(), ['x', '4'])
+    assert not validate(FakeClient(), ['1', '-4'])
+
+
+def test_allowed_values():
+    validate = compile_schema((ArgType.STR, ('testimony1', 'testimony2')), (ArgType.INT, (0, 1)))
+    assert validate(FakeClient(), ['testimony1', '1'])
+    assert not validate(FakeClient(), ['testimony3', '1'])
+    assert not validate(FakeClient(), ['testimony1', '2'])
+
+
+def test_needs_auth():
+    assert not compile_schema(ArgType.STR)(FakeClient(char_id=-1), ['a'])
+    assert compile_schema(ArgType.STR, needs_auth=False)(FakeClient(char_id=-1), ['a'])
+
+
+def test_guarded_kick_is_validated():
+    protocol = AOProtocol(None)
+    protocol.client = FakeClient(char_id=-1)
+    # a client that has not picked a character fails the CT schema, so
+    # nothing past validation may run
+    protocol.net_cmd_opKICK(['target'])
+    assert protocol.client.name == 'opkick'
+    assert protocol.client.messages == []
+
+
+def test_ct_mute_message_comes_before_validation():
+    protocol = AOProtocol(None)
+    protocol.client = FakeClient(char_id=-1, muted=True)
+    protocol.net_cmd_ct(['name'])
+    assert protocol.client.name == 'name'
+    assert protocol.client.messages == ['You have been muted by a moderator']
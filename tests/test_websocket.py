@@ -0,0 +1,151 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import struct
+import zlib
+
+from server.client_manager import ClientManager
+from server.packet import Packet
+from server.websocket import WebSocket, deflate
+from tests.fakes import FakeClient, FakeServer, FakeTransport
+
+KEY = 'dGhlIHNhbXBsZSBub25jZQ=='
+DEFLATE = {'enabled': True, 'threshold': 16, 'context_takeover': False}
+
+
+def websocket_client(deflate_config=None):
+    return FakeClient(FakeServer(websocket_deflate=deflate_config or DEFLATE))
+
+
+def request(extensions=None):
+    head = 'GET / HTTP/1.1\r\nHost: x\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n' \
+           'Sec-WebSocket-Key: {}\r\n'.format(KEY)
+    if extensions is not None:
+        head += 'Sec-WebSocket-Extensions: {}\r\n'.format(extensions)
+    return (head + 'Sec-WebSocket-Version: 13\r\n\r\n').encode()
+
+
+def client_frame(payload, opcode=0x1, fin=True, compressed=False):
+    mask = os.urandom(4)
+    b1 = (0x80 if fin else 0) | (0x40 if compressed else 0) | opcode
+    if len(payload) < 126:
+        header = struct.pack('!BB', b1, 0x80 | len(payload))
+    else:
+        header = struct.pack('!BBH', b1, 0x80 | 126, len(payload))
+    return header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+
+def connect(extensions=None, deflate_config=None):
+    client = websocket_client(deflate_config)
+    websocket = WebSocket(client, None)
+    assert websocket.handshake(request(extensions))
+    response = client.transport.written[0].decode()
+    return websocket, response
+
+
+def test_handshake_without_extensions():
+    websocket, response = connect()
+    assert response.startswith('HTTP/1.1 101')
+    assert 's3pPLMBiTxaQ9kYGzzhZRbK+xOo=' in response
+    assert 'Sec-WebSocket-Extensions' not in response
+    assert not websocket.deflate
+
+
+def test_handshake_with_empty_offers():
+    websocket, response = connect('permessage-deflate, , ')
+    assert 'Sec-WebSocket-Extensions: permessage-deflate; server_no_context_takeover' in response
+    assert websocket.deflate
+    websocket, response = connect('')
+    assert not websocket.deflate
+
+
+def test_unsupported_offer_is_skipped():
+    websocket, response = connect('permessage-deflate; unknown_param, permessage-deflate; server_max_window_bits=10')
+    assert 'server_max_window_bits=10' in response
+    assert websocket.deflate_wbits == 10
+
+
+def test_missing_upgrade_is_not_a_websocket():
+    websocket = WebSocket(websocket_client(), None)
+    assert not websocket.handshake(b'HI#hdid#%')
+
+
+def test_frames_split_across_reads():
+    websocket, _ = connect()
+    data = client_frame(b'HI#a#%') + client_frame(b'ID#b#%')
+    assert websocket.parse(data[:5]) == b''
+    assert websocket.parse(data[5:]) == b'HI#a#%ID#b#%'
+
+
+def test_fragmented_message():
+    websocket, _ = connect()
+    data = client_frame(b'CT#na', fin=False) + client_frame(b'me#hi#%', opcode=0x0)
+    assert websocket.parse(data) == b'CT#name#hi#%'
+
+
+def test_ping_is_answered_between_fragments():
+    websocket, _ = connect()
+    data = client_frame(b'CT#', fin=False) + client_frame(b'p', opcode=0x9) + client_frame(b'n#m#%', opcode=0x0)
+    assert websocket.parse(data) == b'CT#n#m#%'
+    assert websocket.client.written == [b'\x8a\x01p']
+
+
+def test_continuation_without_start_closes():
+    websocket, _ = connect()
+    websocket.parse(client_frame(b'x', opcode=0x0))
+    assert websocket.client.disconnected
+
+
+def test_compressed_message_is_inflated():
+    websocket, _ = connect('permessage-deflate')
+    message = b'MS#chat#' + b'x' * 200 + b'#%'
+    assert websocket.parse(client_frame(deflate(message), compressed=True)) == message
+
+
+def test_compressed_frame_without_deflate_closes():
+    websocket, _ = connect()
+    websocket.parse(client_frame(deflate(b'CT#a#b#%'), compressed=True))
+    assert websocket.client.disconnected
+
+
+def test_shared_deflated_frame_without_context_takeover():
+    websocket, _ = connect('permessage-deflate')
+    packet = Packet('CT', 'name', 'x' * 100)
+    assert websocket.packet_frame(packet) is packet.deflated_frame
+    small = Packet('CH', 0)
+    assert websocket.packet_frame(small) is small.frame
+
+
+def test_context_takeover_frames_inflate_in_order():
+    websocket, _ = connect('permessage-deflate', {'enabled': True, 'threshold': 16, 'context_takeover': True})
+    inflater = zlib.decompressobj(-15)
+    for text in (b'CT#name#' + b'y' * 50 + b'#%', b'CT#name#' + b'y' * 50 + b'#%'):
+        frame = websocket.packet_frame(Packet('CT', 'name', 'y' * 50))
+        assert frame[0] == 0xc1
+        assert inflater.decompress(frame[2:] + b'\x00\x00\xff\xff') == text
+
+
+def test_stateful_frames_are_never_droppable():
+    server = FakeServer(websocket_deflate={'enabled': True, 'threshold': 16, 'context_takeover': True})
+    manager = server.client_manager = ClientManager(server)
+    manager.schedule_flush = lambda client: None
+    client = manager.new_client(FakeTransport())
+    client.websocket = WebSocket(client, None)
+    assert client.websocket.handshake(request('permessage-deflate'))
+    client.send_packet(Packet('CT', 'name', 'z' * 50))
+    assert client.send_buffer[0][1] is False